@@ -10,6 +10,7 @@ $ python -m multiqc .
 
 from __future__ import print_function
 import click
+import multiprocessing
 import pkg_resources
 from . import multiqc
 from .utils import config
@@ -33,7 +34,16 @@ def modify_usage_error(main_command):
     click.exceptions.UsageError.show = show
 
 
-if __name__ == "__main__" or __name__ == 'multiqc.__main__':
+def importing_main_in_worker():
+    """ Is this module being imported by a new worker process, which is
+    setting itself up by importing the main script of the parent process
+    (the multiqc console script)? multiprocessing sets _inheriting while it
+    does this, with the spawn and forkserver start methods. """
+    return getattr(multiprocessing.current_process(), '_inheriting', False)
+
+
+def run_multiqc():
+    """ Run MultiQC from the command line """
     # Add any extra plugin command line options
     for entry_point in pkg_resources.iter_entry_points('multiqc.cli_options.v1'):
         opt_func = entry_point.load()
@@ -42,3 +52,9 @@ if __name__ == "__main__" or __name__ == 'multiqc.__main__':
     modify_usage_error(multiqc.run_cli)
     # Call the main function
     multiqc.run_cli(prog_name='multiqc')
+
+
+# The multiqc console script runs MultiQC by importing this module,
+# but worker processes parsing files mustn't run it again
+if __name__ == "__main__" or (__name__ == 'multiqc.__main__' and not importing_main_in_worker()):
+    run_multiqc()
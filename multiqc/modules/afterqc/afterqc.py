@@ -5,7 +5,6 @@
 from __future__ import print_function
 from collections import OrderedDict
 import logging
-import json
 
 from multiqc import config
 from multiqc.plots import bargraph
@@ -28,7 +27,7 @@ class MultiqcModule(BaseMultiqcModule):
 
         # Find and load any Afterqc reports
         self.afterqc_data = dict()
-        for f in self.find_log_files('afterqc', filehandles=True):
+        for f in self.find_log_files('afterqc', filejson=True):
             self.parse_afterqc_log(f)
 
         # Filter to strip out ignored sample names
@@ -55,11 +54,7 @@ class MultiqcModule(BaseMultiqcModule):
 
     def parse_afterqc_log(self, f):
         """ Parse the JSON output from AfterQC and save the summary statistics """
-        try:
-            parsed_json = json.load(f['f'])
-        except:
-            log.warning("Could not parse AfterQC JSON: '{}'".format(f['fn']))
-            return None
+        parsed_json = f['f']
 
         # AfterQC changed the name of their summary key at some point
         if 'summary' in parsed_json:
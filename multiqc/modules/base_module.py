@@ -4,6 +4,7 @@
 
 from __future__ import print_function
 from collections import OrderedDict
+from functools import lru_cache
 import io
 import fnmatch
 import logging
@@ -13,9 +14,12 @@ import os
 import re
 import textwrap
 
-from multiqc.utils import report, config, util_functions
+from multiqc.utils import report, config, util_functions, partial, watch
 logger = logging.getLogger(__name__)
 
+# Number of cleaned sample names to remember for each module
+CLEAN_S_NAME_CACHE_SIZE = 65536
+
 class BaseMultiqcModule(object):
 
     def __init__(self, name='base', anchor='base', target=None, href=None, info=None, comment=None, extra=None,
@@ -62,17 +66,25 @@ class BaseMultiqcModule(object):
 
         self.sections = list()
 
-    def find_log_files(self, sp_key, filecontents=True, filehandles=False):
+    def find_log_files(self, sp_key, filecontents=True, filehandles=False, filejson=False, filemapped=False):
         """
         Return matches log files of interest.
         :param sp_key: Search pattern key specified in config
         :param filehandles: Set to true to return a file handle instead of slurped file contents
+        :param filemapped: Set to true to return a read-only memory-mapped view of the file
+                           (util_functions.MappedFile) instead of slurped file contents
+        :param filejson: Set to true to return the parsed contents of a JSON file. Files are
+                         parsed concurrently in worker processes (config.json_processes)
         :return: Yields a dict with filename (fn), root directory (root), cleaned sample name
                  generated from the filename (s_name) and either the file contents or file handle
                  for the current matched file (f).
                  As yield is used, the results can be iterated over without loading all files at once
         """
 
+        # Note the search keys used by this module, so that watch mode knows which files it depends on
+        if config.watch:
+            watch.search_keys.add(sp_key if isinstance(sp_key, str) else None)
+
         # Pick up path filters if specified.
         # Allows modules to be called multiple times with different sets of files
         path_filters = getattr(self, 'mod_cust_config', {}).get('path_filters')
@@ -84,6 +96,7 @@ class BaseMultiqcModule(object):
             for sf in report.searchfiles:
                 if report.search_file(sp_key, {'fn': sf[0], 'root': sf[1]}, module_key=None):
                     report.files[self.name].append({'fn': sf[0], 'root': sf[1]})
+            report.path_filter_index.pop(self.name, None)
             sp_key = self.name
             logwarn = "Depreciation Warning: {} - Please use new style for find_log_files()".format(self.name)
             if len(report.files[self.name]) > 0:
@@ -94,29 +107,42 @@ class BaseMultiqcModule(object):
             logger.warning("Did not understand find_log_files() search key")
             return
 
-        for f in report.files[sp_key]:
-            # Make a note of the filename so that we can report it if something crashes
-            report.last_found_file = os.path.join(f['root'], f['fn'])
-
-            # Filter out files based on exclusion patterns
-            if path_filters_exclude and len(path_filters_exclude) > 0:
-                exlusion_hits = (fnmatch.fnmatch(report.last_found_file, pfe) for pfe in path_filters_exclude)
-                if any(exlusion_hits):
-                    logger.debug("{} - Skipping '{}' as it matched the path_filters_exclude for '{}'".format(sp_key, f['fn'], self.name))
+        # Only look at the files which pass the module path filters
+        files = report.path_filtered_files(sp_key, path_filters, path_filters_exclude)
+        if filejson:
+            paths = [os.path.join(f['root'], f['fn']) for f in files]
+            for f, (data, error, read_error) in zip(files, util_functions.load_json_files(paths, config.json_processes)):
+                report.last_found_file = os.path.join(f['root'], f['fn'])
+                f['s_name'] = self.file_s_name(f)
+                if read_error:
+                    if config.report_readerrors:
+                        logger.debug("Couldn't open filehandle when returning file: {}\n{}".format(f['fn'], error))
                     continue
-
-            # Filter out files based on inclusion patterns
-            if path_filters and len(path_filters) > 0:
-                inclusion_hits = (fnmatch.fnmatch(report.last_found_file, pf) for pf in path_filters)
-                if not any(inclusion_hits):
-                    logger.debug("{} - Skipping '{}' as it didn't match the path_filters for '{}'".format(sp_key, f['fn'], self.name))
+                if error is not None:
+                    logger.warning("Could not parse JSON file '{}': {}".format(f['fn'], error))
                     continue
-                else:
-                    logger.debug("{} - Selecting '{}' as it matched the path_filters for '{}'".format(sp_key, f['fn'], self.name))
+                f['f'] = data
+                yield f
+                # Don't keep the parsed data alive in the report file list
+                f.pop('f', None)
+            return
+
+        for f in files:
+            # Make a note of the filename so that we can report it if something crashes
+            report.last_found_file = os.path.join(f['root'], f['fn'])
 
             # Make a sample name from the filename
-            f['s_name'] = self.clean_s_name(f['fn'], f['root'])
-            if filehandles or filecontents:
+            f['s_name'] = self.file_s_name(f)
+            if filemapped:
+                try:
+                    with util_functions.MappedFile(os.path.join(f['root'], f['fn'])) as mf:
+                        f['f'] = mf
+                        yield f
+                except (IOError, OSError, ValueError) as e:
+                    if config.report_readerrors:
+                        logger.debug("Couldn't map file when returning file: {}\n{}".format(f['fn'], e))
+                        f['f'] = None
+            elif filehandles or filecontents:
                 try:
                     # Custom content module can now handle image files
                     (ftype, encoding) = mimetypes.guess_type(os.path.join(f['root'], f['fn']))
@@ -127,14 +153,16 @@ class BaseMultiqcModule(object):
                             yield f
                     else:
                         # Everything else - should be all text files
-                        with io.open (os.path.join(f['root'],f['fn']), "r", encoding='utf-8') as fh:
+                        with util_functions.open_log_file(os.path.join(f['root'],f['fn'])) as fh:
+                            if util_functions.compression_type(f['fn']) is not None:
+                                fh = util_functions.CompressedFileHandle(fh, f['fn'])
                             if filehandles:
                                 f['f'] = fh
                                 yield f
                             elif filecontents:
                                 f['f'] = fh.read()
                                 yield f
-                except (IOError, OSError, ValueError, UnicodeDecodeError) as e:
+                except (IOError, OSError, ValueError, UnicodeDecodeError) + util_functions.DECOMPRESSION_ERRORS as e:
                     if config.report_readerrors:
                         logger.debug("Couldn't open filehandle when returning file: {}\n{}".format(f['fn'], e))
                         f['f'] = None
@@ -190,7 +218,7 @@ class BaseMultiqcModule(object):
         comment = comment.strip()
         helptext = helptext.strip()
 
-        self.sections.append({
+        section = {
             'name': name,
             'anchor': anchor,
             'description': description,
@@ -199,19 +227,44 @@ class BaseMultiqcModule(object):
             'plot': plot,
             'content': content,
             'print_section': any([ n is not None and len(n) > 0 for n in [description, comment, helptext, plot, content] ])
-        })
+        }
+        # Keep the plot inputs for partial runs, so that it can be merged with other runs
+        if config.partial_file:
+            section['partial_plot'] = partial.section_plot_call(plot)
+        self.sections.append(section)
+
+    def file_s_name(self, f):
+        """ Sample name for a found file: the name given for it in a
+        manifest, or else the cleaned file name. With config.search_compressed,
+        the compression extension is removed first. """
+        if 'sample' in f:
+            return report.samples.intern(f['sample'])
+        fn = f['fn']
+        if config.search_compressed:
+            fn = util_functions.strip_compression_ext(fn)
+        return self.clean_s_name(fn, f['root'])
 
     def clean_s_name(self, s_name, root):
         """ Helper function to take a long file name and strip it
         back to a clean sample name. Somewhat arbitrary.
+        Results are cached, as the same names are often cleaned many times.
         :param s_name: The sample name to clean
         :param root: The directory path that this file is within
         :config.prepend_dirs: boolean, whether to prepend dir name to s_name
         :return: The cleaned sample name, ready to be used
         """
-        s_name_original = s_name
         if root is None:
             root = ''
+        try:
+            cached_clean_s_name = self._cached_clean_s_name
+        except AttributeError:
+            cached_clean_s_name = lru_cache(maxsize=CLEAN_S_NAME_CACHE_SIZE)(self._clean_s_name)
+            self._cached_clean_s_name = cached_clean_s_name
+        return cached_clean_s_name(s_name, root)
+
+    def _clean_s_name(self, s_name, root):
+        """ Uncached sample name cleaning, see clean_s_name() """
+        s_name_original = s_name
 
         # if s_name comes from file contents, it may have a file path
         # For consistency with other modules, we keep just the basename
@@ -219,33 +272,8 @@ class BaseMultiqcModule(object):
 
         if config.fn_clean_sample_names:
             # Split then take first section to remove everything after these matches
-            for ext in config.fn_clean_exts:
-                # Check if this config is limited to a module
-                if 'module' in ext:
-                    if type(ext['module']) is str:
-                        ext['module'] = [ext['module']]
-                    if not any([m == self.anchor for m in ext['module']]):
-                        continue
-
-                # Go through different filter types
-                if type(ext) is str:
-                    ext = {'type': 'truncate', 'pattern': ext}
-                if ext.get('type') == 'truncate':
-                    s_name = s_name.split(ext['pattern'], 1)[0]
-                elif ext.get('type') in ('remove', 'replace'):
-                    if ext['type'] == 'replace':
-                        logger.warning("use 'config.fn_clean_sample_names.remove' instead "
-                                       "of 'config.fn_clean_sample_names.replace' [deprecated]")
-                    s_name = s_name.replace(ext['pattern'], '')
-                elif ext.get('type') == 'regex':
-                    s_name = re.sub(ext['pattern'], '', s_name)
-                elif ext.get('type') == 'regex_keep':
-                    match = re.search(ext['pattern'], s_name)
-                    s_name = match.group() if match else s_name
-                elif ext.get('type') is None:
-                    logger.error('config.fn_clean_exts config was missing "type" key: {}'.format(ext))
-                else:
-                    logger.error('Unrecognised config.fn_clean_exts type: {}'.format(ext.get('type')))
+            for clean_fn in self._clean_s_name_rules():
+                s_name = clean_fn(s_name)
             # Trim off characters at the end of names
             for chrs in config.fn_clean_trim:
                 if s_name.endswith(chrs):
@@ -272,29 +300,119 @@ class BaseMultiqcModule(object):
         if s_name == '':
             s_name = s_name_original
 
-        return s_name
+        # Share one copy of each name across all modules
+        return report.samples.intern(s_name)
+
+    def _clean_s_name_rules(self):
+        """ Compile config.fn_clean_exts into a list of functions that
+        apply to this module. Built once per module, on first use. """
+        try:
+            return self._compiled_clean_s_name_rules
+        except AttributeError:
+            pass
+
+        def truncate(pattern):
+            return lambda s_name: s_name.split(pattern, 1)[0]
+        def remove(pattern):
+            return lambda s_name: s_name.replace(pattern, '')
+        def regex(pattern):
+            return lambda s_name: pattern.sub('', s_name)
+        def regex_keep(pattern):
+            def keep(s_name):
+                match = pattern.search(s_name)
+                return match.group() if match else s_name
+            return keep
+
+        rules = []
+        for ext in config.fn_clean_exts:
+            if type(ext) is str:
+                ext = {'type': 'truncate', 'pattern': ext}
+            # Check if this config is limited to a module
+            if 'module' in ext:
+                if type(ext['module']) is str:
+                    ext['module'] = [ext['module']]
+                if not any([m == self.anchor for m in ext['module']]):
+                    continue
+
+            # Go through different filter types
+            if ext.get('type') == 'truncate':
+                rules.append(truncate(ext['pattern']))
+            elif ext.get('type') in ('remove', 'replace'):
+                if ext['type'] == 'replace':
+                    logger.warning("use 'config.fn_clean_sample_names.remove' instead "
+                                   "of 'config.fn_clean_sample_names.replace' [deprecated]")
+                rules.append(remove(ext['pattern']))
+            elif ext.get('type') == 'regex':
+                rules.append(regex(re.compile(ext['pattern'])))
+            elif ext.get('type') == 'regex_keep':
+                rules.append(regex_keep(re.compile(ext['pattern'])))
+            elif ext.get('type') is None:
+                logger.error('config.fn_clean_exts config was missing "type" key: {}'.format(ext))
+            else:
+                logger.error('Unrecognised config.fn_clean_exts type: {}'.format(ext.get('type')))
+
+        self._compiled_clean_s_name_rules = rules
+        return rules
 
     def ignore_samples(self, data):
         """ Strip out samples which match `sample_names_ignore` """
         try:
             if isinstance(data, OrderedDict):
-                newdata = OrderedDict()
+                dict_type = OrderedDict
             elif isinstance(data, dict):
-                newdata = dict()
+                dict_type = dict
             else:
                 return data
-            for s_name,v in data.items():
-                if not self.is_ignore_sample(s_name):
-                    newdata[s_name] = v
-            return newdata
+            if self._ignore_samples_matcher() is None:
+                return dict_type(data)
+            return dict_type((s_name, v) for s_name, v in data.items() if not self.is_ignore_sample(s_name))
         except (TypeError, AttributeError):
             return data
 
+    def ignore_samples_multi(self, *datasets):
+        """ Strip out samples which match `sample_names_ignore` from several
+        dicts, using the same compiled patterns
+        :return: A list of the filtered dicts, in the order given
+        """
+        return [self.ignore_samples(d) for d in datasets]
+
     def is_ignore_sample(self, s_name):
         """ Should a sample name be ignored? """
-        glob_match = any( fnmatch.fnmatch(s_name, sn) for sn in config.sample_names_ignore )
-        re_match = any( re.match(sn, s_name) for sn in config.sample_names_ignore_re )
-        return glob_match or re_match
+        matcher = self._ignore_samples_matcher()
+        if matcher is None:
+            return False
+        try:
+            return self._ignored_samples[s_name]
+        except KeyError:
+            ignore = any(m(s_name) is not None for m in matcher)
+            self._ignored_samples[s_name] = ignore
+            return ignore
+
+    def _ignore_samples_matcher(self):
+        """ Compile config.sample_names_ignore (globs) and config.sample_names_ignore_re
+        (regexes) into a single regex. Returns a list of match functions, or None if
+        there are no patterns. Built once per module, on first use. """
+        try:
+            return self._compiled_ignore_samples
+        except AttributeError:
+            pass
+        self._ignored_samples = dict()
+        patterns = [fnmatch.translate(sn) for sn in config.sample_names_ignore]
+        patterns.extend(config.sample_names_ignore_re)
+        if len(patterns) == 0:
+            self._compiled_ignore_samples = None
+            return None
+        # Regexes with back-references or inline flags can't be merged, so keep them separate
+        matcher = None
+        if not any(re.search(r'\\[1-9]|\(\?P=|\(\?[aiLmsux]', p) for p in config.sample_names_ignore_re):
+            try:
+                matcher = [re.compile('|'.join('(?:{})'.format(p) for p in patterns)).match]
+            except re.error:
+                pass
+        if matcher is None:
+            matcher = [re.compile(p).match for p in patterns]
+        self._compiled_ignore_samples = matcher
+        return matcher
 
     def general_stats_addcols(self, data, headers=None, namespace=None):
         """ Helper function to add to the General Statistics variable.
@@ -332,9 +450,8 @@ class BaseMultiqcModule(object):
             if 'description' not in headers[k]:
                 headers[k]['description'] = headers[k].get('title', k)
 
-        # Append to report.general_stats for later assembly into table
-        report.general_stats_data.append(data)
-        report.general_stats_headers.append(headers)
+        # Add to the columnar report.general_stats_data for later assembly into table
+        report.general_stats_data.add_section(data, headers)
 
     def add_data_source(self, f=None, s_name=None, source=None, module=None, section=None):
         try:
@@ -346,7 +463,7 @@ class BaseMultiqcModule(object):
                 s_name = f['s_name']
             if source is None:
                 source = os.path.abspath(os.path.join(f['root'], f['fn']))
-            report.data_sources[module][section][s_name] = source
+            report.data_sources[module][section][report.samples.intern(s_name)] = source
         except AttributeError:
             logger.warning('Tried to add data source for {}, but was missing fields data'.format(self.name))
 
@@ -369,6 +486,7 @@ class BaseMultiqcModule(object):
 
         # Save the file
         report.saved_raw_data[fn] = data
+        partial.data_file_options[fn] = (sort_cols, data_format)
         util_functions.write_data_file(data, fn, sort_cols, data_format)
 
     ##################################################
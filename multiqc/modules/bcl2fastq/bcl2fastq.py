@@ -1,13 +1,13 @@
-import json
 import logging
 import operator
 import os
-from collections import OrderedDict, defaultdict
+from collections import OrderedDict
 from itertools import islice
 
 from multiqc import config
 from multiqc.plots import bargraph, table
 from multiqc.modules.base_module import BaseMultiqcModule
+from multiqc.utils.top_counts import TopCounts
 
 log = logging.getLogger(__name__)
 
@@ -24,7 +24,7 @@ class MultiqcModule(BaseMultiqcModule):
 
         # Gather data from all json files
         self.bcl2fastq_data = dict()
-        for myfile in self.find_log_files('bcl2fastq'):
+        for myfile in self.find_log_files('bcl2fastq', filejson=True):
             self.parse_file_as_json(myfile)
 
         # Collect counts by lane and sample (+source_files)
@@ -35,9 +35,8 @@ class MultiqcModule(BaseMultiqcModule):
         self.split_data_by_lane_and_sample()
 
         # Filter to strip out ignored sample names
-        self.bcl2fastq_bylane = self.ignore_samples(self.bcl2fastq_bylane)
-        self.bcl2fastq_bysample = self.ignore_samples(self.bcl2fastq_bysample)
-        self.bcl2fastq_bysample_lane = self.ignore_samples(self.bcl2fastq_bysample_lane)
+        self.bcl2fastq_bylane, self.bcl2fastq_bysample, self.bcl2fastq_bysample_lane = self.ignore_samples_multi(
+            self.bcl2fastq_bylane, self.bcl2fastq_bysample, self.bcl2fastq_bysample_lane)
 
         # Return with Warning if no files are found
         if len(self.bcl2fastq_bylane) == 0 and len(self.bcl2fastq_bysample) == 0:
@@ -140,11 +139,7 @@ class MultiqcModule(BaseMultiqcModule):
         )
 
     def parse_file_as_json(self, myfile):
-        try:
-            content = json.loads(myfile["f"])
-        except ValueError:
-            log.warning('Could not parse file as json: {}'.format(myfile["fn"]))
-            return
+        content = myfile["f"]
         runId = content["RunId"]
         if runId not in self.bcl2fastq_data:
             self.bcl2fastq_data[runId] = dict()
@@ -171,7 +166,7 @@ class MultiqcModule(BaseMultiqcModule):
                 if lane_data["Lane"] == l:
                     unknown_barcode = lane_data["Barcodes"]
                     break
-            run_data[lane]["unknown_barcodes"] = unknown_barcode
+            run_data[lane]["unknown_barcodes"] = self.get_unknown_barcodes(unknown_barcode)
 
             for demuxResult in conversionResult.get("DemuxResults", []):
                 if demuxResult["SampleName"] == demuxResult["SampleId"]:
@@ -279,7 +274,7 @@ class MultiqcModule(BaseMultiqcModule):
                     "percent_Q30": lane["percent_Q30"],
                     "percent_perfectIndex": lane["percent_perfectIndex"],
                     "mean_qscore": lane["mean_qscore"],
-                    "unknown_barcodes": self.get_unknown_barcodes(lane['unknown_barcodes']),
+                    "unknown_barcodes": lane['unknown_barcodes'],
                 }
                 for sample_id, sample in lane["samples"].items():
                     if sample_id not in self.bcl2fastq_bysample:
@@ -495,21 +490,21 @@ class MultiqcModule(BaseMultiqcModule):
     def get_bar_data_from_undetermined(self, flowcells):
         """ Get data to plot for undetermined barcodes.
         """
-        bar_data = defaultdict(dict)
-        # get undetermined barcodes for each lanes
+        # get top undetermined barcodes for each lane, and sum them across lanes
+        lane_barcodes = OrderedDict()
+        barcode_totals = TopCounts()
         for lane_id, lane in flowcells.items():
             try:
-                for barcode, count in islice(lane['unknown_barcodes'].items(), 20):
-                    bar_data[barcode][lane_id] = count
+                lane_barcodes[lane_id] = OrderedDict(islice(lane['unknown_barcodes'].items(), 20))
             except AttributeError:
-                pass
+                continue
+            barcode_totals.update(lane_barcodes[lane_id])
 
-        # sort results
-        bar_data = OrderedDict(sorted(
-            bar_data.items(),
-            key=lambda x: sum(x[1].values()),
-            reverse=True
-        ))
-        return OrderedDict(
-            (key, value) for key, value in islice(bar_data.items(), 20)
-        )
+        # pick out lane counts for the top barcodes overall
+        bar_data = OrderedDict()
+        for barcode, total in barcode_totals.most_common(20):
+            bar_data[barcode] = dict()
+            for lane_id, barcodes in lane_barcodes.items():
+                if barcode in barcodes:
+                    bar_data[barcode][lane_id] = barcodes[barcode]
+        return bar_data
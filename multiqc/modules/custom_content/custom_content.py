@@ -9,6 +9,7 @@ import logging
 import json
 import os
 import re
+import types
 import yaml
 
 from multiqc import config
@@ -21,17 +22,139 @@ log = logging.getLogger(__name__)
 
 # Load YAML as an ordered dict
 # From https://stackoverflow.com/a/21912744
+class OrderedLoader(yaml.SafeLoader):
+    pass
+def _construct_ordered_mapping(loader, node):
+    loader.flatten_mapping(node)
+    return OrderedDict(loader.construct_pairs(node))
+OrderedLoader.add_constructor(
+    yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
+    _construct_ordered_mapping)
+
 def yaml_ordered_load(stream):
-    class OrderedLoader(yaml.SafeLoader):
-        pass
-    def construct_mapping(loader, node):
-        loader.flatten_mapping(node)
-        return OrderedDict(loader.construct_pairs(node))
-    OrderedLoader.add_constructor(
-        yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
-        construct_mapping)
     return yaml.load(stream, OrderedLoader)
 
+def yaml_ordered_stream(stream):
+    """
+    Incrementally load a YAML mapping. Yields (key, value) tuples for each
+    top-level key. If the value for 'data' is a mapping, it is not loaded
+    in one go - instead the value is a generator yielding (sample, data)
+    tuples, one sample at a time. Memory usage is then limited to the size
+    of the parsed result instead of the whole document tree.
+    """
+    loader = OrderedLoader(stream)
+    try:
+        loader.get_event() # StreamStart
+        loader.get_event() # DocumentStart
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise ValueError("Top level of YAML document is not a mapping")
+        loader.get_event()
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = loader.construct_document(loader.compose_node(None, None))
+            if key == 'data' and loader.check_event(yaml.MappingStartEvent):
+                data = _yaml_stream_mapping(loader)
+                yield key, data
+                # Make sure that we're past the data, even if the caller stopped early
+                for _ in data:
+                    pass
+            else:
+                yield key, loader.construct_document(loader.compose_node(None, None))
+    finally:
+        loader.dispose()
+
+def _yaml_stream_mapping(loader):
+    loader.get_event() # MappingStart
+    while not loader.check_event(yaml.MappingEndEvent):
+        key = loader.construct_document(loader.compose_node(None, None))
+        value = loader.construct_document(loader.compose_node(None, None))
+        yield key, value
+    loader.get_event() # MappingEnd
+
+def json_ordered_stream(fh, chunk_size=1048576):
+    """
+    Incrementally load a JSON object from a filehandle. Works in the same
+    way as yaml_ordered_stream(): yields (key, value) tuples for each top-level
+    key, with a generator of (sample, data) tuples for a 'data' object.
+    """
+    reader = _JSONStreamReader(fh, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == 'data' and reader.peek() == '{':
+            data = reader.iter_object()
+            yield key, data
+            # Make sure that we're past the data, even if the caller stopped early
+            for _ in data:
+                pass
+        else:
+            yield key, reader.value()
+        if reader.expect(',}') == '}':
+            return
+
+class _JSONStreamReader(object):
+    """ Buffered JSON tokeniser, decoding one value at a time with raw_decode() """
+
+    def __init__(self, fh, chunk_size):
+        self.fh = fh
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder(object_pairs_hook=OrderedDict)
+
+    def _fill(self):
+        """ Read more data. Grows the chunk size for values bigger than the buffer """
+        chunk = self.fh.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos+1]
+            self._fill()
+
+    def expect(self, chars):
+        c = self.peek()
+        if c == '' or c not in chars:
+            raise ValueError("Expected '{}' but found '{}' in JSON".format(chars, c))
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+            else:
+                # A number could continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            self._fill()
+
+    def iter_object(self):
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key, self.value()
+            if self.expect(',}') == '}':
+                return
+
 def custom_module_classes():
     """
     MultiQC Custom Content class. This module does a lot of different
@@ -84,17 +207,34 @@ def custom_module_classes():
 
     # Now go through each of the file search patterns
     bm = BaseMultiqcModule()
+    stream_min_filesize = getattr(config, 'custom_content', {}).get('stream_min_filesize')
     for k in search_patterns:
         num_sp_found_files = 0
-        for f in bm.find_log_files(k):
+        for f in bm.find_log_files(k, filehandles=True):
             num_sp_found_files += 1
             # Handle any exception without messing up for remaining custom content files
             try:
                 f_extension = os.path.splitext(f['fn'])[1]
 
+                # Large YAML and JSON files are parsed one sample at a time
+                stream_file = (
+                    f_extension in ['.yaml', '.yml', '.json'] and
+                    stream_min_filesize is not None and
+                    f.get('filesize', 0) >= stream_min_filesize
+                )
+                if not stream_file and f_extension not in ['.png', '.jpeg', '.jpg']:
+                    f['f'] = f['f'].read()
+
                 # YAML and JSON files are the easiest
                 parsed_data = None
-                if f_extension == '.yaml' or f_extension == '.yml':
+                if stream_file:
+                    try:
+                        parsed_data = _stream_data_file(f, f_extension, bm)
+                    except Exception as e:
+                        log.warning("Error parsing file '{}' (probably invalid {})".format(f['fn'], f_extension[1:].upper()))
+                        log.debug("Parsing error: {}".format(e), exc_info=True)
+                        break
+                elif f_extension == '.yaml' or f_extension == '.yml':
                     try:
                         parsed_data = yaml_ordered_load(f['f'])
                     except Exception as e:
@@ -135,7 +275,7 @@ def custom_module_classes():
                 if parsed_data is not None:
                     c_id = parsed_data.get('id', k)
                     if len(parsed_data.get('data', {})) > 0:
-                        if type(parsed_data['data']) == str:
+                        if type(parsed_data['data']) == str or len(cust_mods[c_id]['data']) == 0:
                             cust_mods[c_id]['data'] = parsed_data['data']
                         else:
                             cust_mods[c_id]['data'].update( parsed_data['data'] )
@@ -404,6 +544,29 @@ class MultiqcModule(BaseMultiqcModule):
         )
 
 
+def _stream_data_file(f, f_extension, bm):
+    """
+    Parse a large custom content YAML / JSON file from a filehandle.
+    Sample names are cleaned and ignored samples dropped as they are read,
+    so that the whole file never needs to be held in memory.
+    """
+    if f_extension == '.json':
+        pairs = json_ordered_stream(f['f'])
+    else:
+        pairs = yaml_ordered_stream(f['f'])
+    parsed_data = OrderedDict()
+    for key, value in pairs:
+        if key == 'data' and isinstance(value, types.GeneratorType):
+            parsed_data['data'] = OrderedDict()
+            for s_name, d in value:
+                s_name = bm.clean_s_name(s_name, f['root'])
+                if not bm.is_ignore_sample(s_name):
+                    parsed_data['data'][s_name] = d
+        else:
+            parsed_data[key] = value
+    parsed_data['id'] = parsed_data.get('id', f['s_name'])
+    return parsed_data
+
 def _find_file_header(f):
     # Collect commented out header lines
     hlines = []
@@ -5,7 +5,6 @@
 from __future__ import print_function
 from collections import OrderedDict
 import logging
-import json
 
 from multiqc import config
 from multiqc.plots import bargraph, linegraph
@@ -39,7 +38,7 @@ class MultiqcModule(BaseMultiqcModule):
             self.fastp_gc_content_data[k] = dict()
             self.fastp_n_content_data[k] = dict()
 
-        for f in self.find_log_files('fastp', filehandles=True):
+        for f in self.find_log_files('fastp', filejson=True):
             self.parse_fastp_log(f)
 
         # Filter to strip out ignored sample names
@@ -138,11 +137,7 @@ class MultiqcModule(BaseMultiqcModule):
 
     def parse_fastp_log(self, f):
         """ Parse the JSON output from fastp and save the summary statistics """
-        try:
-            parsed_json = json.load(f['f'])
-        except:
-            log.warning("Could not parse fastp JSON: '{}'".format(f['fn']))
-            return None
+        parsed_json = f['f']
 
         # Fetch a sample name from the command
         s_name = f['s_name']
@@ -5,6 +5,7 @@ https://github.com/brentp/goleft/tree/master/indexcov
 from __future__ import print_function
 import collections
 import logging
+import numpy as np
 
 from multiqc import config
 from multiqc.plots import linegraph, scatter
@@ -19,14 +20,15 @@ class MultiqcModule(BaseMultiqcModule):
                                             href='https://github.com/brentp/goleft/tree/master/indexcov',
                                             info="quickly estimates coverage from a whole-genome bam index.")
 
-        # Parse ROC data
-        self.roc_plot_data = collections.defaultdict(lambda: collections.defaultdict(dict))
+        # Parse ROC data into matrices. Ignored sample names are filtered out while parsing.
+        self.roc_matrices = collections.defaultdict(list)
         for f in self.find_log_files('goleft_indexcov/roc', filehandles=True):
             self.parse_roc_plot_data(f)
-        # Filter to strip out ignored sample names
+        # Line graph data for each chromosome: sample name, then {coverage: value}
+        self.roc_plot_data = collections.OrderedDict()
         num_roc_samples = 0
-        for chrom in self.roc_plot_data:
-            self.roc_plot_data[chrom] = self.ignore_samples(self.roc_plot_data[chrom])
+        for chrom in self.roc_matrices:
+            self.roc_plot_data[chrom] = self.roc_chrom_plot_data(chrom)
             num_roc_samples = max(len(self.roc_plot_data[chrom]), num_roc_samples)
 
         # Parse BIN data
@@ -70,17 +72,69 @@ class MultiqcModule(BaseMultiqcModule):
             return chrom_clean
 
     def parse_roc_plot_data(self, f):
+        """ Read a ROC file into a matrix of values per chromosome, with a row
+        for each scaled coverage and a column for each sample. Each chromosome in
+        roc_matrices gets a (sample names, coverages, values, present) tuple, where
+        present marks which values were in the file, or is None if no rows were short. """
 
         header = f['f'].readline()
         sample_names = [self.clean_s_name(x, f["root"]) for x in header.strip().split()[2:]]
-        for parts in (l.rstrip().split() for l in f['f']):
-            if len(parts) > 2:
-                chrom, cov = parts[:2]
-                sample_vals = parts[2:]
-                if self._short_chrom(chrom) is not None:
-                    for val, sample in zip(sample_vals, sample_names):
-                        if not self.is_ignore_sample(sample):
-                            self.roc_plot_data[chrom][sample][float(cov)] = float(val)
+        keep = np.array([i for i, s in enumerate(sample_names) if not self.is_ignore_sample(s)], dtype=int)
+        if len(keep) == 0:
+            return
+
+        # Group the rows by chromosome, leaving the sample values as strings
+        chrom_rows = collections.OrderedDict()
+        plot_chrom = dict()
+        for l in f['f']:
+            parts = l.split(None, 2)
+            if len(parts) < 3:
+                continue
+            chrom, cov, vals = parts
+            if chrom not in plot_chrom:
+                plot_chrom[chrom] = self._short_chrom(chrom) is not None
+            if plot_chrom[chrom]:
+                chrom_rows.setdefault(chrom, ([], []))
+                chrom_rows[chrom][0].append(float(cov))
+                chrom_rows[chrom][1].append(vals)
+
+        # Parse the sample values for each chromosome into one matrix
+        num_samples = len(sample_names)
+        for chrom, (covs, rows) in chrom_rows.items():
+            present = None
+            values = np.array(' '.join(rows).split(), dtype=float)
+            if values.size == len(rows) * num_samples:
+                values = values.reshape(len(rows), num_samples)
+            else:
+                # Ragged rows - parse them one at a time
+                values = np.full((len(rows), num_samples), np.nan)
+                lengths = np.empty(len(rows), dtype=int)
+                for i, row in enumerate(rows):
+                    row_vals = np.array(row.split()[:num_samples], dtype=float)
+                    values[i, :len(row_vals)] = row_vals
+                    lengths[i] = len(row_vals)
+                if (lengths < num_samples).any():
+                    present = (np.arange(num_samples) < lengths[:, np.newaxis])[:, keep]
+            self.roc_matrices[chrom].append((
+                [sample_names[i] for i in keep],
+                np.array(covs),
+                values[:, keep],
+                present
+            ))
+
+    def roc_chrom_plot_data(self, chrom):
+        """ Build the line graph data for one chromosome from the parsed matrices """
+        data = collections.OrderedDict()
+        for samples, covs, values, present in self.roc_matrices[chrom]:
+            for j, s_name in enumerate(samples):
+                if present is None:
+                    sample_data = zip(covs.tolist(), values[:, j].tolist())
+                else:
+                    # Rows which were too short have no value for this sample
+                    rows = present[:, j]
+                    sample_data = zip(covs[rows].tolist(), values[rows, j].tolist())
+                data.setdefault(s_name, dict()).update(sample_data)
+        return data
 
     def roc_plot(self):
 
@@ -119,14 +173,20 @@ class MultiqcModule(BaseMultiqcModule):
 
     def parse_bin_plot_data(self, f):
         header = f['f'].readline()[1:].strip().split("\t")
-        for sample_parts in (l.split("\t") for l in f['f']):
-            cur = dict(zip(header, sample_parts))
-            cur["sample_id"] = self.clean_s_name(cur["sample_id"], f["root"])
-            total = float(cur["bins.in"]) + float(cur["bins.out"])
-            self.bin_plot_data[cur["sample_id"]] = {
-                "x": float(cur["bins.lo"]) / total,
-                "y": float(cur["bins.out"]) / total
-            }
+        cols = [header.index(c) for c in ("sample_id", "bins.lo", "bins.in", "bins.out")]
+        rows = [l.split("\t") for l in f['f']]
+        if len(rows) == 0:
+            return
+        # Pull out the columns we need and calculate the proportions for all samples at once
+        sample_ids, bins_lo, bins_in, bins_out = [[r[c] for r in rows] for c in cols]
+        bins_lo, bins_in, bins_out = [np.array(c, dtype=float) for c in (bins_lo, bins_in, bins_out)]
+        total = bins_in + bins_out
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xs = (bins_lo / total).tolist()
+            ys = (bins_out / total).tolist()
+        for s_name, x, y, has_bins in zip(sample_ids, xs, ys, (total > 0).tolist()):
+            if has_bins:
+                self.bin_plot_data[self.clean_s_name(s_name, f["root"])] = {"x": x, "y": y}
 
     def bin_plot(self):
         pconfig = {
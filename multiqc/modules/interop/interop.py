@@ -28,8 +28,7 @@ class MultiqcModule(BaseMultiqcModule):
             if max(len(parsed_data['summary']), len(parsed_data['details'])) > 0:
                 self.indexSummary[f['s_name']] = parsed_data
 
-        self.runSummary = self.ignore_samples(self.runSummary)
-        self.indexSummary = self.ignore_samples(self.indexSummary)
+        self.runSummary, self.indexSummary = self.ignore_samples_multi(self.runSummary, self.indexSummary)
 
         # No samples
         num_samples = max(len(self.runSummary), len(self.indexSummary))
@@ -3,7 +3,6 @@
 """ MultiQC module to parse output from KAT """
 import logging
 from collections import OrderedDict
-import json
 
 from multiqc.modules.base_module import BaseMultiqcModule
 from multiqc.plots import table
@@ -21,10 +20,9 @@ class MultiqcModule(BaseMultiqcModule):
 
         # Find and load any KAT dist analysis reports
         self.kat_data = dict()
-        for c_file in self.find_log_files('kat'):
+        for c_file in self.find_log_files('kat', filejson=True):
             s_name = self.clean_s_name(c_file['s_name'].replace(".dist_analysis", ""), c_file['root'])
-            content = json.loads(c_file['f'])
-            self.kat_data[s_name] = self.parse_kat_report(content)
+            self.kat_data[s_name] = self.parse_kat_report(c_file['f'])
 
         # Filter to strip out ignored sample names
         self.kat_data = self.ignore_samples(self.kat_data)
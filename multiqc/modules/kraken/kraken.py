@@ -11,6 +11,7 @@ import re
 from multiqc import config
 from multiqc.plots import bargraph
 from multiqc.modules.base_module import BaseMultiqcModule
+from multiqc.utils.top_counts import TopCounts
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -41,23 +42,23 @@ class MultiqcModule(BaseMultiqcModule):
         # self.t_ranks['U'] = 'Unclassified'
 
         # Find and load any kraken reports
+        # Percentages are summed across all samples as they are parsed, so that we can pick top 5
         self.kraken_raw_data = dict()
+        self.kraken_total_pct = dict()
+        self.kraken_sample_total_readcounts = dict()
         for f in self.find_log_files('kraken', filehandles=True):
             self.parse_logs(f)
 
-        # Filter to strip out ignored sample names
-        self.kraken_raw_data = self.ignore_samples(self.kraken_raw_data)
-
         if len(self.kraken_raw_data) == 0:
             raise UserWarning
 
         log.info("Found {} reports".format(len(self.kraken_raw_data)))
 
-        # Sum counts across all samples, so that we can pick top 5
-        self.kraken_total_pct = dict()
-        self.kraken_total_counts = dict()
-        self.kraken_sample_total_readcounts = dict()
-        self.sum_sample_counts()
+        # Read the reports again, keeping only the rows for the top taxa,
+        # so that memory use doesn't grow with every taxon in every sample
+        self.kraken_top_taxa = self.top_taxa()
+        for f in self.find_log_files('kraken', filehandles=True):
+            self.parse_top_taxa(f)
 
         self.general_stats_cols()
         self.top_five_barplot()
@@ -88,15 +89,32 @@ class MultiqcModule(BaseMultiqcModule):
            grandparent taxon is at the genus rank.
         5. NCBI taxonomic ID number
         6. Indented scientific name
+
+        Only rows that exactly fit a tax rank level are used. The rows are
+        summed into the kraken totals and not kept, see parse_top_taxa().
         """
 
+        if self.is_ignore_sample(f['s_name']):
+            return
+
+        if f['s_name'] in self.kraken_raw_data:
+            log.debug("Duplicate sample name found! Overwriting: {}".format(f['s_name']))
+        self.kraken_raw_data[f['s_name']] = list()
+        self.sum_sample_counts(f['s_name'], self.parse_rows(f['f']))
+
+    def parse_rows(self, fh):
+        """ Yield a dict for each row of a kraken report that exactly fits a tax rank level """
+
         # Search regexes for stats
         k2_regex = re.compile(r"^\s{1,2}(\d{1,2}\.\d{1,2})\t(\d+)\t(\d+)\t([\dUDKPCOFGS-]{1,3})\t(\d+)(\s+)(.+)")
-        data = []
-        for l in f['f']:
+        for l in fh:
             match = k2_regex.search(l)
             if match:
-                row = {
+                # Skip anything that doesn't exactly fit a tax rank level
+                rank_code = match.group(4)
+                if rank_code == '-' or any(c.isdigit() for c in rank_code):
+                    continue
+                yield {
                     'percent': float(match.group(1)),
                     'counts_rooted': int(match.group(2)),
                     'counts_direct': int(match.group(3)),
@@ -105,44 +123,49 @@ class MultiqcModule(BaseMultiqcModule):
                     'num_spaces': len(match.group(6)),
                     'classif': match.group(7)
                 }
-                data.append(row)
-
-        self.kraken_raw_data[f['s_name']] = data
 
-    def sum_sample_counts(self):
-        """ Sum counts across all samples for kraken data """
+    def top_taxa(self):
+        """ The top 5 taxa for each rank, summed across all samples """
+        top_taxa = dict()
+        for rank_code, counts in self.kraken_total_pct.items():
+            if not counts.exact:
+                log.info("Found more than {} {} taxa, so the top 5 were picked from approximate totals. "
+                    "Set top_counts_max_keys higher to use exact totals.".format(counts.max_keys, self.t_ranks.get(rank_code, rank_code)))
+            top_taxa[rank_code] = set(classif for classif, pct_sum in counts.most_common(5))
+        return top_taxa
+
+    def parse_top_taxa(self, f):
+        """ Keep the rows for the unclassified reads and the top taxa of each rank from a kraken report """
+        if f['s_name'] not in self.kraken_raw_data:
+            return
+        self.kraken_raw_data[f['s_name']] = [
+            row for row in self.parse_rows(f['f'])
+            if row['rank_code'] == 'U' or row['classif'] in self.kraken_top_taxa.get(row['rank_code'], ())
+        ]
+
+    def sum_sample_counts(self, s_name, data):
+        """ Add the counts for one sample to the kraken totals """
 
         # Sum the percentages for each taxa across all samples
         # Allows us to pick top-5 for each rank
         # Use percentages instead of counts so that deeply-sequences samples
         # are not unfairly over-represented
-        for s_name, data in self.kraken_raw_data.items():
-            total_guess_count = None
-            for row in data:
-
-                # Convenience vars that are easier to read
-                rank_code = row['rank_code']
-                classif = row['classif']
-
-                # Skip anything that doesn't exactly fit a tax rank level
-                if row['rank_code'] == '-' or any(c.isdigit() for c in row['rank_code']):
-                    continue
+        total_guess_count = None
+        for row in data:
 
-                # Calculate the total read count using percentages
-                # We use either unclassified or the first domain encountered, to try to use the largest proportion of reads = most accurate guess
-                if rank_code == 'U' or (rank_code == 'D' and row['counts_rooted'] > total_guess_count):
-                    self.kraken_sample_total_readcounts[s_name] = round(float(row['counts_rooted']) / (row['percent'] / 100.0))
-                    total_guess_count = row['counts_rooted']
+            # Convenience vars that are easier to read
+            rank_code = row['rank_code']
+            classif = row['classif']
 
-                if rank_code not in self.kraken_total_pct:
-                    self.kraken_total_pct[rank_code] = dict()
-                    self.kraken_total_counts[rank_code] = dict()
+            # Calculate the total read count using percentages
+            # We use either unclassified or the first domain encountered, to try to use the largest proportion of reads = most accurate guess
+            if rank_code == 'U' or (rank_code == 'D' and row['counts_rooted'] > total_guess_count):
+                self.kraken_sample_total_readcounts[s_name] = round(float(row['counts_rooted']) / (row['percent'] / 100.0))
+                total_guess_count = row['counts_rooted']
 
-                if classif not in self.kraken_total_pct[rank_code]:
-                    self.kraken_total_pct[rank_code][classif] = 0
-                    self.kraken_total_counts[rank_code][classif] = 0
-                self.kraken_total_pct[rank_code][classif] += row['percent']
-                self.kraken_total_counts[rank_code][classif] += row['counts_rooted']
+            if rank_code not in self.kraken_total_pct:
+                self.kraken_total_pct[rank_code] = TopCounts()
+            self.kraken_total_pct[rank_code].add(classif, row['percent'])
 
     def general_stats_cols(self):
         """ Add a couple of columns to the General Statistics table """
@@ -153,8 +176,8 @@ class MultiqcModule(BaseMultiqcModule):
         top_rank_name = None
         for rank_code, rank_name in self.t_ranks.items():
             try:
-                sorted_pct = sorted(self.kraken_total_pct[rank_code].items(), key=lambda x: x[1], reverse=True)
-                for classif, pct_sum in sorted_pct[:5]:
+                sorted_pct = self.kraken_total_pct[rank_code].most_common(5)
+                for classif, pct_sum in sorted_pct:
                     top_five.append(classif)
                 top_rank_code = rank_code
                 top_rank_name = rank_name
@@ -225,7 +248,7 @@ class MultiqcModule(BaseMultiqcModule):
 
             # Loop through the summed tax percentages to get the top 5 across all samples
             try:
-                sorted_pct = sorted(self.kraken_total_pct[rank_code].items(), key=lambda x: x[1], reverse=True)
+                sorted_pct = self.kraken_total_pct[rank_code].most_common(5)
             except KeyError:
                 # Taxa rank not found in this sample
                 continue
@@ -47,10 +47,8 @@ class MultiqcModule(BaseMultiqcModule):
             self.parse_complexity(f)
 
         # Filter to strip out ignored sample names
-        self.summary_data         =   self.ignore_samples(self.summary_data)
-        self.length_data          =   self.ignore_samples(self.length_data)
-        self.contamination_data   =   self.ignore_samples(self.contamination_data)
-        self.complexity_data      =   self.ignore_samples(self.complexity_data)
+        self.summary_data, self.length_data, self.contamination_data, self.complexity_data = self.ignore_samples_multi(
+            self.summary_data, self.length_data, self.contamination_data, self.complexity_data)
 
         # Warning when no files are found
         if max(len(self.summary_data), len(self.length_data), len(self.contamination_data), len(self.complexity_data)) == 0:
@@ -4,6 +4,7 @@ from __future__ import print_function
 
 from collections import defaultdict, OrderedDict
 import logging
+import numpy as np
 
 from multiqc import config
 from multiqc.modules.base_module import BaseMultiqcModule
@@ -11,6 +12,7 @@ from multiqc.modules.base_module import BaseMultiqcModule
 # Initialise the logger
 from multiqc.modules.qualimap.QM_BamQC import coverage_histogram_helptext, genome_fraction_helptext
 from multiqc.plots import linegraph
+from multiqc.utils import histogram
 log = logging.getLogger(__name__)
 
 class MultiqcModule(BaseMultiqcModule):
@@ -73,23 +75,29 @@ class MultiqcModule(BaseMultiqcModule):
             href="https://github.com/brentp/mosdepth",
             info="performs fast BAM/CRAM depth calculation for WGS, exome, or targeted sequencing")
 
-        dist_data, cov_data, xmax, perchrom_avg_data = self.parse_cov_dist()
+        cov_dists, perchrom_avg_data = self.parse_cov_dist()
 
         # Filter out any samples from --ignore-samples
-        dist_data = self.ignore_samples(dist_data)
-        cov_data = self.ignore_samples(cov_data)
-        perchrom_avg_data = self.ignore_samples(perchrom_avg_data)
+        cov_dists, perchrom_avg_data = self.ignore_samples_multi(cov_dists, perchrom_avg_data)
 
         # No samples found
         num_samples = max(
-            len(dist_data),
-            len(cov_data),
+            len(cov_dists),
             len(perchrom_avg_data)
         )
         if num_samples == 0:
             raise UserWarning
         log.info("Found {} reports".format(num_samples))
 
+        # Build the plot data from the coverage arrays
+        dist_data = OrderedDict()
+        cov_data = OrderedDict()
+        xmax = 0
+        for s_name, (x, cumcov) in cov_dists.items():
+            dist_data[s_name] = OrderedDict(zip(x.tolist(), cumcov.tolist()))
+            cov_data[s_name] = OrderedDict(zip(x.tolist(), cumcov_to_abscov(x, cumcov).tolist()))
+            xmax = max(xmax, histogram.tail_max_x(x, cumcov, 1))  # require >1% to prevent long flat tail
+
         if dist_data:
             self.add_section(
                 name='Coverage distribution',
@@ -142,50 +150,43 @@ class MultiqcModule(BaseMultiqcModule):
         if dist_data:
             threshs, hidden_threshs = get_cov_thresholds()
             self.genstats_cov_thresholds(dist_data, threshs, hidden_threshs)
-            self.genstats_mediancov(dist_data)
+            self.genstats_mediancov(cov_dists)
 
     def parse_cov_dist(self):
-        dist_data = defaultdict(OrderedDict)  # cumulative distribution
-        cov_data = defaultdict(OrderedDict)  # absoulte (non-cumulative) coverage
-        xmax = 0
+        """ Parse the mosdepth distribution files from a memory-mapped view,
+        without decoding the lines. Returns a dict of (coverage, cumulative
+        % bases) NumPy arrays for each sample, and the per chromosome average
+        coverage. """
+        cov_dists = OrderedDict()
         perchrom_avg_data = defaultdict(OrderedDict)  # per chromosome average coverage
 
         for scope in ('region', 'global'):
-            for f in self.find_log_files('mosdepth/' + scope + '_dist'):
+            for f in self.find_log_files('mosdepth/' + scope + '_dist', filemapped=True):
                 s_name = self.clean_s_name(f['fn'], f['root']).replace('.mosdepth.' + scope + '.dist', '')
-                if s_name in dist_data:  # both region and global might exist, prioritizing region
+                if s_name in cov_dists:  # both region and global might exist, prioritizing region
                     continue
 
-                for line in f['f'].split("\n"):
-                    if "\t" not in line:
+                total_x = list()
+                total_fraction = list()
+                contig_avg = OrderedDict()  # contig names are only decoded once, at the end
+                for line in f['f'].lines():
+                    fields = line.split(b"\t")
+                    if len(fields) != 3:
                         continue
-                    contig, cutoff_reads, bases_fraction = line.split("\t")
-                    if contig == "total":  # for global coverage distribution
-                        cumcov = 100.0 * float(bases_fraction)
-                        x = int(cutoff_reads)
-                        dist_data[s_name][x] = cumcov
-                        # converting cumulative coverage into absoulte coverage:
-                        """
-                        *example*              x:  cumcov:  abscov:
-                        3x                     3x  0      =               0
-                        2x     -               2x  0.10   = 0.10 - 0    = 0.10
-                        1x     --------        1x  0.80   = 0.80 - 0.10 = 0.70
-                        genome ..........      0x  1.00   = 1.00 - 0.80 = 0.20
-                        """
-                        if x + 1 not in dist_data[s_name]:
-                            cov_data[s_name][x] = cumcov
-                        else:
-                            cov_data[s_name][x] = cumcov - dist_data[s_name][x + 1]
-                        if cumcov > 1:  # require >1% to prevent long flat tail
-                            xmax = max(xmax, x)
+                    contig, cutoff_reads, bases_fraction = fields
+                    if contig == b"total":  # for global coverage distribution
+                        total_x.append(int(cutoff_reads))
+                        total_fraction.append(float(bases_fraction))
                     else:  # for per-contig plot
-                        avg = perchrom_avg_data[s_name].get(contig, 0) + float(bases_fraction)
-                        perchrom_avg_data[s_name][contig] = avg
+                        contig_avg[contig] = contig_avg.get(contig, 0) + float(bases_fraction)
 
-                if s_name in dist_data:
+                if len(contig_avg) > 0:
+                    perchrom_avg_data[s_name] = OrderedDict((c.decode('utf-8'), v) for c, v in contig_avg.items())
+                if len(total_x) > 0:
+                    cov_dists[s_name] = (np.array(total_x, dtype=int), 100.0 * np.array(total_fraction))
                     self.add_data_source(f, s_name=s_name, section='genome_results')
 
-        return dist_data, cov_data, xmax, perchrom_avg_data
+        return cov_dists, perchrom_avg_data
 
     def genstats_cov_thresholds(self, dist_data, threshs, hidden_threshs):
         data = defaultdict(OrderedDict)
@@ -210,15 +211,10 @@ class MultiqcModule(BaseMultiqcModule):
             }
         self.general_stats_addcols(data, headers)
 
-    def genstats_mediancov(self, dist_data):
+    def genstats_mediancov(self, cov_dists):
         data = defaultdict(OrderedDict)
-        for s_name, d in dist_data.items():
-            median_cov = None
-            for this_cov, cum_pct in d.items():
-                if cum_pct >= 50:
-                    median_cov = this_cov
-                    break
-            data[s_name]['median_coverage'] = median_cov
+        for s_name, (x, cumcov) in cov_dists.items():
+            data[s_name]['median_coverage'] = histogram.cumulative_median_x(x, cumcov)
 
         headers = OrderedDict()
         headers['median_coverage'] = {
@@ -231,6 +227,25 @@ class MultiqcModule(BaseMultiqcModule):
         self.general_stats_addcols(data, headers)
 
 
+def cumcov_to_abscov(x, cumcov):
+    """ Convert a cumulative coverage distribution into absolute coverage
+    *example*              x:  cumcov:  abscov:
+    3x                     3x  0      =               0
+    2x     -               2x  0.10   = 0.10 - 0    = 0.10
+    1x     --------        1x  0.80   = 0.80 - 0.10 = 0.70
+    genome ..........      0x  1.00   = 1.00 - 0.80 = 0.20
+    """
+    order = np.argsort(x, kind='stable')
+    sorted_x = x[order]
+    # Position of x + 1 in the sorted coverage values, if it's there
+    nxt = np.searchsorted(sorted_x, x + 1)
+    nxt_clipped = np.minimum(nxt, len(x) - 1)
+    has_next = (nxt < len(x)) & (sorted_x[nxt_clipped] == x + 1)
+    abscov = cumcov.copy()
+    abscov[has_next] -= cumcov[order[nxt_clipped[has_next]]]
+    return abscov
+
+
 def get_cov_thresholds():
     """ Reads coverage thresholds from the config, otherwise sets sensible defaults
     """
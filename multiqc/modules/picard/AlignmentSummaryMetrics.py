@@ -4,10 +4,9 @@
 
 from collections import OrderedDict
 import logging
-import os
-import re
 
 from multiqc.plots import bargraph
+from .util import read_metrics_file, report_sample_name, find_table
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -21,36 +20,25 @@ def parse_reports(self):
     # Go through logs and find Metrics
     for f in self.find_log_files('picard/alignment_metrics', filehandles=True):
         parsed_data = dict()
-        s_name = None
-        keys = None
-        for l in f['f']:
-            # New log starting
-            if 'AlignmentSummaryMetrics' in l and 'INPUT' in l:
-                s_name = None
-                keys = None
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-                    parsed_data[s_name] = dict()
-
-            if s_name is not None:
-                if 'AlignmentSummaryMetrics' in l and '## METRICS CLASS' in l:
-                    keys = f['f'].readline().strip("\n").split("\t")
-                elif keys:
-                    vals = l.strip("\n").split("\t")
-                    if len(vals) == len(keys):
-                        # Ignore the FIRST_OF_PAIR / SECOND_OF_PAIR data to simplify things
-                        if vals[0] == 'PAIR' or vals[0] == 'UNPAIRED':
-                            for i, k in enumerate(keys):
-                                try:
-                                    parsed_data[s_name][k] = float(vals[i])
-                                except ValueError:
-                                    parsed_data[s_name][k] = vals[i]
-                    else:
-                        s_name = None
-                        keys = None
+        for report in read_metrics_file(self, f):
+            s_name = report_sample_name(self, f, report, ['AlignmentSummaryMetrics'])
+            if s_name is None:
+                continue
+            parsed_data[s_name] = dict()
+            table = find_table(report, 'metrics', ['AlignmentSummaryMetrics'])
+            if table is None:
+                continue
+            keys = table['keys']
+            for vals in table['rows']:
+                if len(vals) != len(keys):
+                    break
+                # Ignore the FIRST_OF_PAIR / SECOND_OF_PAIR data to simplify things
+                if vals[0] == 'PAIR' or vals[0] == 'UNPAIRED':
+                    for i, k in enumerate(keys):
+                        try:
+                            parsed_data[s_name][k] = float(vals[i])
+                        except ValueError:
+                            parsed_data[s_name][k] = vals[i]
 
         # Remove empty dictionaries
         for s_name in list(parsed_data.keys()):
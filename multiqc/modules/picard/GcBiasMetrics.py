@@ -3,10 +3,9 @@
 """ MultiQC submodule to parse output from Picard GcBiasMetrics """
 
 import logging
-import os
-import re
 
 from multiqc.plots import linegraph
+from .util import read_metrics_file, report_sample_name, find_table
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -21,56 +20,40 @@ def parse_reports(self):
 
     # Go through logs and find Metrics
     for f in self.find_log_files('picard/gcbias', filehandles=True):
-        s_name = None
-        gc_col = None
-        cov_col = None
-        for l in f['f']:
-            # New log starting
-            if 'GcBiasMetrics' in l and 'INPUT' in l:
-                s_name = None
-
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-
-            if s_name is not None:
-                if gc_col is not None and cov_col is not None :
+        for report in read_metrics_file(self, f):
+            s_name = report_sample_name(self, f, report, ['GcBiasMetrics'])
+            if s_name is None:
+                continue
+
+            table = find_table(report, 'metrics', ['GcBiasDetailMetrics'])
+            if table is not None:
+                if s_name in self.picard_GCbias_data:
+                    log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
+                self.add_data_source(f, s_name, section='GcBiasDetailMetrics')
+                self.picard_GCbias_data[s_name] = dict()
+                # Find columns with the data we want - note that GC isn't always the first column.
+                gc_col = table['keys'].index('GC')
+                cov_col = table['keys'].index('NORMALIZED_COVERAGE')
+                for s in table['rows']:
                     try:
-                        # Note that GC isn't always the first column.
-                        s = l.strip("\n").split("\t")
                         self.picard_GCbias_data[s_name][ int(s[gc_col]) ] = float(s[cov_col])
                     except IndexError:
-                        s_name = None
-                        gc_col = None
-                        cov_col = None
-
-                if 'GcBiasDetailMetrics' in l and '## METRICS CLASS' in l:
-                    if s_name in self.picard_GCbias_data:
-                        log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
-                    self.add_data_source(f, s_name, section='GcBiasDetailMetrics')
-                    self.picard_GCbias_data[s_name] = dict()
-                    # Get header - find columns with the data we want
-                    l = f['f'].readline()
-                    s = l.strip("\n").split("\t")
-                    gc_col = s.index('GC')
-                    cov_col = s.index('NORMALIZED_COVERAGE')
-
-                if 'GcBiasSummaryMetrics' in l and '## METRICS CLASS' in l:
-                    if s_name in self.picard_GCbiasSummary_data:
-                        log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
-                    self.add_data_source(f, s_name, section='GcBiasSummaryMetrics')
-                    self.picard_GCbiasSummary_data[s_name] = dict()
-
-                    keys = f['f'].readline().rstrip("\n").split("\t")
-                    vals = f['f'].readline().rstrip("\n").split("\t")
-                    for i, k in enumerate(keys):
-                        try:
-                            self.picard_GCbiasSummary_data[s_name][k] = float(vals[i])
-                        except ValueError:
-                            self.picard_GCbiasSummary_data[s_name][k] = vals[i]
-
+                        break
+
+            table = find_table(report, 'metrics', ['GcBiasSummaryMetrics'])
+            if table is not None:
+                if s_name in self.picard_GCbiasSummary_data:
+                    log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
+                self.add_data_source(f, s_name, section='GcBiasSummaryMetrics')
+                self.picard_GCbiasSummary_data[s_name] = dict()
+                vals = table['rows'][0] if len(table['rows']) > 0 else []
+                for i, k in enumerate(table['keys']):
+                    try:
+                        self.picard_GCbiasSummary_data[s_name][k] = float(vals[i])
+                    except ValueError:
+                        self.picard_GCbiasSummary_data[s_name][k] = vals[i]
+                    except IndexError:
+                        pass
 
         for s_name in list(self.picard_GCbias_data.keys()):
             if len(self.picard_GCbias_data[s_name]) == 0:
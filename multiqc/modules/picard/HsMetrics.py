@@ -4,11 +4,10 @@
 
 from collections import OrderedDict, defaultdict
 import logging
-import os
-import re
 
 from multiqc import config
 from multiqc.plots import table, linegraph
+from .util import read_metrics_file, report_sample_name, find_table
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -65,51 +64,40 @@ def parse_reports(self):
     # Go through logs and find Metrics
     for f in self.find_log_files('picard/hsmetrics', filehandles=True):
         parsed_data = dict()
-        s_name = None
-        keys = None
         commadecimal = None
-        for l in f['f']:
-            # New log starting
-            if 'CalculateHsMetrics' in l or 'CollectHsMetrics' in l and 'INPUT' in l:
-                s_name = None
-                keys = None
-
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-                    parsed_data[s_name] = dict()
-
-            if s_name is not None:
-                if 'HsMetrics' in l and '## METRICS CLASS' in l:
-                    keys = f['f'].readline().strip("\n").split("\t")
-                elif keys:
-                    vals = l.strip("\n").split("\t")
-                    if len(vals) == len(keys):
-                        j = 'NA'
-                        if keys[0] == 'BAIT_SET':
-                            j = vals[0]
-                        parsed_data[s_name][j] = dict()
-                        # Check that we're not using commas for decimal places
-                        if commadecimal is None:
-                            for i, k in enumerate(keys):
-                                if k.startswith('PCT_'):
-                                    if ',' in vals[i]:
-                                        commadecimal = True
-                                    else:
-                                        commadecimal = False
-                        for i, k in enumerate(keys):
-                            try:
-                                if commadecimal:
-                                    vals[i] = vals[i].replace('.', '')
-                                    vals[i] = vals[i].replace(',', '.')
-                                parsed_data[s_name][j][k] = float(vals[i])
-                            except ValueError:
-                                parsed_data[s_name][j][k] = vals[i]
-                    else:
-                        s_name = None
-                        keys = None
+        for report in read_metrics_file(self, f):
+            s_name = report_sample_name(self, f, report, ['CalculateHsMetrics', 'CollectHsMetrics'])
+            if s_name is None:
+                continue
+            parsed_data[s_name] = dict()
+            metrics_table = find_table(report, 'metrics', ['HsMetrics'])
+            if metrics_table is None:
+                continue
+            keys = metrics_table['keys']
+            for vals in metrics_table['rows']:
+                if len(vals) != len(keys):
+                    break
+                j = 'NA'
+                if keys[0] == 'BAIT_SET':
+                    j = vals[0]
+                parsed_data[s_name][j] = dict()
+                # Check that we're not using commas for decimal places
+                if commadecimal is None:
+                    for i, k in enumerate(keys):
+                        if k.startswith('PCT_'):
+                            if ',' in vals[i]:
+                                commadecimal = True
+                            else:
+                                commadecimal = False
+                for i, k in enumerate(keys):
+                    val = vals[i]
+                    try:
+                        if commadecimal:
+                            val = val.replace('.', '')
+                            val = val.replace(',', '.')
+                        parsed_data[s_name][j][k] = float(val)
+                    except ValueError:
+                        parsed_data[s_name][j][k] = val
 
         # Remove empty dictionaries
         for s_name in list(parsed_data.keys()):
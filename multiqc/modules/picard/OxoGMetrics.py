@@ -3,8 +3,8 @@
 """ MultiQC submodule to parse output from Picard OxoGMetrics """
 
 import logging
-import os
-import re
+
+from .util import read_metrics_file, report_sample_name, find_table
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -22,44 +22,30 @@ def parse_reports(self):
         parsed_data = list()
         sample_names = list()
         s_files = list()
-        s_name = None
-        keys = None
-        for l in f['f']:
-            # New log starting
-            if ('CollectOxoGMetrics' in l or 'ConvertSequencingArtifactToOxoG' in l) and 'INPUT' in l:
-                s_name = None
-                keys = None
-                context_col = None
-
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-                    parsed_data.append(dict())
-                    sample_names.append(s_name)
-                    s_files.append(f)
-
-
-            if s_name is not None:
-                if 'CollectOxoGMetrics$CpcgMetrics' in l and '## METRICS CLASS' in l:
-                    keys = f['f'].readline().strip("\n").split("\t")
-                    context_col = keys.index('CONTEXT')
-                elif keys:
-                    vals = l.strip("\n").split("\t")
-                    if len(vals) == len(keys) and context_col is not None:
-                        context = vals[context_col]
-                        parsed_data[-1][context] = dict()
-                        for i, k in enumerate(keys):
-                            k = k.strip()
-                            try:
-                                parsed_data[-1][context][k] = float(vals[i])
-                            except ValueError:
-                                vals[i] = vals[i].strip()
-                                parsed_data[-1][context][k] = vals[i]
-                    else:
-                        s_name = None
-                        keys = None
+        for report in read_metrics_file(self, f):
+            s_name = report_sample_name(self, f, report, ['CollectOxoGMetrics', 'ConvertSequencingArtifactToOxoG'])
+            if s_name is None:
+                continue
+            parsed_data.append(dict())
+            sample_names.append(s_name)
+            s_files.append(f)
+
+            metrics_table = find_table(report, 'metrics', ['CollectOxoGMetrics$CpcgMetrics'])
+            if metrics_table is None:
+                continue
+            keys = metrics_table['keys']
+            context_col = keys.index('CONTEXT')
+            for vals in metrics_table['rows']:
+                if len(vals) != len(keys):
+                    break
+                context = vals[context_col]
+                parsed_data[-1][context] = dict()
+                for i, k in enumerate(keys):
+                    k = k.strip()
+                    try:
+                        parsed_data[-1][context][k] = float(vals[i])
+                    except ValueError:
+                        parsed_data[-1][context][k] = vals[i].strip()
 
         # Remove empty dictionaries
         for idx, s_name in enumerate(sample_names):
@@ -9,7 +9,7 @@ import re
 
 from multiqc import config
 from multiqc.plots import table, linegraph
-from .util import read_sample_name
+from .util import read_metrics_file, report_sample_name
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -39,42 +39,20 @@ def parse_reports(self):
 
     # Go through logs and find Metrics
     for f in self.find_log_files('picard/quality_yield_metrics', filehandles=True):
-        parsed_data = dict()
-        s_name = None
-        keys = None
-        commadecimal = None
-
-        lines = iter(f['f'])
-
-        clean_fn = lambda n: self.clean_s_name(n, f['root'])
-        s_name = read_sample_name(lines, clean_fn, 'CollectQualityYieldMetrics')
-
-        if s_name is None:
-            continue
-
-        sample_data = dict()
-        try:
-            # skip to the histogram
-            line = next(lines)
-            while not line.startswith('## METRICS CLASS'):
-                line = next(lines)
+        for report in read_metrics_file(self, f):
+            s_name = report_sample_name(self, f, report, ['CollectQualityYieldMetrics'])
+            if s_name is None or len(report['metrics']) == 0:
+                continue
 
             # check the header
-            line = next(lines)
-            if header != line.strip().split('\t'):
+            metrics_table = report['metrics'][0]
+            if header != metrics_table['keys'] or len(metrics_table['rows']) == 0:
                 continue
 
             # one row
-            line = next(lines)
-            fields = [int(field) for field in line.strip('\n').split('\t')]
-            sample_data = OrderedDict(zip(header, fields))
-        except StopIteration:
-            pass
-
-        if sample_data:
+            fields = [int(field) for field in metrics_table['rows'][0]]
             all_data[s_name] = OrderedDict(zip(header, fields))
 
-
     # Filter to strip out ignored sample names
     all_data = self.ignore_samples(all_data)
 
@@ -4,10 +4,9 @@
 
 from collections import OrderedDict
 import logging
-import os
-import re
 
 from multiqc.plots import bargraph
+from .util import read_metrics_file, report_sample_name, find_table
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -22,34 +21,28 @@ def parse_reports(self):
 
     # Go through logs and find Metrics
     for f in self.find_log_files('picard/pcr_metrics', filehandles=True):
-        s_name = None
-        for l in f['f']:
-            # New log starting
-            if 'TargetedPcrMetrics' in l and 'INPUT' in l:
-                s_name = None
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-
-            if s_name is not None:
-                if 'TargetedPcrMetrics' in l and '## METRICS CLASS' in l:
-                    keys = f['f'].readline().strip("\n").split("\t")
-                    vals = f['f'].readline().strip("\n").split("\t")
-                    if len(vals) == len(keys):
-                        if s_name in self.picard_pcrmetrics_data:
-                            log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
-                        self.add_data_source(f, s_name, section='TargetedPcrMetrics')
-                        self.picard_pcrmetrics_data[s_name] = dict()
-                        for i, k in enumerate(keys):
-                            try:
-                                # Multiply percentages by 100
-                                if k.startswith('PCT_'):
-                                    vals[i] = float(vals[i]) * 100.0
-                                self.picard_pcrmetrics_data[s_name][k] = float(vals[i])
-                            except ValueError:
-                                self.picard_pcrmetrics_data[s_name][k] = vals[i]
+        for report in read_metrics_file(self, f):
+            s_name = report_sample_name(self, f, report, ['TargetedPcrMetrics'])
+            if s_name is None:
+                continue
+            metrics_table = find_table(report, 'metrics', ['TargetedPcrMetrics'])
+            if metrics_table is None:
+                continue
+            keys = metrics_table['keys']
+            vals = list(metrics_table['rows'][0]) if len(metrics_table['rows']) > 0 else ['']
+            if len(vals) == len(keys):
+                if s_name in self.picard_pcrmetrics_data:
+                    log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
+                self.add_data_source(f, s_name, section='TargetedPcrMetrics')
+                self.picard_pcrmetrics_data[s_name] = dict()
+                for i, k in enumerate(keys):
+                    try:
+                        # Multiply percentages by 100
+                        if k.startswith('PCT_'):
+                            vals[i] = float(vals[i]) * 100.0
+                        self.picard_pcrmetrics_data[s_name][k] = float(vals[i])
+                    except ValueError:
+                        self.picard_pcrmetrics_data[s_name][k] = vals[i]
 
     # Filter to strip out ignored sample names
     self.picard_pcrmetrics_data = self.ignore_samples(self.picard_pcrmetrics_data)
@@ -4,11 +4,10 @@
 
 from collections import OrderedDict
 import logging
-import os
-import re
 
 from multiqc import config
 from multiqc.plots import linegraph, bargraph
+from .util import read_metrics_file, report_sample_name, find_table
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -24,54 +23,37 @@ def parse_reports(self):
 
     # Go through logs and find Metrics
     for f in self.find_log_files('picard/wgs_metrics', filehandles=True):
-        s_name = None
-        in_hist = False
-        for l in f['f']:
+        for report in read_metrics_file(self, f):
+            s_name = report_sample_name(self, f, report, ['WgsMetrics'])
+            if s_name is None:
+                continue
+            metrics_table = find_table(report, 'metrics', ['CollectWgsMetrics$WgsMetrics', 'picard.analysis.WgsMetrics'])
+            if metrics_table is None:
+                continue
+
+            if s_name in self.picard_wgsmetrics_data:
+                log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
+            self.add_data_source(f, s_name, section='WgsMetrics')
+            self.picard_wgsmetrics_data[s_name] = dict()
+            keys = metrics_table['keys']
+            vals = metrics_table['rows'][0] if len(metrics_table['rows']) > 0 else ['']
+            if len(vals) == len(keys):
+                for i, k in enumerate(keys):
+                    try:
+                        self.picard_wgsmetrics_data[s_name][k] = float(vals[i])
+                    except ValueError:
+                        self.picard_wgsmetrics_data[s_name][k] = vals[i]
 
             # Catch the histogram values
-            if s_name is not None and in_hist is True:
-                try:
-                    sections = l.split("\t")
-                    cov = int(sections[0])
-                    count = int(sections[1])
+            self.picard_wgsmetrics_histogram[s_name] = OrderedDict()
+            if len(report['histograms']) > 0:
+                for sections in report['histograms'][0]['rows']:
+                    try:
+                        cov = int(sections[0])
+                        count = int(sections[1])
+                    except ValueError:
+                        break
                     self.picard_wgsmetrics_histogram[s_name][cov] = count
-                except ValueError:
-                    # Reset in case we have more in this log file
-                    s_name = None
-                    in_hist = False
-
-            # New log starting
-            if 'WgsMetrics' in l and 'INPUT' in l:
-                s_name = None
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", l, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = self.clean_s_name(s_name, f['root'])
-
-            if s_name is not None:
-                metric_names = ['CollectWgsMetrics$WgsMetrics', 'picard.analysis.WgsMetrics']
-                if any(n in l for n in metric_names) and '## METRICS CLASS' in l:
-                    if s_name in self.picard_wgsmetrics_data:
-                        log.debug("Duplicate sample name found in {}! Overwriting: {}".format(f['fn'], s_name))
-                    self.add_data_source(f, s_name, section='WgsMetrics')
-                    self.picard_wgsmetrics_data[s_name] = dict()
-                    keys = f['f'].readline().strip("\n").split("\t")
-                    vals = f['f'].readline().strip("\n").split("\t")
-                    if len(vals) == len(keys):
-                        for i, k in enumerate(keys):
-                            try:
-                                self.picard_wgsmetrics_data[s_name][k] = float(vals[i])
-                            except ValueError:
-                                self.picard_wgsmetrics_data[s_name][k] = vals[i]
-
-                    # Skip lines on to histogram
-                    next(f['f'])
-                    next(f['f'])
-                    next(f['f'])
-
-                    self.picard_wgsmetrics_histogram[s_name] = OrderedDict()
-                    in_hist = True
 
         for key in list(self.picard_wgsmetrics_data.keys()):
             if len(self.picard_wgsmetrics_data[key]) == 0:
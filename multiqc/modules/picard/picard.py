@@ -47,6 +47,7 @@ class MultiqcModule(BaseMultiqcModule):
         # Set up class objects to hold parsed data
         self.general_stats_headers = OrderedDict()
         self.general_stats_data = dict()
+        self.picard_metrics_files = dict()
         n = dict()
 
         # Call submodule functions
@@ -114,6 +115,9 @@ class MultiqcModule(BaseMultiqcModule):
         if n['WgsMetrics'] > 0:
             log.info("Found {} WgsMetrics reports".format(n['WgsMetrics']))
 
+        # Parsed metrics files are no longer needed
+        self.picard_metrics_files.clear()
+
         # Exit if we didn't find anything
         if sum(n.values()) == 0:
             raise UserWarning
@@ -5,29 +5,79 @@ import re
 from collections import OrderedDict
 
 
-def read_sample_name(line_iter, clean_fn, program_name):
+def read_metrics_file(self, f):
     """
-    Consumes lines from the provided line_iter and parses those lines
-    as a header for the picard base distribution file.  The header
-    file is assumed to contain a line with both 'INPUT' and
-    'BaseDistributionByCycle'.
+    Parses a Picard metrics file in a single pass. A file can hold several
+    concatenated logs, so a list of reports is returned. Each report is a dict:
 
-    If the header parses correctly, the sample name is returned.  If
-    the header does not parse correctly, None is returned.
+        'header': the '#' comment lines with the command line used
+        'metrics': the '## METRICS CLASS' tables
+        'histograms': the '## HISTOGRAM' tables
+
+    Each table is a dict with its 'class', column 'keys' and 'rows' (lists of
+    string values). Files are often found by several Picard submodules, so the
+    result is cached by file path and the file is only read once.
+    """
+    path = os.path.join(f['root'], f['fn'])
+    if path in self.picard_metrics_files:
+        return self.picard_metrics_files[path]
+
+    reports = list()
+    report = None
+    table = None
+    lines = iter(f['f'])
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line.startswith('##'):
+            for section, name in (('## METRICS CLASS', 'metrics'), ('## HISTOGRAM', 'histograms')):
+                if line.startswith(section):
+                    if report is None:
+                        report = {'header': list(), 'metrics': list(), 'histograms': list()}
+                        reports.append(report)
+                    table = {
+                        'class': line[len(section):].strip(),
+                        'keys': next(lines, '').rstrip("\r\n").split("\t"),
+                        'rows': list()
+                    }
+                    report[name].append(table)
+            continue
+        if line.startswith('#'):
+            # New log starting
+            if report is None or len(report['metrics']) > 0 or len(report['histograms']) > 0:
+                report = {'header': list(), 'metrics': list(), 'histograms': list()}
+                reports.append(report)
+            report['header'].append(line)
+            table = None
+        elif not line.strip():
+            table = None
+        elif table is not None:
+            table['rows'].append(line.split("\t"))
+
+    self.picard_metrics_files[path] = reports
+    return reports
+
+def report_sample_name(self, f, report, program_names):
+    """
+    Finds the sample name in the header of a report from read_metrics_file(),
+    using the INPUT of the first command line from one of the program_names.
+    Returns None if there isn't one.
     """
-    try:
-        while True:
-            new_line = next(line_iter)
-            new_line = new_line.strip()
-            if program_name in new_line and 'INPUT' in new_line:
-                # Pull sample name from input
-                fn_search = re.search(r"INPUT=?\s*(\[?[^\s]+\]?)", new_line, flags=re.IGNORECASE)
-                if fn_search:
-                    s_name = os.path.basename(fn_search.group(1).strip('[]'))
-                    s_name = clean_fn(s_name)
-                    return s_name
-    except StopIteration:
-        return None
+    for line in report['header']:
+        if 'INPUT' in line and any(p.lower() in line.lower() for p in program_names):
+            # Pull sample name from input
+            fn_search = re.search(r"INPUT(?:=|\s+)(\[?[^\s]+\]?)", line, flags=re.IGNORECASE)
+            if fn_search:
+                s_name = os.path.basename(fn_search.group(1).strip('[]'))
+                return self.clean_s_name(s_name, f['root'])
+    return None
+
+def find_table(report, table_type, class_names):
+    """ Returns the first metrics or histograms table of a report with a
+    class containing one of class_names, or None """
+    for table in report[table_type]:
+        if any(c.lower() in table['class'].lower() for c in class_names):
+            return table
+    return None
 
 def read_histogram(self, program_key, program_name, headers, formats):
     """
@@ -46,44 +96,24 @@ def read_histogram(self, program_key, program_name, headers, formats):
 
     # Go through logs and find Metrics
     for f in self.find_log_files(program_key, filehandles=True):
-        lines = iter(f['f'])
-
-        # read through the header of the file to obtain the
-        # sample name
-        clean_fn = lambda n: self.clean_s_name(n, f['root'])
-        s_name = read_sample_name(lines, clean_fn, program_name)
-        if s_name is None:
-            continue
-
-        sample_data = OrderedDict()
-
-        try:
-            # skip to the histogram
-            line = next(lines)
-            while not line.startswith('## HISTOGRAM'):
-                line = next(lines)
-
-            # check the header
-            line = next(lines)
-            if headers != line.strip().split("\t"):
+        for report in read_metrics_file(self, f):
+            s_name = report_sample_name(self, f, report, [program_name])
+            if s_name is None:
                 continue
 
-            # slurp the data
-            line = next(lines).rstrip()
-            while line:
-                fields = line.split('\t')
-                assert len(fields) == len(headers)
-                for i in range(len(fields)):
-                    fields[i] = formats[i](fields[i])
-
-                sample_data[fields[0]] = OrderedDict(zip(headers, fields))
-                line = next(lines).rstrip()
-
-        except StopIteration:
-            pass
-
-        # append the data
-        if sample_data:
-            all_data[s_name] = sample_data
+            # check the header
+            sample_data = OrderedDict()
+            for table in report['histograms']:
+                if table['keys'] != headers:
+                    continue
+                for fields in table['rows']:
+                    assert len(fields) == len(headers)
+                    fields = [fmt(field) for fmt, field in zip(formats, fields)]
+                    sample_data[fields[0]] = OrderedDict(zip(headers, fields))
+                break
+
+            # append the data
+            if sample_data:
+                all_data[s_name] = sample_data
 
     return self.ignore_samples(all_data)
@@ -10,6 +10,7 @@ from collections import OrderedDict
 
 from multiqc import config
 from multiqc.plots import linegraph
+from multiqc.utils import histogram
 
 # Initialise the logger
 log = logging.getLogger(__name__)
@@ -143,18 +144,7 @@ def parse_coverage(self, f):
         log.debug("Couldn't parse contents of coverage histogram file {}".format(f['fn']))
         return None
 
-    # Find median without importing anything to do it for us
-    num_counts = sum(d.values())
-    cum_counts = 0
-    total_cov = 0
-    median_coverage = None
-    for thiscov, thiscount in d.items():
-        cum_counts += thiscount
-        total_cov += thiscov*thiscount
-        if cum_counts >= num_counts/2:
-            median_coverage = thiscov
-            break
-    self.general_stats_data[s_name]['median_coverage'] = median_coverage
+    self.general_stats_data[s_name]['median_coverage'] = histogram.median_x(*histogram.histogram_arrays(d))
     # Save results
     if s_name in self.qualimap_bamqc_coverage_hist:
         log.debug("Duplicate coverage histogram sample name found! Overwriting: {}".format(s_name))
@@ -180,17 +170,8 @@ def parse_insert_size(self, f):
         else:
             d[insertsize] = count
 
-    # Find median without importing anything to do it for us
-    num_counts = sum(d.values())
-    cum_counts = 0
-    median_insert_size = None
-    for thisins, thiscount in d.items():
-        cum_counts += thiscount
-        if cum_counts >= num_counts/2:
-            median_insert_size = thisins
-            break
     # Add the median insert size to the general stats table
-    self.general_stats_data[s_name]['median_insert_size'] = median_insert_size
+    self.general_stats_data[s_name]['median_insert_size'] = histogram.median_x(*histogram.histogram_arrays(d))
 
     # Save results
     if s_name in self.qualimap_bamqc_insert_size_hist:
@@ -308,19 +289,16 @@ def report_sections(self):
         # Chew back on histogram to prevent long flat tail
         # (find a sensible max x - lose 1% of longest tail)
         max_x = 0
-        total_bases_by_sample = dict()
+        hist_arrays = dict()
         for s_name, d in self.qualimap_bamqc_coverage_hist.items():
-            total_bases_by_sample[s_name] = sum(d.values())
-            cumulative = 0
-            for count in sorted(d.keys(), reverse=True):
-                cumulative += d[count]
-                if cumulative / total_bases_by_sample[s_name] > 0.01:
-                    max_x = max(max_x, count)
-                    break
+            hist_arrays[s_name] = histogram.histogram_arrays(d)
+            x, counts = hist_arrays[s_name]
+            total = histogram.total_count(counts)
+            if total > 0:
+                max_x = max(max_x, histogram.tail_max_x(x, histogram.counts_at_or_above(counts) / total, 0.01))
 
         rates_within_threshs = dict()
-        for s_name, hist in self.qualimap_bamqc_coverage_hist.items():
-            total = total_bases_by_sample[s_name]
+        for s_name, (x, counts) in hist_arrays.items():
             # Make a range of depths that isn't stupidly huge for high coverage expts
             depth_range = list(range(0, max_x + 1, math.ceil(float(max_x)/400.0) if max_x > 0 else 1))
             # Check that we have our specified coverages in the list
@@ -328,7 +306,7 @@ def report_sections(self):
                 if int(c) not in depth_range:
                     depth_range.append(int(c))
             # Calculate the coverage rates for this range of coverages
-            rates_within_threshs[s_name] = _calculate_bases_within_thresholds(hist, total, depth_range)
+            rates_within_threshs[s_name] = histogram.percent_at_or_above(x, counts, depth_range)
             # Add requested coverage levels to the General Statistics table
             for c in self.covs:
                 if int(c) in rates_within_threshs[s_name]:
@@ -572,26 +550,3 @@ def general_stats_headers (self):
         'format': '{0:.2f}',
         'hidden': True
     }
-
-def _calculate_bases_within_thresholds(bases_by_depth, total_size, depth_thresholds):
-    bases_within_threshs = OrderedDict((depth, 0) for depth in depth_thresholds)
-    rates_within_threshs = OrderedDict((depth, None) for depth in depth_thresholds)
-
-    dt = sorted(depth_thresholds, reverse=True)
-    c = 0
-    for depth in sorted(bases_by_depth.keys(), reverse=True):
-        while depth < dt[c]:
-            c += 1
-            bases_within_threshs[dt[c]] = bases_within_threshs[dt[c - 1]]
-        if depth >= dt[c]:
-            bases_within_threshs[dt[c]] += bases_by_depth[depth]
-    while c + 1 < len(dt):
-        c += 1
-        bases_within_threshs[dt[c]] = total_size
-    for t in dt:
-        bs = bases_within_threshs[t]
-        if total_size > 0:
-            rate = 100.0 * bases_within_threshs[t] / total_size
-            assert rate <= 100, 'Error: rate is > 1: rate = ' + str(rate) + ', bases = ' + str(bs) + ', size = ' + str(total_size)
-            rates_within_threshs[t] = rate
-    return rates_within_threshs
@@ -4,7 +4,6 @@
 
 from __future__ import print_function
 from collections import OrderedDict
-import json
 import logging
 import os
 
@@ -25,11 +24,11 @@ class MultiqcModule(BaseMultiqcModule):
 
         # Parse meta information. JSON win!
         self.salmon_meta = dict()
-        for f in self.find_log_files('salmon/meta'):
+        for f in self.find_log_files('salmon/meta', filejson=True):
             # Get the s_name from the parent directory
             s_name = os.path.basename( os.path.dirname(f['root']) )
             s_name = self.clean_s_name(s_name, f['root'])
-            self.salmon_meta[s_name] = json.loads(f['f'])
+            self.salmon_meta[s_name] = f['f']
         # Parse Fragment Length Distribution logs
         self.salmon_fld = dict()
         for f in self.find_log_files('salmon/fld'):
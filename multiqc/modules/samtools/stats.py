@@ -19,10 +19,14 @@ class StatsReportMixin():
         """ Find Samtools stats logs and parse their data """
 
         self.samtools_stats = dict()
-        for f in self.find_log_files('samtools/stats'):
+        for f in self.find_log_files('samtools/stats', filehandles=True):
             parsed_data = dict()
-            for line in f['f'].splitlines():
+            for line in f['f']:
                 if not line.startswith("SN"):
+                    # Only the SN block is used - stop reading at the first
+                    # section after it and skip the large histogram blocks
+                    if len(parsed_data) > 0 and not line.startswith("#"):
+                        break
                     continue
                 sections = line.split("\t")
                 field = sections[1].strip()[:-1]
@@ -14,6 +14,7 @@ import click
 from distutils import version
 from distutils.dir_util import copy_tree
 import errno
+import hashlib
 import io
 import jinja2
 import os
@@ -36,9 +37,11 @@ except ImportError:
     sys.setdefaultencoding('utf8')
 
 from .plots import table
-from .utils import report, plugin_hooks, megaqc, util_functions, lint_helpers, config, log
+from .utils import report, plugin_hooks, megaqc, util_functions, lint_helpers, config, log, partial as partial_run, watch as watch_mode
 
 start_execution_time = time.time()
+# Contents of files included in the report template, kept for later reports in the same process
+included_files = dict()
 logger = config.logger
 
 @click.command(
@@ -124,6 +127,10 @@ logger = config.logger
                     is_flag = True,
                     help = "Supply a file containing a list of file paths to be searched, one per row"
 )
+@click.option('--manifest', 'manifest',
+                    is_flag = True,
+                    help = "Supply a manifest file of paths and search keys, used instead of searching for files"
+)
 @click.option('-e', '--exclude', metavar='[module name]',
                     type = click.Choice(sorted(['general_stats']+list(config.avail_modules.keys()))),
                     multiple = True,
@@ -174,6 +181,22 @@ logger = config.logger
                     is_flag = True,
                     help = "Don't upload generated report to MegaQC, even if MegaQC options are found"
 )
+@click.option('--partial', 'partial',
+                    type = click.Path(),
+                    help = "Save parsed results to a partial-state file instead of making a report"
+)
+@click.option('--merge', 'merge',
+                    is_flag = True,
+                    help = "Make a report from partial-state files, given instead of analysis directories"
+)
+@click.option('--search-only', 'search_only',
+                    type = click.Path(),
+                    help = "Only search for files, saving what was found to an index file that can be used with --manifest"
+)
+@click.option('--watch', 'watch',
+                    is_flag = True,
+                    help = "Keep running and update the report when new results appear"
+)
 @click.option('-c', '--config', 'config_file',
                     type = click.Path(exists=True, readable=True),
                     multiple=True,
@@ -204,8 +227,8 @@ logger = config.logger
 @click.version_option(config.version, prog_name='multiqc')
 
 def run_cli(analysis_dir, dirs, dirs_depth, no_clean_sname, title, report_comment, template, module_tag, module, exclude, outdir,
-ignore, ignore_samples, sample_names, sample_filters, file_list, filename, make_data_dir, no_data_dir, data_format, zip_data_dir, force, ignore_symlinks,
-export_plots, plots_flat, plots_interactive, lint, make_pdf, no_megaqc_upload, config_file, cl_config, verbose, quiet, profile_runtime, no_ansi, **kwargs):
+ignore, ignore_samples, sample_names, sample_filters, file_list, manifest, filename, make_data_dir, no_data_dir, data_format, zip_data_dir, force, ignore_symlinks,
+export_plots, plots_flat, plots_interactive, lint, make_pdf, no_megaqc_upload, partial, merge, search_only, watch, config_file, cl_config, verbose, quiet, profile_runtime, no_ansi, **kwargs):
     """
     Main MultiQC run command for use with the click command line, complete with all click function decorators.
     To make it easy to use MultiQC within notebooks and other locations that don't need click, we simply pass the
@@ -229,6 +252,7 @@ export_plots, plots_flat, plots_interactive, lint, make_pdf, no_megaqc_upload, c
         sample_names=sample_names,
         sample_filters=sample_filters,
         file_list=file_list,
+        manifest=manifest,
         filename=filename,
         make_data_dir=make_data_dir,
         no_data_dir=no_data_dir,
@@ -242,6 +266,10 @@ export_plots, plots_flat, plots_interactive, lint, make_pdf, no_megaqc_upload, c
         lint=lint,
         make_pdf=make_pdf,
         no_megaqc_upload=no_megaqc_upload,
+        partial=partial,
+        merge=merge,
+        search_only=search_only,
+        watch=watch,
         config_file=config_file,
         cl_config=cl_config,
         verbose=verbose,
@@ -272,6 +300,7 @@ def run(
         sample_names = None,
         sample_filters = None,
         file_list = False,
+        manifest = False,
         filename = None,
         make_data_dir = False,
         no_data_dir = False,
@@ -285,6 +314,10 @@ def run(
         lint = False,
         make_pdf = False,
         no_megaqc_upload = False,
+        partial = None,
+        merge = False,
+        search_only = None,
+        watch = False,
         config_file = (),
         cl_config = (),
         verbose = 0,
@@ -383,6 +416,13 @@ def run(
         config.megaqc_upload = False
     else:
         config.megaqc_upload = True
+    if partial is not None:
+        config.partial_file = partial
+    if search_only is not None:
+        config.search_index = search_only
+    if watch:
+        config.watch = True
+        config.force = True
     if sample_names:
         config.load_sample_names(sample_names)
     config.load_show_hide(sample_filters)
@@ -433,6 +473,12 @@ def run(
             logger.error("Please, check that {} contains correct paths.".format(analysis_dir[0]))
             raise ValueError("Any files or directories to be searched.")
 
+    # Use a manifest of files instead of searching if --manifest option is given
+    if manifest:
+        if len(analysis_dir) > 1 or file_list:
+            raise ValueError("If --manifest is given, analysis_dir should be a single manifest file.")
+        config.manifest = analysis_dir[0]
+
     if len(ignore) > 0:
         logger.debug("Ignoring files, directories and paths that match: {}".format(", ".join(ignore)))
         config.fn_ignore_files.extend(ignore)
@@ -462,8 +508,22 @@ def run(
         logger.info("Report title: {}".format(config.title))
     if dirs:
         logger.info("Prepending directory to sample names")
+    if merge and config.partial_file:
+        raise ValueError("--partial and --merge can't be used together.")
+    if (merge or config.partial_file) and sys.version_info < (3, 8):
+        logger.critical("--partial and --merge need Python 3.8 or newer")
+        sys.exit(1)
+    if config.watch and (merge or config.partial_file or filename == 'stdout'):
+        raise ValueError("--watch can't be used with --partial, --merge or printing the report to stdout.")
+    if config.search_index and (merge or config.partial_file or config.watch):
+        raise ValueError("--search-only can't be used with --partial, --merge or --watch.")
     for d in config.analysis_dir:
-        logger.info("Searching   : {}".format(os.path.abspath(d)))
+        if merge:
+            logger.info("Merging     : {}".format(os.path.abspath(d)))
+        elif config.manifest:
+            logger.info("Manifest    : {}".format(os.path.abspath(d)))
+        else:
+            logger.info("Searching   : {}".format(os.path.abspath(d)))
 
     # Prep module configs
     config.top_modules = [ m if type(m) is dict else {m:{}} for m in config.top_modules ]
@@ -518,6 +578,40 @@ def run(
     run_module_names = [ list(m.keys())[0] for m in run_modules ]
     logger.debug("Analysing modules: {}".format(', '.join(run_module_names)))
 
+    # Load the template
+    template_mod = config.avail_templates[config.template].load()
+
+    # Add an output subdirectory if specified by template
+    try:
+        config.output_dir = os.path.join(config.output_dir, template_mod.output_subdir)
+    except AttributeError:
+        pass # No subdirectory variable given
+
+
+    # Add custom content section names
+    try:
+        if 'custom_content' in run_module_names:
+            run_module_names.extend(config.custom_data.keys())
+    except AttributeError:
+        pass # custom_data not in config
+
+    # Make the report, then make it again whenever the analysis results change if watching
+    module_cache = watch_mode.ModuleCache() if config.watch else None
+    skip_generalstats = config.skip_generalstats
+    def make_report():
+        config.skip_generalstats = skip_generalstats
+        return make_report_files(run_modules, run_module_names, template_mod, filename, merge, make_pdf, lint, module_cache)
+    multiqc_run = make_report()
+    if config.watch:
+        watch_mode.watch(make_report)
+        log.move_tmp_log(logger)
+    return multiqc_run
+
+
+def make_report_files(run_modules, run_module_names, template_mod, filename, merge, make_pdf, lint, module_cache=None):
+    """ Run the modules and write the report, data and plot files.
+    Used by run(), after the config has been set up. """
+
     # Create the temporary working directories
     tmp_dir = tempfile.mkdtemp()
     logger.debug('Using temporary directory for creating report: {}'.format(tmp_dir))
@@ -525,6 +619,9 @@ def run(
     if filename != 'stdout' and config.make_data_dir == True:
         config.data_dir = config.data_tmp_dir
         os.makedirs(config.data_dir)
+        # Write data files straight into a zip archive if zipping the data directory
+        if config.zip_data_dir:
+            util_functions.open_data_zip('{}.zip'.format(config.data_tmp_dir))
     else:
         config.data_dir = None
     config.plots_tmp_dir = os.path.join(tmp_dir, 'multiqc_plots')
@@ -534,29 +631,48 @@ def run(
     else:
         config.plots_dir = None
 
-    # Load the template
-    template_mod = config.avail_templates[config.template].load()
-
-    # Add an output subdirectory if specified by template
-    try:
-        config.output_dir = os.path.join(config.output_dir, template_mod.output_subdir)
-    except AttributeError:
-        pass # No subdirectory variable given
-
+    # Copy over css & js files if requested by the theme
+    def copy_module_assets(mod):
+        for assets in [getattr(mod, 'css', {}), getattr(mod, 'js', {})]:
+            try:
+                for to, path in assets.items():
+                    copy_to = os.path.join(tmp_dir, to)
+                    os.makedirs(os.path.dirname(copy_to))
+                    shutil.copyfile(path, copy_to)
+            except OSError as e:
+                if e.errno == errno.EEXIST:
+                    pass
+                else:
+                    raise
 
-    # Add custom content section names
-    try:
-        if 'custom_content' in run_module_names:
-            run_module_names.extend(config.custom_data.keys())
-    except AttributeError:
-        pass # custom_data not in config
+    report.modules_output = list()
+    if merge:
+        # Load the module output from partial runs instead of running the modules
+        partial_run.load_partials(config.analysis_dir)
+        for mod in report.modules_output:
+            copy_module_assets(mod)
+        run_modules = list()
+    elif config.manifest:
+        # Use the files listed in the manifest, without searching
+        report.load_manifest(config.manifest, run_module_names)
+    else:
+        # Get the list of files to search
+        report.get_filelist(run_module_names)
 
-    # Get the list of files to search
-    report.get_filelist(run_module_names)
+    # Save the found files and stop here if only searching
+    if config.search_index:
+        report.write_search_index(config.search_index)
+        util_functions.close_data_zip()
+        shutil.rmtree(tmp_dir)
+        logger.info("MultiQC complete")
+        return {
+            'report': report,
+            'config': config,
+            'sys_exit_code': 0
+        }
 
     # Run the modules!
     plugin_hooks.mqc_trigger('before_modules')
-    report.modules_output = list()
     sys_exit_code = 0
     total_mods_starttime = time.time()
     for mod_idx, mod_dict in enumerate(run_modules):
@@ -566,41 +682,20 @@ def run(
             mod_cust_config = list(mod_dict.values())[0]
             mod = config.avail_modules[this_module].load()
             mod.mod_cust_config = mod_cust_config # feels bad doing this, but seems to work
-            output = mod()
+            if module_cache is not None:
+                output = module_cache.run((mod_idx, this_module), mod)
+            else:
+                output = mod()
             if type(output) != list:
                 output = [output]
             for m in output:
                 report.modules_output.append(m)
-
-            # Copy over css & js files if requested by the theme
-            try:
-                for to, path in report.modules_output[-1].css.items():
-                    copy_to = os.path.join(tmp_dir, to)
-                    os.makedirs(os.path.dirname(copy_to))
-                    shutil.copyfile(path, copy_to)
-            except OSError as e:
-                if e.errno == errno.EEXIST:
-                    pass
-                else:
-                    raise
-            except AttributeError:
-                pass
-            try:
-                for to, path in report.modules_output[-1].js.items():
-                    copy_to = os.path.join(tmp_dir, to)
-                    os.makedirs(os.path.dirname(copy_to))
-                    shutil.copyfile(path, copy_to)
-            except OSError as e:
-                if e.errno == errno.EEXIST:
-                    pass
-                else:
-                    raise
-            except AttributeError:
-                pass
+            copy_module_assets(report.modules_output[-1])
 
         except UserWarning:
             logger.debug("No samples found: {}".format(list(mod_dict.keys())[0]))
         except KeyboardInterrupt:
+            util_functions.close_data_zip()
             shutil.rmtree(tmp_dir)
             logger.critical(
                     "User Cancelled Execution!\n{eq}\n{tb}{eq}\n"
@@ -621,6 +716,18 @@ def run(
         report.runtimes['mods'][run_module_names[mod_idx]] = time.time() - mod_starttime
     report.runtimes['total_mods'] = time.time() - total_mods_starttime
 
+    # Save the results and stop here if this is a partial run
+    if config.partial_file:
+        partial_run.write_partial(config.partial_file)
+        util_functions.close_data_zip()
+        shutil.rmtree(tmp_dir)
+        logger.info("MultiQC complete")
+        return {
+            'report': report,
+            'config': config,
+            'sys_exit_code': sys_exit_code
+        }
+
     # Special-case module if we want to profile the MultiQC running time
     if config.profile_runtime:
         from multiqc.utils import profile_runtime
@@ -629,8 +736,15 @@ def run(
     # Did we find anything?
     if len(report.modules_output) == 0:
         logger.warning("No analysis results found. Cleaning up..")
+        util_functions.close_data_zip()
         shutil.rmtree(tmp_dir)
         logger.info("MultiQC complete")
+        if config.watch:
+            return {
+                'report': report,
+                'config': config,
+                'sys_exit_code': sys_exit_code
+            }
         # Exit with an error code if a module broke
         sys.exit(sys_exit_code)
 
@@ -689,11 +803,7 @@ def run(
     plugin_hooks.mqc_trigger('after_modules')
 
     # Remove empty data sections from the General Stats table
-    empty_keys = [i for i, d in enumerate(report.general_stats_data[:]) if len(d) == 0]
-    empty_keys.sort(reverse=True)
-    for i in empty_keys:
-        del report.general_stats_data[i]
-        del report.general_stats_headers[i]
+    report.general_stats_data.remove_empty_sections()
     # Add general-stats IDs to table row headers
     for idx, h in enumerate(report.general_stats_headers):
         for k in h.keys():
@@ -779,9 +889,17 @@ def run(
         else:
             # Make directories for data_dir
             logger.info("Data        : {}".format(os.path.relpath(config.data_dir)))
-            # Modules have run, so data directory should be complete by now. Move its contents.
-            logger.debug("Moving data file from '{}' to '{}'".format(config.data_tmp_dir, config.data_dir))
-            copy_tree(config.data_tmp_dir, config.data_dir)
+            if config.zip_data_dir:
+                # Data files were written into a zip archive, which just needs any files
+                # written straight into the data directory adding, and moving into place
+                util_functions.add_dir_to_data_zip(config.data_tmp_dir)
+                util_functions.close_data_zip()
+                logger.debug("Moving data zip from '{}.zip' to '{}.zip'".format(config.data_tmp_dir, config.data_dir))
+                shutil.move('{}.zip'.format(config.data_tmp_dir), '{}.zip'.format(config.data_dir))
+            else:
+                # Modules have run, so data directory should be complete by now. Move its contents.
+                logger.debug("Moving data file from '{}' to '{}'".format(config.data_tmp_dir, config.data_dir))
+                copy_tree(config.data_tmp_dir, config.data_dir)
             shutil.rmtree(config.data_tmp_dir)
 
         # Copy across the static plot images if requested
@@ -794,6 +912,7 @@ def run(
                 else:
                     logger.error("Output directory {} already exists.".format(config.plots_dir))
                     logger.info("Use -f or --force to overwrite existing reports")
+                    util_functions.close_data_zip()
                     shutil.rmtree(tmp_dir)
                     sys.exit(1)
             logger.info("Plots       : {}".format(os.path.relpath(config.plots_dir)))
@@ -805,33 +924,77 @@ def run(
 
     plugin_hooks.mqc_trigger('before_template')
 
-    # Load in parent template files first if a child theme
+    # Template files are used where they are installed, without copying. Files in
+    # the template override the parent template (if a child theme) and module assets.
+    template_dirs = [template_mod.template_dir]
     try:
         parent_template = config.avail_templates[template_mod.template_parent].load()
-        copy_tree(parent_template.template_dir, tmp_dir)
+        template_dirs.append(parent_template.template_dir)
     except AttributeError:
         pass # Not a child theme
-
-    # Copy the template files to the tmp directory (distutils overwrites parent theme files)
-    copy_tree(template_mod.template_dir, tmp_dir)
+    template_dirs.append(tmp_dir)
 
     # Function to include file contents in Jinja template
-    def include_file(name, fdir=tmp_dir, b64=False):
+    def include_file(name, fdir=template_dirs, b64=False):
+        if fdir is None:
+            fdir = ''
+        if isinstance(fdir, list):
+            path = next((os.path.join(d, name) for d in fdir if os.path.exists(os.path.join(d, name))), name)
+        else:
+            path = os.path.join(fdir, name)
         try:
-            if fdir is None:
-                fdir = ''
-            if b64:
-                with io.open (os.path.join(fdir, name), "rb") as f:
-                    return base64.b64encode(f.read()).decode('utf-8')
-            else:
-                with io.open (os.path.join(fdir, name), "r", encoding='utf-8') as f:
-                    return f.read()
+            # Files such as fonts and scripts are only read and encoded once
+            cache_key = (os.path.realpath(path), b64, os.path.getmtime(path))
+            if cache_key not in included_files:
+                if b64:
+                    included_files[cache_key] = include_b64_file(path)
+                else:
+                    with io.open (path, "r", encoding='utf-8') as f:
+                        included_files[cache_key] = f.read()
+            return included_files[cache_key]
         except (OSError, IOError) as e:
             logger.error("Could not include file '{}': {}".format(name, e))
 
-    # Load the report template
+    # Base64-encoded files are also cached on disk for later runs, next to the
+    # compiled templates. Cache files are keyed by the path, mtime and size.
+    asset_cache = dict()
+    def include_b64_file(path):
+        cache_fn = None
+        if asset_cache.get('dir') is not None:
+            st = os.stat(path)
+            key = '{}\0{!r}\0{}'.format(os.path.realpath(path), st.st_mtime, st.st_size)
+            cache_fn = os.path.join(asset_cache['dir'], '__multiqc_asset_{}.cache'.format(hashlib.sha1(key.encode('utf-8')).hexdigest()))
+            try:
+                with io.open (cache_fn, "r", encoding='utf-8') as f:
+                    return f.read()
+            except (OSError, IOError):
+                pass # Not cached yet
+        with io.open (path, "rb") as f:
+            encoded = base64.b64encode(f.read()).decode('utf-8')
+        if cache_fn is not None:
+            # Write to a temporary file first, so that other runs never read a partly written file
+            tmp_fn = None
+            try:
+                fd, tmp_fn = tempfile.mkstemp(dir=asset_cache['dir'])
+                with io.open (fd, "w", encoding='utf-8') as f:
+                    f.write(encoded)
+                os.rename(tmp_fn, cache_fn)
+            except (OSError, IOError) as e:
+                logger.debug("Could not cache encoded file '{}': {}".format(path, e))
+                if tmp_fn is not None and os.path.exists(tmp_fn):
+                    os.remove(tmp_fn)
+        return encoded
+
+    # Load the report template, caching the compiled templates on disk if configured
     try:
-        env = jinja2.Environment(loader=jinja2.FileSystemLoader(tmp_dir))
+        bytecode_cache = None
+        if config.template_bytecode_cache:
+            cache_dir = config.template_bytecode_cache_dir
+            if cache_dir is not None and not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+            asset_cache['dir'] = bytecode_cache.directory
+        env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dirs), bytecode_cache=bytecode_cache)
         env.globals['include_file'] = include_file
         j_template = env.get_template(template_mod.base_fn)
     except:
@@ -849,23 +1012,19 @@ def run(
         except IOError as e:
             raise IOError ("Could not print report to '{}' - {}".format(config.output_fn, IOError(e)))
 
-        # Copy over files if requested by the theme
+        # Copy over files if requested by the theme, template files last so that they take precedence
         try:
             for f in template_mod.copy_files:
-                fn = os.path.join(tmp_dir, f)
                 dest_dir = os.path.join( os.path.dirname(config.output_fn), f)
-                copy_tree(fn, dest_dir)
+                for d in reversed(template_dirs):
+                    if os.path.exists(os.path.join(d, f)):
+                        copy_tree(os.path.join(d, f), dest_dir)
         except AttributeError:
             pass # No files to copy
 
     # Clean up temporary directory
     shutil.rmtree(tmp_dir)
 
-    # Zip the data directory if requested
-    if config.zip_data_dir and config.data_dir is not None:
-        shutil.make_archive(config.data_dir, 'zip', config.data_dir)
-        shutil.rmtree(config.data_dir)
-
     # Try to create a PDF if requested
     if make_pdf:
         try:
@@ -910,8 +1069,9 @@ def run(
         logger.error("Found {} linting errors!\n{}".format(len(report.lint_errors), "\n".join(report.lint_errors)))
         sys_exit_code = 1
 
-    # Move the log file into the data directory
-    log.move_tmp_log(logger)
+    # Move the log file into the data directory, once we've finished watching
+    if not config.watch:
+        log.move_tmp_log(logger)
 
     # Return the running information from the run:
     #
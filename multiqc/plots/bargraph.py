@@ -9,12 +9,13 @@ import inspect
 import io
 import logging
 import math
+import numpy as np
 import os
 import random
 import re
 import sys
 
-from multiqc.utils import config, report, util_functions
+from multiqc.utils import config, partial, report, util_functions
 logger = logging.getLogger(__name__)
 
 try:
@@ -41,6 +42,7 @@ def get_template_mod():
         _template_mod = config.avail_templates[config.template].load()
     return _template_mod
 
+@partial.record_plot('bargraph')
 def plot (data, cats = None, pconfig = None):
     """ Plot a horizontal bar graph. Expects a 2D dict of sample
     data. Also can take info about categories. There are quite a
@@ -103,11 +105,7 @@ def plot (data, cats = None, pconfig = None):
         try:
             cats[idx]
         except (IndexError):
-            cats.append(list())
-            for s in data[idx].keys():
-                for k in data[idx][s].keys():
-                    if k not in cats[idx]:
-                        cats[idx].append(k)
+            cats.append(list(OrderedDict.fromkeys(k for s in data[idx].keys() for k in data[idx][s].keys())))
 
     # If we have cats in lists, turn them into dicts
     for idx, cat in enumerate(cats):
@@ -132,39 +130,7 @@ def plot (data, cats = None, pconfig = None):
     plotsamples = list()
     plotdata = list()
     for idx, d in enumerate(data):
-        if isinstance(d, OrderedDict):
-            hc_samples = list(d.keys())
-        else:
-            hc_samples = sorted(list(d.keys()))
-        hc_data = list()
-        sample_dcount = dict()
-        for c in cats[idx].keys():
-            thisdata = list()
-            catcount = 0
-            for s in hc_samples:
-                if s not in sample_dcount:
-                    sample_dcount[s] = 0
-                try:
-                    thisdata.append(float(d[s][c]))
-                    catcount += 1
-                    sample_dcount[s] += 1
-                except (KeyError, ValueError):
-                    # Pad with NaNs when we have missing categories in a sample
-                    thisdata.append(float('nan'))
-            if catcount > 0:
-                if pconfig.get('hide_zero_cats', True) is False or max(x for x in thisdata if not math.isnan(x)) > 0:
-                    thisdict = { 'name': cats[idx][c]['name'], 'data': thisdata }
-                    if 'color' in cats[idx][c]:
-                        thisdict['color'] = cats[idx][c]['color']
-                    hc_data.append(thisdict)
-
-        # Remove empty samples
-        for s, c in sample_dcount.items():
-            if c == 0:
-                idx = hc_samples.index(s)
-                del hc_samples[idx]
-                for j, d in enumerate(hc_data):
-                    del hc_data[j]['data'][idx]
+        hc_samples, hc_data = parse_data(d, cats[idx], pconfig.get('hide_zero_cats', True) is not False)
         if len(hc_data) > 0:
             plotsamples.append(hc_samples)
             plotdata.append(hc_data)
@@ -193,6 +159,54 @@ def plot (data, cats = None, pconfig = None):
 
 
 
+def parse_data (d, cats, hide_zero_cats=True):
+    """
+    Build the category x sample matrix for one dataset with NumPy, padding
+    missing values with NaNs, then drop categories and samples without any
+    values (and categories with no values above zero if hide_zero_cats).
+    Returns the list of samples and the list of series for HighCharts.
+    """
+    if isinstance(d, OrderedDict):
+        hc_samples = list(d.keys())
+    else:
+        hc_samples = sorted(d.keys())
+    cat_idx = dict((c, i) for i, c in enumerate(cats.keys()))
+    values = np.full((len(cat_idx), len(hc_samples)), np.nan)
+    found = np.zeros(values.shape, dtype=bool)
+    for s_idx, s in enumerate(hc_samples):
+        sdata = d[s]
+        # Look up whichever is shorter - the sample's keys or the categories
+        if len(sdata) < len(cat_idx):
+            pairs = ((cat_idx.get(k), v) for k, v in sdata.items())
+        else:
+            pairs = ((c_idx, sdata[c]) for c, c_idx in cat_idx.items() if c in sdata)
+        for c_idx, v in pairs:
+            if c_idx is None:
+                continue
+            try:
+                values[c_idx, s_idx] = float(v)
+                found[c_idx, s_idx] = True
+            except (TypeError, ValueError):
+                pass
+
+    show_cats = found.any(axis=1)
+    if hide_zero_cats:
+        show_cats &= np.where(found & ~np.isnan(values), values, -np.inf).max(axis=1, initial=-np.inf) > 0
+    show_samples = found.any(axis=0)
+    if not show_samples.all():
+        values = values[:, show_samples]
+        hc_samples = [s for s, show in zip(hc_samples, show_samples) if show]
+
+    hc_data = list()
+    for c, c_idx in cat_idx.items():
+        if show_cats[c_idx]:
+            thisdict = { 'name': cats[c]['name'], 'data': values[c_idx].tolist() }
+            if 'color' in cats[c]:
+                thisdict['color'] = cats[c]['color']
+            hc_data.append(thisdict)
+    return hc_samples, hc_data
+
+
 def highcharts_bargraph (plotdata, plotsamples=None, pconfig=None):
     """
     Build the HTML needed for a HighCharts bar graph. Should be
@@ -260,6 +274,12 @@ def highcharts_bargraph (plotdata, plotsamples=None, pconfig=None):
             html += '<button class="btn btn-default btn-sm {a}" data-action="set_data" {y} {ym} data-newdata="{k}" data-target="{id}">{n}</button>\n'.format(a=active, id=pconfig['id'], n=name, y=ylab, ym=ymax, k=k)
         html += '</div>\n\n'
 
+    # Buttons to page through very large plots, filled in by the JavaScript
+    page_size = config.plots_bargraph_page_size
+    paged = bool(page_size) and max(len(s) for s in plotsamples) > page_size
+    if paged:
+        html += '<div class="btn-group hc_switch_group mqc_bargraph_pages" data-target="{id}"></div>\n'.format(id=pconfig['id'])
+
     # Plot HTML
     html += """<div class="hc-plot-wrapper">
         <div id="{id}" class="hc-plot not_rendered hc-bar-plot"><small>loading..</small></div>
@@ -273,6 +293,8 @@ def highcharts_bargraph (plotdata, plotsamples=None, pconfig=None):
         'datasets': plotdata,
         'config': pconfig
     }
+    if paged:
+        report.plot_data[pconfig['id']]['page_size'] = page_size
 
     return html
 
@@ -5,13 +5,14 @@
 import logging
 import random
 
-from multiqc.utils import config, report
+from multiqc.utils import config, partial, report
 from multiqc.plots import table_object
 
 logger = logging.getLogger(__name__)
 
 letters = 'abcdefghijklmnopqrstuvwxyz'
 
+@partial.record_plot('beeswarm')
 def plot (data, headers=None, pconfig=None):
     """ Helper HTML for a beeswarm plot.
     :param data: A list of data dicts
@@ -65,16 +66,13 @@ def make_plot(dt):
             # Add the data
             thisdata = []
             these_snames = []
-            for (s_name, samp) in dt.data[idx].items():
-                if k in samp:
+            for (s_name, val) in dt.get_column_items(idx, k):
 
-                    val = samp[k]
+                if 'modify' in header and callable(header['modify']):
+                    val = header['modify'](val)
 
-                    if 'modify' in header and callable(header['modify']):
-                        val = header['modify'](val)
-
-                    thisdata.append(val)
-                    these_snames.append(s_name)
+                thisdata.append(val)
+                these_snames.append(s_name)
 
             data.append(thisdata)
             s_names.append(these_snames)
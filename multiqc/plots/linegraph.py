@@ -13,7 +13,7 @@ import random
 import re
 import sys
 
-from multiqc.utils import config, report, util_functions
+from multiqc.utils import config, partial, report, util_functions
 logger = logging.getLogger(__name__)
 
 try:
@@ -40,6 +40,7 @@ def get_template_mod():
         _template_mod = config.avail_templates[config.template].load()
     return _template_mod
 
+@partial.record_plot('linegraph')
 def plot (data, pconfig=None):
     """ Plot a line graph with X,Y data.
     :param data: 2D dict, first keys as sample names, then x:y data pairs
@@ -344,7 +345,7 @@ def matplotlib_linegraph (plotdata, pconfig=None):
                 fout += "\n{}\t".format(d['name'])
                 fout += "\t".join([str(x[1]) for x in d['data']])
                 fout += "\n"
-            with io.open (os.path.join(config.data_dir, '{}.txt'.format(pid)), 'w', encoding='utf-8') as f:
+            with util_functions.open_data_file('{}.txt'.format(pid)) as f:
                 print( fout.encode('utf-8', 'ignore').decode('utf-8'), file=f )
         else:
             util_functions.write_data_file(fdata, pid)
@@ -6,12 +6,13 @@ from collections import defaultdict, OrderedDict
 import logging
 import random
 
-from multiqc.utils import config, report, util_functions, mqc_colour
+from multiqc.utils import config, partial, report, util_functions, mqc_colour
 from multiqc.plots import table_object, beeswarm
 logger = logging.getLogger(__name__)
 
 letters = 'abcdefghijklmnopqrstuvwxyz'
 
+@partial.record_plot('table')
 def plot (data, headers=None, pconfig=None):
     """ Return HTML for a MultiQC table.
     :param data: 2D dict, first keys as sample names, then x:y data pairs
@@ -32,10 +33,7 @@ def plot (data, headers=None, pconfig=None):
     dt = table_object.datatable(data, headers, pconfig)
 
     # Collect unique sample names
-    s_names = set()
-    for d in dt.data:
-        for s_name in d.keys():
-            s_names.add(s_name)
+    s_names = dt.get_sample_names()
 
     # Make a beeswarm plot if we have lots of samples
     if len(s_names) >= config.max_table_rows and pconfig.get('no_beeswarm') is not True:
@@ -129,103 +127,101 @@ def make_table (dt):
             c_scale = mqc_colour.mqc_colour_scale(header['scale'], header['dmin'], header['dmax'])
 
         # Add the data table cells
-        for (s_name, samp) in dt.data[idx].items():
-            if k in samp:
-                val = samp[k]
-                kname = '{}_{}'.format(header['namespace'], rid)
-                dt.raw_vals[s_name][kname] = val
-
-                if 'modify' in header and callable(header['modify']):
-                    val = header['modify'](val)
-
+        for (s_name, val) in dt.get_column_items(idx, k):
+            kname = '{}_{}'.format(header['namespace'], rid)
+            dt.raw_vals[s_name][kname] = val
+
+            if 'modify' in header and callable(header['modify']):
+                val = header['modify'](val)
+
+            try:
+                dmin = header['dmin']
+                dmax = header['dmax']
+                percentage = ((float(val) - dmin) / (dmax - dmin)) * 100
+                percentage = min(percentage, 100)
+                percentage = max(percentage, 0)
+            except (ZeroDivisionError,ValueError):
+                percentage = 0
+
+            try:
+                valstring = str(header['format'].format(val))
+            except ValueError:
                 try:
-                    dmin = header['dmin']
-                    dmax = header['dmax']
-                    percentage = ((float(val) - dmin) / (dmax - dmin)) * 100
-                    percentage = min(percentage, 100)
-                    percentage = max(percentage, 0)
-                except (ZeroDivisionError,ValueError):
-                    percentage = 0
-
-                try:
-                    valstring = str(header['format'].format(val))
+                    valstring = str(header['format'].format(float(val)))
                 except ValueError:
-                    try:
-                        valstring = str(header['format'].format(float(val)))
-                    except ValueError:
-                        valstring = str(val)
-                except:
                     valstring = str(val)
-
-                # This is horrible, but Python locale settings are worse
-                if config.thousandsSep_format is None:
-                    config.thousandsSep_format = '<span class="mqc_thousandSep"></span>'
-                if config.decimalPoint_format is None:
-                    config.decimalPoint_format = '.'
-                valstring = valstring.replace('.', 'DECIMAL').replace(',', 'THOUSAND')
-                valstring = valstring.replace('DECIMAL', config.decimalPoint_format).replace('THOUSAND', config.thousandsSep_format)
-
-                # Percentage suffixes etc
-                valstring += header.get('suffix', '')
-
-                # Conditional formatting
-                cmatches = { cfck: False for cfc in config.table_cond_formatting_colours for cfck in cfc }
-                # Find general rules followed by column-specific rules
-                for cfk in ['all_columns', rid]:
-                    if cfk in config.table_cond_formatting_rules:
-                        # Loop through match types
-                        for ftype in cmatches.keys():
-                            # Loop through array of comparison types
-                            for cmp in config.table_cond_formatting_rules[cfk].get(ftype, []):
-                                try:
-                                    # Each comparison should be a dict with single key: val
-                                    if 's_eq' in cmp and str(cmp['s_eq']).lower() == str(val).lower():
-                                        cmatches[ftype] = True
-                                    if 's_contains' in cmp and str(cmp['s_contains']).lower() in str(val).lower():
-                                        cmatches[ftype] = True
-                                    if 's_ne' in cmp and str(cmp['s_ne']).lower() != str(val).lower():
-                                        cmatches[ftype] = True
-                                    if 'eq' in cmp and float(cmp['eq']) == float(val):
-                                        cmatches[ftype] = True
-                                    if 'ne' in cmp and float(cmp['ne']) != float(val):
-                                        cmatches[ftype] = True
-                                    if 'gt' in cmp and float(cmp['gt']) < float(val):
-                                        cmatches[ftype] = True
-                                    if 'lt' in cmp and float(cmp['lt']) > float(val):
-                                        cmatches[ftype] = True
-                                except:
-                                    logger.warning("Not able to apply table conditional formatting to '{}' ({})".format(val, cmp))
-                # Apply HTML in order of config keys
-                bgcol = None
-                for cfc in config.table_cond_formatting_colours:
-                    for cfck in cfc: # should always be one, but you never know
-                        if cmatches[cfck]:
-                            bgcol = cfc[cfck]
-                if bgcol is not None:
-                    valstring = '<span class="badge" style="background-color:{}">{}</span>'.format(bgcol, valstring)
-
-                # Build HTML
-                if not header['scale']:
-                    if s_name not in t_rows:
-                        t_rows[s_name] = dict()
-                    t_rows[s_name][rid] = '<td class="{rid} {h}">{v}</td>'.format(rid=rid, h=hide, v=valstring)
+            except:
+                valstring = str(val)
+
+            # This is horrible, but Python locale settings are worse
+            if config.thousandsSep_format is None:
+                config.thousandsSep_format = '<span class="mqc_thousandSep"></span>'
+            if config.decimalPoint_format is None:
+                config.decimalPoint_format = '.'
+            valstring = valstring.replace('.', 'DECIMAL').replace(',', 'THOUSAND')
+            valstring = valstring.replace('DECIMAL', config.decimalPoint_format).replace('THOUSAND', config.thousandsSep_format)
+
+            # Percentage suffixes etc
+            valstring += header.get('suffix', '')
+
+            # Conditional formatting
+            cmatches = { cfck: False for cfc in config.table_cond_formatting_colours for cfck in cfc }
+            # Find general rules followed by column-specific rules
+            for cfk in ['all_columns', rid]:
+                if cfk in config.table_cond_formatting_rules:
+                    # Loop through match types
+                    for ftype in cmatches.keys():
+                        # Loop through array of comparison types
+                        for cmp in config.table_cond_formatting_rules[cfk].get(ftype, []):
+                            try:
+                                # Each comparison should be a dict with single key: val
+                                if 's_eq' in cmp and str(cmp['s_eq']).lower() == str(val).lower():
+                                    cmatches[ftype] = True
+                                if 's_contains' in cmp and str(cmp['s_contains']).lower() in str(val).lower():
+                                    cmatches[ftype] = True
+                                if 's_ne' in cmp and str(cmp['s_ne']).lower() != str(val).lower():
+                                    cmatches[ftype] = True
+                                if 'eq' in cmp and float(cmp['eq']) == float(val):
+                                    cmatches[ftype] = True
+                                if 'ne' in cmp and float(cmp['ne']) != float(val):
+                                    cmatches[ftype] = True
+                                if 'gt' in cmp and float(cmp['gt']) < float(val):
+                                    cmatches[ftype] = True
+                                if 'lt' in cmp and float(cmp['lt']) > float(val):
+                                    cmatches[ftype] = True
+                            except:
+                                logger.warning("Not able to apply table conditional formatting to '{}' ({})".format(val, cmp))
+            # Apply HTML in order of config keys
+            bgcol = None
+            for cfc in config.table_cond_formatting_colours:
+                for cfck in cfc: # should always be one, but you never know
+                    if cmatches[cfck]:
+                        bgcol = cfc[cfck]
+            if bgcol is not None:
+                valstring = '<span class="badge" style="background-color:{}">{}</span>'.format(bgcol, valstring)
+
+            # Build HTML
+            if not header['scale']:
+                if s_name not in t_rows:
+                    t_rows[s_name] = dict()
+                t_rows[s_name][rid] = '<td class="{rid} {h}">{v}</td>'.format(rid=rid, h=hide, v=valstring)
+            else:
+                if c_scale is not None:
+                    col = ' background-color:{};'.format(c_scale.get_colour(val))
                 else:
-                    if c_scale is not None:
-                        col = ' background-color:{};'.format(c_scale.get_colour(val))
-                    else:
-                        col = ''
-                    bar_html = '<span class="bar" style="width:{}%;{}"></span>'.format(percentage, col)
-                    val_html = '<span class="val">{}</span>'.format(valstring)
-                    wrapper_html = '<div class="wrapper">{}{}</div>'.format(bar_html, val_html)
-
-                    if s_name not in t_rows:
-                        t_rows[s_name] = dict()
-                    t_rows[s_name][rid] = '<td class="data-coloured {rid} {h}">{c}</td>'.format(rid=rid, h=hide, c=wrapper_html)
-
-                # Is this cell hidden or empty?
-                if s_name not in t_rows_empty:
-                    t_rows_empty[s_name] = dict()
-                t_rows_empty[s_name][rid] = header.get('hidden', False) or str(val).strip() == ''
+                    col = ''
+                bar_html = '<span class="bar" style="width:{}%;{}"></span>'.format(percentage, col)
+                val_html = '<span class="val">{}</span>'.format(valstring)
+                wrapper_html = '<div class="wrapper">{}{}</div>'.format(bar_html, val_html)
+
+                if s_name not in t_rows:
+                    t_rows[s_name] = dict()
+                t_rows[s_name][rid] = '<td class="data-coloured {rid} {h}">{c}</td>'.format(rid=rid, h=hide, c=wrapper_html)
+
+            # Is this cell hidden or empty?
+            if s_name not in t_rows_empty:
+                t_rows_empty[s_name] = dict()
+            t_rows_empty[s_name][rid] = header.get('hidden', False) or str(val).strip() == ''
 
         # Remove header if we don't have any filled cells for it
         if sum([len(rows) for rows in t_rows.values()]) == 0:
@@ -6,7 +6,7 @@ from collections import defaultdict, OrderedDict
 import logging
 import re
 
-from multiqc.utils import config, report
+from multiqc.utils import config, report, general_stats
 
 logger = logging.getLogger(__name__)
 
@@ -21,17 +21,21 @@ class datatable (object):
         if pconfig is None:
             pconfig = {}
 
+        # General Stats data is already in columns, with a shared sample index
+        self.columnar = isinstance(data, general_stats.GeneralStatsData)
+
         # Given one dataset - turn it into a list
-        if type(data) is not list:
+        if type(data) is not list and not self.columnar:
             data = [data]
         if type(headers) is not list:
             headers = [headers]
+        self.data = data
 
         sectcols = ['55,126,184', '77,175,74', '152,78,163', '255,127,0', '228,26,28', '255,255,51', '166,86,40', '247,129,191', '153,153,153']
         shared_keys = defaultdict(lambda: dict())
 
         # Go through each table section
-        for idx, d in enumerate(data):
+        for idx, d in enumerate(data.sections if self.columnar else data):
 
             # Get the header keys
             try:
@@ -44,11 +48,14 @@ class datatable (object):
             if pconfig.get('only_defined_headers', True) is False:
 
                 # Get the keys from the data
-                keys = list()
-                for samp in d.values():
-                    for k in samp.keys():
-                        if k not in keys:
-                            keys.append(k)
+                if self.columnar:
+                    keys = list(d.keys())
+                else:
+                    keys = list()
+                    for samp in d.values():
+                        for k in samp.keys():
+                            if k not in keys:
+                                keys.append(k)
 
                 # If we don't have a headers dict for this data set yet, create one
                 try:
@@ -71,21 +78,26 @@ class datatable (object):
             for k in list(headers[idx].keys()):
                 headers[idx][str(k)] = headers[idx].pop(k)
             # Ensure that all sample names are strings as well
-            cdata = OrderedDict()
-            for k,v in data[idx].items():
-                cdata[str(k)] = v
-            data[idx] = cdata
-            for s_name in data[idx].keys():
-                for k in list(data[idx][s_name].keys()):
-                    data[idx][s_name][str(k)] = data[idx][s_name].pop(k)
+            # (columnar General Stats data is converted when it is added)
+            if not self.columnar:
+                cdata = OrderedDict()
+                for k,v in data[idx].items():
+                    cdata[str(k)] = v
+                data[idx] = cdata
+                for s_name in data[idx].keys():
+                    for k in list(data[idx][s_name].keys()):
+                        data[idx][s_name][str(k)] = data[idx][s_name].pop(k)
 
             # Check that we have some data in each column
             empties = list()
             for k in keys:
-                n = 0
-                for samp in d.values():
-                    if k in samp:
-                        n += 1
+                if self.columnar:
+                    n = d[k].count() if k in d else 0
+                else:
+                    n = 0
+                    for samp in d.values():
+                        if k in samp:
+                            n += 1
                 if n == 0:
                     empties.append(k)
             for k in empties:
@@ -178,9 +190,9 @@ class datatable (object):
 
                 # Figure out the min / max if not supplied
                 if setdmax or setdmin:
-                    for s_name, samp in data[idx].items():
+                    for s_name, val in self.get_column_items(idx, k):
                         try:
-                            val = float(samp[k])
+                            val = float(val)
                             if callable(headers[idx][k]['modify']):
                                 val = float(headers[idx][k]['modify'](val))
                             if setdmax:
@@ -188,9 +200,7 @@ class datatable (object):
                             if setdmin:
                                 headers[idx][k]['dmin'] = min(headers[idx][k]['dmin'], val)
                         except ValueError:
-                            val = samp[k] # couldn't convert to float - keep as a string
-                        except KeyError:
-                            pass # missing data - skip
+                            pass # couldn't convert to float - keep as a string
                     # Limit auto-generated scales with floor, ceiling and minRange.
                     if headers[idx][k]['ceiling'] is not None and headers[idx][k]['max'] is None:
                         headers[idx][k]['dmax'] = min(headers[idx][k]['dmax'], float(headers[idx][k]['ceiling']))
@@ -232,16 +242,48 @@ class datatable (object):
 
         # Skip any data that is not used in the table
         # Would be ignored for making the table anyway, but can affect whether a beeswarm plot is used
-        for idx, d in enumerate(data):
-            for s_name in list(d.keys()):
-                if not any ( h in data[idx][s_name].keys() for h in headers[idx]):
-                    del(data[idx][s_name])
+        # Columnar data only ever gives samples with values for the header keys
+        if not self.columnar:
+            for idx, d in enumerate(data):
+                for s_name in list(d.keys()):
+                    if not any ( h in data[idx][s_name].keys() for h in headers[idx]):
+                        del(data[idx][s_name])
 
         # Assign to class
         self.data = data
         self.headers = headers
         self.pconfig = pconfig
 
+    def get_column_items(self, idx, k):
+        """ Yield (sample name, value) for every sample with a value
+        for column k in table section idx """
+        if self.columnar:
+            column = self.data.sections[idx].get(k)
+            if column is not None:
+                for s_name, val in column.items(self.data.s_names):
+                    yield s_name, val
+        else:
+            for s_name, samp in self.data[idx].items():
+                if k in samp:
+                    yield s_name, samp[k]
+
+    def get_sample_names(self):
+        """ Set of all sample names with data in the table """
+        s_names = set()
+        if self.columnar:
+            # Collect the sample registry IDs first, then look up each name once
+            rows = set()
+            for idx, hs in enumerate(self.headers):
+                for k in hs:
+                    column = self.data.sections[idx].get(k)
+                    if column is not None:
+                        rows.update(column.rows())
+            s_names.update(self.data.s_names[row] for row in rows)
+        else:
+            for d in self.data:
+                s_names.update(d.keys())
+        return s_names
+
     def get_headers_in_order(self):
         """Gets the headers in the order they want to be displayed.
            Returns a list of triplets: (idx, key, header_info)
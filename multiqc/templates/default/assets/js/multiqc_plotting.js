@@ -87,6 +87,14 @@ $(function () {
     }
   });
 
+  // Page through the samples of large bar graphs
+  $('body').on('click', '.mqc_bargraph_pages button', function(e){
+    e.preventDefault();
+    var target = $(this).parent().data('target');
+    mqc_plots[target]['page'] = $(this).data('page');
+    plot_graph(target);
+  });
+
   // Render all plots from header
   $('#mqc-render-all-plots').click(function(){
     $('.hc-plot.not_rendered').each(function(){
@@ -266,7 +274,12 @@ function plot_graph(target, ds, max_num){
   }
   // Bar graphs
   else if(mqc_plots[target]['plot_type'] == 'bar_graph'){
-    if(max_num === undefined || mqc_plots[target]['samples'][0].length < max_num){
+    // Paged bar graphs only plot one page of samples at a time
+    var num_samples = mqc_plots[target]['samples'][0].length;
+    if(mqc_plots[target]['page_size'] !== undefined){
+      num_samples = Math.min(num_samples, mqc_plots[target]['page_size']);
+    }
+    if(max_num === undefined || num_samples < max_num){
       plot_stacked_bar_graph(target, ds);
       $('#'+target).removeClass('not_rendered');
     } else {
@@ -492,9 +505,12 @@ function plot_stacked_bar_graph(target, ds){
   if(ds === undefined){ ds = 0; }
 
   // Make a clone of the everything, so that we can mess with it,
-  // while keeping the original data in tact
-  var data = JSON.parse(JSON.stringify(mqc_plots[target]['datasets'][ds]));
-  var cats = JSON.parse(JSON.stringify(mqc_plots[target]['samples'][ds]));
+  // while keeping the original data in tact. Series only hold arrays
+  // of numbers, so copying the arrays is enough (and much quicker).
+  var data = $.map(mqc_plots[target]['datasets'][ds], function(d){
+    return $.extend({}, d, {'data': d['data'].slice()});
+  });
+  var cats = mqc_plots[target]['samples'][ds].slice();
   var config = JSON.parse(JSON.stringify(mqc_plots[target]['config']));
 
   if (config['stacking'] === undefined){ config['stacking'] = 'normal'; }
@@ -593,6 +609,26 @@ function plot_stacked_bar_graph(target, ds){
     }
   }
 
+  // Only plot one page of samples for very large bar graphs
+  if(mqc_plots[target]['page_size'] !== undefined){
+    var page_size = mqc_plots[target]['page_size'];
+    var num_samples = cats.length;
+    var num_pages = Math.max(1, Math.ceil(num_samples / page_size));
+    var page = Math.min(mqc_plots[target]['page'] || 0, num_pages - 1);
+    mqc_plots[target]['page'] = page;
+    var start = page * page_size;
+    var end = Math.min(start + page_size, num_samples);
+    cats = cats.slice(start, end);
+    $.each(data, function(k, d){
+      data[k]['data'] = d['data'].slice(start, end);
+    });
+    $('.mqc_bargraph_pages[data-target="'+target+'"]').html(
+      '<button class="btn btn-default btn-sm" data-page="'+(page-1)+'"'+(page == 0 ? ' disabled' : '')+'>&laquo; Previous</button>' +
+      '<button class="btn btn-default btn-sm" disabled>Samples '+(start+1)+' - '+end+' of '+num_samples+'</button>' +
+      '<button class="btn btn-default btn-sm" data-page="'+(page+1)+'"'+(page == num_pages - 1 ? ' disabled' : '')+'>Next &raquo;</button>'
+    );
+  }
+
   // Make the highcharts plot
   Highcharts.chart(target, {
     chart: {
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+""" MultiQC General Statistics data store. Holds the General Statistics
+table in columns, instead of a dict of dicts for every module. """
+
+from collections import OrderedDict
+import sys
+
+from multiqc.utils.sample_registry import SampleRegistry
+
+try:
+    from collections.abc import MutableMapping
+except ImportError: # Py2
+    from collections import MutableMapping
+
+
+class GeneralStatsColumn(object):
+    """ Values for one General Statistics column, aligned to the shared
+    sample index. The mask records which samples have a value. """
+
+    __slots__ = ('values', 'mask')
+
+    def __init__(self):
+        self.values = list()
+        self.mask = bytearray()
+
+    def set(self, row, val):
+        missing = row + 1 - len(self.values)
+        if missing > 0:
+            self.values.extend([None] * missing)
+            self.mask.extend(bytes(missing))
+        self.values[row] = val
+        self.mask[row] = 1
+
+    def rows(self):
+        """ Yield the sample index of every row with a value """
+        row = self.mask.find(1)
+        while row != -1:
+            yield row
+            row = self.mask.find(1, row + 1)
+
+    def items(self, s_names):
+        """ Yield (sample name, value) for every row with a value """
+        for row in self.rows():
+            yield s_names[row], self.values[row]
+
+    def has(self, row):
+        return row < len(self.mask) and self.mask[row] == 1
+
+    def unset(self, row):
+        if self.has(row):
+            self.values[row] = None
+            self.mask[row] = 0
+
+    def count(self):
+        return self.mask.count(1)
+
+
+class GeneralStatsRow(MutableMapping):
+    """ One sample's values in one section, as a dict. Changes are written
+    straight to the section's columns. """
+
+    def __init__(self, section, rows, row):
+        self.section = section
+        self.rows = rows
+        self.row = row
+
+    def __getitem__(self, k):
+        column = self.section.get(k)
+        if column is None or not column.has(self.row):
+            raise KeyError(k)
+        return column.values[self.row]
+
+    def __setitem__(self, k, val):
+        k = sys.intern(str(k))
+        try:
+            column = self.section[k]
+        except KeyError:
+            column = self.section[k] = GeneralStatsColumn()
+        if not column.has(self.row):
+            self.rows[self.row] = self.rows.get(self.row, 0) + 1
+        column.set(self.row, val)
+
+    def __delitem__(self, k):
+        column = self.section.get(k)
+        if column is None or not column.has(self.row):
+            raise KeyError(k)
+        column.unset(self.row)
+        self.rows[self.row] -= 1
+
+    def __iter__(self):
+        for k, column in list(self.section.items()):
+            if column.has(self.row):
+                yield k
+
+    def __len__(self):
+        return self.rows.get(self.row, 0)
+
+
+class GeneralStatsSection(MutableMapping):
+    """ One section of the General Statistics table, as the 2D dict (sample
+    name, then column key) that it was added with. Changes are written
+    straight to the table, as they were with the old list of dicts. """
+
+    def __init__(self, gsd, idx):
+        self.gsd = gsd
+        self.idx = idx
+        self.section = gsd.sections[idx]
+        self.rows = gsd.section_rows[idx]
+
+    def _row(self, s_name):
+        row = self.gsd.samples.ids.get(s_name)
+        if row is None or row not in self.rows:
+            raise KeyError(s_name)
+        return row
+
+    def __getitem__(self, s_name):
+        return GeneralStatsRow(self.section, self.rows, self._row(s_name))
+
+    def __setitem__(self, s_name, sdata):
+        s_name = self.gsd.intern(s_name)
+        if s_name in self:
+            del self[s_name]
+        row = self.gsd.samples.id(s_name)
+        self.rows[row] = 0
+        GeneralStatsRow(self.section, self.rows, row).update(sdata)
+
+    def __delitem__(self, s_name):
+        row = self._row(s_name)
+        for column in self.section.values():
+            column.unset(row)
+        del self.rows[row]
+
+    def __iter__(self):
+        for row in list(self.rows):
+            yield self.gsd.s_names[row]
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class GeneralStatsData(object):
+    """
+    General Statistics table data. Every section (one per call to
+    general_stats_addcols()) is an OrderedDict of GeneralStatsColumn
+    objects. Rows are indexed by the sample registry IDs, shared across
+    the whole table (and with the rest of the report). For each section,
+    section_rows holds the rows it has, in the order they were added,
+    with the number of values in each.
+
+    Behaves like the old list of dicts when iterated or indexed, so that
+    existing code using report.general_stats_data still works. Sections are
+    returned as GeneralStatsSection views, so changes to them are kept.
+    """
+
+    def __init__(self, samples=None):
+        self.samples = samples if samples is not None else SampleRegistry()
+        self.sections = list()
+        self.section_rows = list()
+        self.headers = list()
+
+    def add_section(self, data, headers):
+        """ Add a module's data (2D dict, sample name then column key) with its headers """
+        self.append(data)
+        self.headers.append(headers)
+
+    def append(self, data):
+        """ Add a section of data without touching the headers """
+        columns = OrderedDict()
+        rows = OrderedDict()
+        for s_name, sdata in data.items():
+            row = self.samples.id(s_name)
+            rows[row] = len(sdata)
+            for k, val in sdata.items():
+                try:
+                    column = columns[k]
+                except KeyError:
+                    column = columns[k] = GeneralStatsColumn()
+                column.set(row, val)
+        # Column keys must be strings, not numeric
+        self.sections.append(OrderedDict((sys.intern(str(k)), column) for k, column in columns.items()))
+        self.section_rows.append(rows)
+
+    @property
+    def s_names(self):
+        """ Sample names, indexed by row (their sample registry ID) """
+        return self.samples.names
+
+    def intern(self, s_name):
+        """ Sample names are always strings, shared with the sample registry """
+        return self.samples.intern(str(s_name))
+
+    def remove_empty_sections(self):
+        """ Remove sections which were added without any samples """
+        for idx in reversed(range(len(self.sections))):
+            if len(self.section_rows[idx]) == 0:
+                del self.sections[idx]
+                del self.section_rows[idx]
+                if idx < len(self.headers):
+                    del self.headers[idx]
+
+    def section_dict(self, idx):
+        """ Build the 2D dict for one section, as it was originally added """
+        data = OrderedDict()
+        for row in self.section_rows[idx]:
+            data[self.s_names[row]] = dict()
+        for k, column in self.sections[idx].items():
+            for row in column.rows():
+                data[self.s_names[row]][k] = column.values[row]
+        return data
+
+    def __len__(self):
+        return len(self.sections)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [GeneralStatsSection(self, i) for i in range(*idx.indices(len(self.sections)))]
+        if idx < 0:
+            idx += len(self.sections)
+        if not 0 <= idx < len(self.sections):
+            raise IndexError(idx)
+        return GeneralStatsSection(self, idx)
+
+    def __iter__(self):
+        for idx in range(len(self.sections)):
+            yield GeneralStatsSection(self, idx)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Helper functions to calculate statistics from histograms, such as
+coverage depth or insert size counts, using NumPy arrays
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+
+def histogram_arrays(hist):
+    """ Convert a histogram dict (value: count) into two NumPy arrays,
+    sorted by value """
+    x = np.array(list(hist.keys()))
+    counts = np.fromiter(hist.values(), dtype=float, count=len(hist))
+    order = np.argsort(x, kind='stable')
+    return x[order], counts[order]
+
+
+def total_count(counts):
+    """ Sum of all counts, added in order like the builtin sum() """
+    if len(counts) == 0:
+        return 0
+    return np.cumsum(counts)[-1].item()
+
+
+def counts_at_or_above(counts):
+    """ Cumulative counts from the top of a sorted histogram, ie. the
+    number of counts with a value at or above each value """
+    return np.cumsum(counts[::-1])[::-1]
+
+
+def median_x(x, counts):
+    """ Median value of a sorted histogram: the first value where the
+    cumulative count reaches half of the total """
+    if len(x) == 0:
+        return None
+    cumulative = np.cumsum(counts)
+    idx = np.argmax(cumulative >= cumulative[-1] / 2)
+    return x[idx].item()
+
+
+def cumulative_median_x(x, cumulative, total=100):
+    """ Median value from a cumulative distribution (eg. percentage of
+    counts at or above each value): the largest value with at least half
+    of the total at or above it """
+    at_least_half = x[cumulative >= total / 2]
+    if len(at_least_half) == 0:
+        return None
+    return at_least_half.max().item()
+
+
+def percent_at_or_above(x, counts, thresholds):
+    """ Percentage of counts with a value at or above each threshold.
+    Returns an OrderedDict in the order of the thresholds, with None
+    for every threshold if the histogram is empty. """
+    total = total_count(counts)
+    if total <= 0:
+        return OrderedDict((t, None) for t in thresholds)
+    above = np.append(counts_at_or_above(counts), 0)
+    idx = np.searchsorted(x, thresholds, side='left')
+    rates = 100.0 * above[idx] / total
+    return OrderedDict(zip(thresholds, rates.tolist()))
+
+
+def tail_max_x(x, cumulative, min_value):
+    """ Largest value where a cumulative distribution (counts at or above,
+    as in counts_at_or_above()) is still greater than min_value. Used to cut
+    the long flat tail off coverage plots. Returns 0 if there isn't one. """
+    above = x[cumulative > min_value]
+    if len(above) == 0:
+        return 0
+    return above.max().item()
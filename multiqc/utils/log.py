@@ -10,6 +10,7 @@ import os
 import shutil
 import sys
 import tempfile
+import zipfile
 
 from multiqc.utils import config, util_functions
 
@@ -69,7 +70,12 @@ def move_tmp_log(logger):
     try:
         # https://stackoverflow.com/questions/15435652/python-does-not-release-filehandles-to-logfile
         logging.shutdown()
-        shutil.copy(log_tmp_fn, os.path.join(config.data_dir, 'multiqc.log'))
+        if config.zip_data_dir and os.path.isfile('{}.zip'.format(config.data_dir)):
+            # Add the log to the zipped data directory
+            with zipfile.ZipFile('{}.zip'.format(config.data_dir), 'a', zipfile.ZIP_DEFLATED) as zf:
+                zf.write(log_tmp_fn, 'multiqc.log')
+        else:
+            shutil.copy(log_tmp_fn, os.path.join(config.data_dir, 'multiqc.log'))
         os.remove(log_tmp_fn)
         util_functions.robust_rmtree(log_tmp_dir)
     except (AttributeError, TypeError, IOError):
@@ -3,25 +3,14 @@
 """ MultiQC code to export data to MegaQC / flat JSON files """
 
 from __future__ import print_function
-import gzip
-import io
 import json
 import os
 import requests
 
 from multiqc import config
+from multiqc.utils.util_functions import json_chunks, gzip_chunks
 log = config.logger
 
-# Custom encoder to handle lambda functions
-class MQCJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if callable(obj):
-            try:
-                return obj(1)
-            except:
-                return None
-        return json.JSONEncoder.default(self, obj)
-
 def multiqc_dump_json(report):
     exported_data = dict()
     export_vars = {
@@ -52,9 +41,14 @@ def multiqc_dump_json(report):
             try:
                 if s == 'config':
                     d = {'{}_{}'.format(s, k): getattr(config, k)}
+                elif s == 'report' and k == 'general_stats_data':
+                    # General Stats are stored in columns, export them as a list of dicts
+                    d = {'{}_{}'.format(s, k): [report.general_stats_data.section_dict(idx) for idx in range(len(report.general_stats_data))]}
                 elif s == 'report':
                     d = {'{}_{}'.format(s, k): getattr(report, k)}
-                json.dumps(d, cls=MQCJSONEncoder, ensure_ascii=False) # Test that exporting to JSON works
+                # Test that exporting to JSON works, without keeping the JSON string
+                for chunk in json_chunks(d):
+                    pass
                 exported_data.update(d)
             except (TypeError, KeyError, AttributeError):
                 log.warning("Couldn't export data key '{}.{}'".format(s, k))
@@ -72,15 +66,10 @@ def multiqc_api_post(exported_data):
     headers = { 'Content-Type': 'application/json', 'content-encoding': 'gzip' }
     if config.megaqc_access_token is not None:
         headers['access_token'] = config.megaqc_access_token
-    post_data = json.dumps({'data': exported_data}, cls=MQCJSONEncoder, ensure_ascii=False, indent=2)
-    post_data = post_data.encode('utf-8', 'ignore')
 
-    # Gzip the JSON for massively decreased filesize
-    sio_obj = io.BytesIO()
-    gzfh = gzip.GzipFile(fileobj=sio_obj, mode='w')
-    gzfh.write(post_data)
-    gzfh.close()
-    request_body = sio_obj.getvalue()
+    # Gzip the JSON for massively decreased filesize. The body is encoded and
+    # compressed as it is sent, using a chunked upload.
+    request_body = gzip_chunks(json_chunks({'data': exported_data}))
 
     log.debug("Sending data to MegaQC")
     log.debug("MegaQC URL: {}".format(config.megaqc_url))
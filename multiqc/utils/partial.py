@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+
+""" MultiQC partial runs. A run with --partial parses its files as normal,
+then saves the module output to a partial-state file instead of writing a
+report. Running with --merge loads several partial-state files and renders
+them as one report, so that large projects can be parsed in shards.
+
+Partial-state files are pickles, including the code of any lambda
+functions given to plots and tables. Loading one runs that code, so they
+must only be loaded from a trusted source. A JSON header line before the
+pickle records the Python bytecode version, so that files can only be
+merged by the same Python version that made them. """
+
+from __future__ import print_function
+from collections import OrderedDict
+import functools
+import gzip
+import importlib
+import importlib.util
+import io
+import json
+import logging
+import marshal
+import pickle
+import platform
+import types
+
+from multiqc.utils import config, report, util_functions
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the partial-state file layout changes
+PARTIAL_FORMAT_VERSION = 2
+
+# Values that lambda functions can use from the code around them in partial-state files
+CLOSURE_TYPES = (type(None), bool, int, float, complex, str, bytes)
+
+# Module attributes used to render the report
+MODULE_ATTRS = ('name', 'anchor', 'href', 'info', 'comment', 'extra', 'mname', 'intro', 'css', 'js')
+
+# Plot calls made since the last report section was added, and the
+# options that each data file was written with
+plot_calls = list()
+data_file_options = dict()
+
+
+def plain(obj):
+    """ Copy nested dicts and lists, turning defaultdicts (which can't
+    always be pickled) into plain dicts """
+    if isinstance(obj, OrderedDict):
+        return OrderedDict((k, plain(v)) for k, v in obj.items())
+    if isinstance(obj, dict):
+        return dict((k, plain(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return [plain(v) for v in obj]
+    if isinstance(obj, tuple):
+        return tuple(plain(v) for v in obj)
+    return obj
+
+
+class SavedModify(object):
+    """ Stands in for the 'modify' function of a table header in a partial-state
+    file. These functions often call methods of the module object, which can't
+    be saved, so their results for every value in the column are saved instead.
+    Values that weren't seen are returned unchanged. """
+
+    def __init__(self, modify, values):
+        self.results = dict()
+        for val in values:
+            # Tables call modify() with the value as given and as a float
+            try:
+                float_val = float(val)
+            except (TypeError, ValueError):
+                float_val = None
+            for v in (val, float_val):
+                try:
+                    if v is not None and v not in self.results:
+                        self.results[v] = modify(v)
+                except Exception:
+                    pass
+
+    def __call__(self, val):
+        try:
+            return self.results[val]
+        except (KeyError, TypeError):
+            return val
+
+
+def _table_args(call):
+    """ The data, headers and pconfig given to a table or beeswarm plot call """
+    args, kwargs = call['args'], call['kwargs']
+    data = args[0] if len(args) > 0 else kwargs.get('data')
+    headers = args[1] if len(args) > 1 else kwargs.get('headers')
+    pconfig = args[2] if len(args) > 2 else kwargs.get('pconfig')
+    return data, headers, pconfig
+
+
+def _header_dicts(headers):
+    if isinstance(headers, dict):
+        return [headers]
+    return [h for h in headers or [] if isinstance(h, dict)]
+
+
+def merge_saved_modify(headers, other_headers):
+    """ Add the SavedModify results from another partial run's copy of the
+    same table headers, so that values from every run are modified """
+    for h, other_h in zip(_header_dicts(headers), _header_dicts(other_headers)):
+        for k, header in h.items():
+            other = other_h.get(k)
+            if isinstance(header, dict) and isinstance(other, dict) and \
+                    isinstance(header.get('modify'), SavedModify) and isinstance(other.get('modify'), SavedModify):
+                header['modify'].results.update(other['modify'].results)
+
+
+def save_table_modify(data, headers, pconfig=None):
+    """ Replace the 'modify' functions in table headers (and pconfig) with
+    SavedModify objects, for the values in the table data. Changes the
+    headers and pconfig given, which should be copies. """
+    datasets = data if isinstance(data, list) else [data]
+    if isinstance(headers, dict):
+        headers = [headers]
+    for idx, d in enumerate(datasets):
+        if not isinstance(d, dict) or not isinstance(headers, list) or idx >= len(headers):
+            continue
+        for k, header in (headers[idx] or {}).items():
+            if isinstance(header, dict) and callable(header.get('modify')):
+                values = [sdata[k] for sdata in d.values() if isinstance(sdata, dict) and k in sdata]
+                header['modify'] = SavedModify(header['modify'], values)
+    if isinstance(pconfig, dict) and callable(pconfig.get('modify')):
+        values = [v for d in datasets if isinstance(d, dict) for sdata in d.values() if isinstance(sdata, dict) for v in sdata.values()]
+        pconfig['modify'] = SavedModify(pconfig['modify'], values)
+
+
+def _make_function(code, module, name, defaults, closure_values):
+    """ Rebuild a function saved by PartialPickler """
+    fn_globals = importlib.import_module(module).__dict__ if module else {}
+    closure = tuple(types.CellType(v) for v in closure_values) or None
+    return types.FunctionType(marshal.loads(code), fn_globals, name, defaults, closure)
+
+
+class PartialPickler(pickle.Pickler):
+    """ Pickler that also saves lambdas and nested functions, such as the
+    'modify' functions in table headers, which can't be imported by name """
+
+    def reducer_override(self, obj):
+        if isinstance(obj, types.FunctionType) and '<' in obj.__qualname__:
+            closure_values = tuple(c.cell_contents for c in obj.__closure__ or ())
+            # Only simple values are saved with the function, not objects such as the module
+            for v in closure_values:
+                if not isinstance(v, CLOSURE_TYPES):
+                    raise pickle.PicklingError("Can't save function '{}' from {} in a partial-state file, "
+                        "it uses a {} object from the code around it".format(obj.__qualname__, obj.__module__, type(v).__name__))
+            return _make_function, (marshal.dumps(obj.__code__), obj.__module__, obj.__name__, obj.__defaults__, closure_values)
+        return NotImplemented
+
+
+def record_plot(plot_type):
+    """ Decorator for plot functions. In partial runs, the inputs of each
+    plot are kept so that it can be plotted again with all samples on merge. """
+    def decorator(plot_fn):
+        @functools.wraps(plot_fn)
+        def wrapper(*args, **kwargs):
+            if not config.partial_file:
+                return plot_fn(*args, **kwargs)
+            call = {'type': plot_type, 'args': plain(args), 'kwargs': plain(kwargs)}
+            call['html'] = plot_fn(*args, **kwargs)
+            plot_calls.append(call)
+            return call['html']
+        return wrapper
+    return decorator
+
+
+def section_plot_call(plot_html):
+    """ Get the recorded plot call for a new report section, if its plot was
+    made by one, and forget the calls made for this section """
+    call = None
+    for c in plot_calls:
+        if c['html'] == plot_html:
+            call = c
+    del plot_calls[:]
+    if call is None:
+        return None
+    call = {'type': call['type'], 'args': call['args'], 'kwargs': call['kwargs']}
+    if call['type'] in ('table', 'beeswarm'):
+        save_table_modify(*_table_args(call))
+    # Plots using functions that can't be saved can't be plotted again on merge
+    try:
+        PartialPickler(io.BytesIO(), protocol=pickle.HIGHEST_PROTOCOL).dump(call)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        logger.debug("Can't save plot inputs, it won't be plotted again on merge: {}".format(e))
+        return None
+    return call
+
+
+def saved_general_stats(gsd, idx):
+    """ Data and headers of a General Statistics section, ready to be saved """
+    data = plain(gsd.section_dict(idx))
+    headers = plain(gsd.headers[idx])
+    save_table_modify(data, headers)
+    return data, headers
+
+
+def partial_header():
+    """ Header line of a partial-state file, read before anything is unpickled """
+    return {
+        'format': 'multiqc-partial',
+        'format_version': PARTIAL_FORMAT_VERSION,
+        'multiqc_version': config.version,
+        'python_version': platform.python_version(),
+        'python_bytecode': importlib.util.MAGIC_NUMBER.hex(),
+    }
+
+
+def write_partial(fn):
+    """ Save the module output and shared report data to a partial-state file """
+    modules = list()
+    for mod in report.modules_output:
+        modules.append({
+            'attrs': dict((a, getattr(mod, a)) for a in MODULE_ATTRS if hasattr(mod, a)),
+            'sections': plain(mod.sections)
+        })
+    gsd = report.general_stats_data
+    state = {
+        'analysis_dir': list(config.analysis_dir),
+        'modules': modules,
+        'general_stats': [saved_general_stats(gsd, idx) for idx in range(len(gsd))],
+        'data_sources': plain(report.data_sources),
+        'saved_raw_data': plain(report.saved_raw_data),
+        'data_file_options': dict(data_file_options),
+        'plot_data': report.plot_data,
+        'lint_errors': list(report.lint_errors),
+    }
+    with gzip.open(fn, 'wb') as fh:
+        fh.write(json.dumps(partial_header()).encode('utf-8') + b'\n')
+        PartialPickler(fh, protocol=pickle.HIGHEST_PROTOCOL).dump(state)
+    logger.info("Partial     : {} ({} modules)".format(fn, len(modules)))
+
+
+def read_partial(fn):
+    """ Load a partial-state file. This runs code saved in the file, so only
+    load files from a trusted source. The header is checked first, so that
+    nothing is unpickled from files made by a different Python version. """
+    with gzip.open(fn, 'rb') as fh:
+        try:
+            header = json.loads(fh.readline(4096).decode('utf-8'))
+        except (OSError, EOFError, ValueError):
+            header = None
+        if not isinstance(header, dict) or header.get('format') != 'multiqc-partial':
+            raise ValueError("'{}' is not a MultiQC partial-state file".format(fn))
+        if header.get('format_version') != PARTIAL_FORMAT_VERSION:
+            raise ValueError("Partial-state file '{}' was made with MultiQC v{}, which saves a different format".format(fn, header.get('multiqc_version')))
+        if header.get('python_bytecode') != importlib.util.MAGIC_NUMBER.hex():
+            raise ValueError("Partial-state file '{}' was made with Python {}, it can only be merged with the same Python version (this is Python {})".format(
+                fn, header.get('python_version'), platform.python_version()))
+        if header.get('multiqc_version') != config.version:
+            logger.warning("Partial-state file '{}' was made with MultiQC v{}".format(fn, header.get('multiqc_version')))
+        return pickle.load(fh)
+
+
+class MergedModule(object):
+    """ Module output loaded from partial-state files """
+
+    def __init__(self, attrs):
+        self.sections = list()
+        for k, v in attrs.items():
+            setattr(self, k, v)
+
+
+def merge_data(datasets):
+    """ Combine the data given to the same plot in different partial runs.
+    Dicts are merged by key (usually sample names), later runs overwriting
+    earlier ones, and lists of dicts are merged item by item. Returns None
+    if the data can't be merged. """
+    first = datasets[0]
+    if isinstance(first, dict):
+        if not all(isinstance(d, dict) for d in datasets):
+            return None
+        merged = OrderedDict() if isinstance(first, OrderedDict) else dict()
+        for d in datasets:
+            merged.update(d)
+        return merged
+    if isinstance(first, list):
+        if not all(isinstance(d, list) and len(d) == len(first) for d in datasets):
+            return None
+        items = [merge_data([d[i] for d in datasets]) for i in range(len(first))]
+        if any(i is None for i in items):
+            return None
+        return items
+    return None
+
+
+def merge_plot(calls):
+    """ Plot the combined data from the recorded plot calls of each run.
+    Returns None if the section can't be plotted again. """
+    if any(c is None for c in calls) or len(set(c['type'] for c in calls)) > 1:
+        return None
+    if not all(len(c['args']) > 0 for c in calls):
+        return None
+    data = merge_data([c['args'][0] for c in calls])
+    if data is None:
+        return None
+    if calls[0]['type'] in ('table', 'beeswarm'):
+        headers = _table_args(calls[0])[1]
+        for c in calls[1:]:
+            merge_saved_modify(headers, _table_args(c)[1])
+    plot_mod = importlib.import_module('multiqc.plots.{}'.format(calls[0]['type']))
+    return plot_mod.plot(data, *calls[0]['args'][1:], **calls[0]['kwargs'])
+
+
+def load_partials(fns):
+    """ Load and merge partial-state files into the report. Modules and
+    sections with the same anchor are combined, and their plots are made
+    again with the samples from every file. """
+    states = [read_partial(fn) for fn in fns]
+
+    # Group the modules and sections by anchor, in the order they were first seen,
+    # keeping the partial-state file that each copy of a section came from
+    modules = OrderedDict()
+    for fn, state in zip(fns, states):
+        for m in state['modules']:
+            anchor = m['attrs']['anchor']
+            if anchor not in modules:
+                modules[anchor] = (MergedModule(m['attrs']), OrderedDict())
+            for section in m['sections']:
+                modules[anchor][1].setdefault(section['anchor'], list()).append((fn, section))
+
+    # Reserve the anchors first, so that plot IDs don't clash with them
+    for anchor, (mod, sections) in modules.items():
+        report.html_ids.append(anchor)
+        report.html_ids.extend(sections.keys())
+
+    # Combine sections, plotting again where a plot was found in more than one run
+    for anchor, (mod, sections) in modules.items():
+        for s_anchor, copies in sections.items():
+            section = copies[0][1]
+            calls = [s.pop('partial_plot', None) for _, s in copies]
+            if len(copies) > 1:
+                plot = merge_plot(calls)
+                if plot is not None:
+                    section['plot'] = plot
+                elif any(s.get('plot') for _, s in copies) or len(set(s.get('content') for _, s in copies)) > 1:
+                    # Plot HTML looks the same in every run, but its data doesn't
+                    logger.warning("Could not merge the '{}' section, it only shows the samples from {} (not from {})".format(
+                        s_anchor, copies[0][0], ', '.join(fn for fn, _ in copies[1:])))
+            mod.sections.append(section)
+        report.modules_output.append(mod)
+
+    # Plot data for sections that were not plotted again
+    for state in states:
+        for pid, pdata in state['plot_data'].items():
+            if pid not in report.plot_data:
+                report.plot_data[pid] = pdata
+                report.html_ids.append(pid)
+
+    # General Statistics. A module's columns can depend on the files that each
+    # run found, so sections are merged if they share any column from the same module
+    gs_sections = list()
+    for state in states:
+        for data, headers in state['general_stats']:
+            for gs_data, gs_headers in gs_sections:
+                if any(k in gs_headers and gs_headers[k].get('namespace') == h.get('namespace') for k, h in headers.items()):
+                    for s_name, sdata in data.items():
+                        gs_data.setdefault(s_name, dict()).update(sdata)
+                    merge_saved_modify(gs_headers, headers)
+                    for k, h in headers.items():
+                        gs_headers.setdefault(k, h)
+                    break
+            else:
+                gs_sections.append((OrderedDict(data), headers))
+    for data, headers in gs_sections:
+        report.general_stats_data.add_section(data, headers)
+
+    # Data sources, saved data files and lint errors
+    for state in states:
+        for mod, sections in state['data_sources'].items():
+            for section, sources in sections.items():
+                report.data_sources[mod][section].update(sources)
+        for fn, data in state['saved_raw_data'].items():
+            if isinstance(report.saved_raw_data.get(fn), dict) and isinstance(data, dict):
+                report.saved_raw_data[fn].update(data)
+            elif fn not in report.saved_raw_data:
+                report.saved_raw_data[fn] = data
+        data_file_options.update(state['data_file_options'])
+        report.lint_errors.extend(e for e in state['lint_errors'] if e not in report.lint_errors)
+    for fn, data in report.saved_raw_data.items():
+        sort_cols, data_format = data_file_options.get(fn, (False, None))
+        util_functions.write_data_file(data, fn, sort_cols, data_format)
+
+    logger.info("Merged {} partial runs: {} modules".format(len(states), len(report.modules_output)))
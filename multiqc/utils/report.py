@@ -19,6 +19,7 @@ import re
 import yaml
 
 from multiqc import config
+from multiqc.utils import general_stats, sample_registry, util_functions
 logger = config.logger
 
 # Treat defaultdict and OrderedDict as normal dicts for YAML output
@@ -30,42 +31,59 @@ try:
 except NameError:
     pass # Python 3
 
-# Set up global variables shared across modules
-general_stats_data = list()
-general_stats_headers = list()
-general_stats_html = ''
-data_sources = defaultdict(lambda:defaultdict(lambda:defaultdict()))
-plot_data = dict()
-html_ids = list()
-lint_errors = list()
-num_hc_plots = 0
-num_mpl_plots = 0
-saved_raw_data = dict()
-last_found_file = None
-runtimes = {
-    'total': 0,
-    'total_sp': 0,
-    'total_mods': 0,
-    'total_compression': 0,
-    'sp': defaultdict(),
-    'mods': defaultdict()
-}
-file_search_stats = {
-    'skipped_symlinks': 0,
-    'skipped_not_a_file': 0,
-    'skipped_ignore_pattern': 0,
-    'skipped_filesize_limit': 0,
-    'skipped_no_match': 0,
-}
-
-# Make a dict of discovered files for each seach key
-searchfiles = list()
-files = dict()
+def init():
+    """ Set up the global variables shared across modules. Called again
+    to start afresh when a report is made more than once in a run. """
+    global samples, general_stats_data, general_stats_headers, general_stats_html, data_sources
+    global plot_data, html_ids, lint_errors, num_hc_plots, num_mpl_plots, saved_raw_data
+    global last_found_file, runtimes, file_search_stats, searchfiles, files, path_filter_index
+
+    samples = sample_registry.SampleRegistry()
+    general_stats_data = general_stats.GeneralStatsData(samples)
+    general_stats_headers = general_stats_data.headers
+    general_stats_html = ''
+    data_sources = defaultdict(lambda:defaultdict(lambda:defaultdict()))
+    plot_data = dict()
+    html_ids = list()
+    lint_errors = list()
+    num_hc_plots = 0
+    num_mpl_plots = 0
+    saved_raw_data = dict()
+    last_found_file = None
+    runtimes = {
+        'total': 0,
+        'total_sp': 0,
+        'total_mods': 0,
+        'total_compression': 0,
+        'sp': defaultdict(),
+        'mods': defaultdict()
+    }
+    file_search_stats = {
+        'skipped_symlinks': 0,
+        'skipped_not_a_file': 0,
+        'skipped_ignore_pattern': 0,
+        'skipped_filesize_limit': 0,
+        'skipped_no_match': 0,
+    }
+
+    # Make a dict of discovered files for each seach key
+    searchfiles = list()
+    files = dict()
+    # Discovered files split by module path_filters, for each search key
+    path_filter_index = dict()
+
+init()
+
+# Search keys matched by each file in watch mode, with the file modification
+# time and size, so that unchanged files aren't searched again
+search_cache = dict()
+
 def get_filelist(run_module_names):
     """
     Go through all supplied search directories and assembly a master
     list of files to search. Then fire search functions for each file.
     """
+    path_filter_index.clear()
     # Prep search patterns
     spatterns = [{},{},{},{},{},{},{}]
     epatterns = [{}, {}]
@@ -125,6 +143,16 @@ def get_filelist(run_module_names):
     if len(ignored_patterns) > 0:
         logger.debug("Ignored {} search patterns as didn't match running modules.".format(len(ignored_patterns)))
 
+    # Big custom content YAML and JSON files are parsed as a stream, so they
+    # can be over log_filesize_limit. These only match custom content patterns.
+    stream_min_filesize = getattr(config, 'custom_content', {}).get('stream_min_filesize')
+    cc_keys = set(['custom_content'])
+    try:
+        cc_keys.update(config.custom_data.keys())
+    except AttributeError:
+        pass # custom_data not in config
+    cc_spatterns = [{k:sps for k, sps in patterns.items() if k in cc_keys} for patterns in spatterns]
+
     def add_file(fn, root):
         """
         Function applied to each file found when walking the analysis
@@ -146,18 +174,50 @@ def get_filelist(run_module_names):
             return False
 
         # Limit search to small files, to avoid 30GB FastQ files etc.
+        search_patterns = spatterns
         try:
             f['filesize'] = os.path.getsize(os.path.join(root,fn))
         except (IOError, OSError, ValueError, UnicodeDecodeError):
             logger.debug("Couldn't read file when checking filesize: {}".format(fn))
         else:
             if f['filesize'] > config.log_filesize_limit:
-                file_search_stats['skipped_filesize_limit'] += 1
-                return False
+                if (stream_min_filesize is None or f['filesize'] < stream_min_filesize or
+                        os.path.splitext(fn)[1] not in ['.yaml', '.yml', '.json']):
+                    file_search_stats['skipped_filesize_limit'] += 1
+                    return False
+                search_patterns = cc_spatterns
+
+        # Reuse the search results if the file hasn't changed since it was last searched
+        if config.watch:
+            path = os.path.join(root, fn)
+            try:
+                st = os.stat(path)
+                file_stat = (st.st_mtime, st.st_size)
+            except OSError:
+                file_stat = None
+            cached = search_cache.get(path)
+            if cached is not None and file_stat is not None and cached[0] == file_stat:
+                matched_keys, file_found = cached[1], cached[2]
+            else:
+                matched_keys, file_found = match_keys(f, search_patterns)
+                search_cache[path] = (file_stat, matched_keys, file_found)
+        else:
+            matched_keys, file_found = match_keys(f, search_patterns)
 
-        # Test file for each search pattern
-        file_matched = False
-        for patterns in spatterns:
+        # Remember this file for each matching search pattern
+        for key in matched_keys:
+            files[key].append(f)
+            file_search_stats[key] = file_search_stats.get(key, 0) + 1
+        return file_found
+
+    def match_keys(f, search_patterns):
+        """
+        Test a file against each search pattern. Returns the matching search
+        keys, and whether a search pattern claimed the file (even if it was
+        then excluded).
+        """
+        matched_keys = list()
+        for patterns in search_patterns:
             for key, sps in patterns.items():
                 start = time.time()
                 for sp in sps:
@@ -165,19 +225,17 @@ def get_filelist(run_module_names):
                         # Check that we shouldn't exclude this file
                         if not exclude_file(sp, f):
                             # Looks good! Remember this file
-                            files[key].append(f)
-                            file_search_stats[key] = file_search_stats.get(key, 0) + 1
-                            file_matched = True
+                            matched_keys.append(key)
                         # Don't keep searching this file for other modules
                         if not sp.get('shared', False):
                             runtimes['sp'][key] = runtimes['sp'].get(key, 0) + (time.time() - start)
-                            return True
+                            return matched_keys, True
                         # Don't look at other patterns for this module
                         else:
                             break
                 runtimes['sp'][key] = runtimes['sp'].get(key, 0) + (time.time() - start)
 
-        return file_matched
+        return matched_keys, len(matched_keys) > 0
 
     # Go through the analysis directories and get file list
     multiqc_installation_dir_files = ['LICENSE', 'CHANGELOG.md', 'Dockerfile', 'MANIFEST.in', '.gitmodules', 'README.md', 'CSP.txt', 'setup.py', '.gitignore']
@@ -233,6 +291,79 @@ def get_filelist(run_module_names):
         for sf in sfiles:
             if not add_file(sf[0], sf[1]):
                 file_search_stats['skipped_no_match'] += 1
+    decompressed_lines.clear()
+
+    runtimes['total_sp'] = time.time() - total_sp_starttime
+
+def load_manifest(manifest_fn, run_module_names):
+    """
+    Load a manifest of files which have already been matched to search keys,
+    instead of searching the analysis directories. Manifests are tab-separated,
+    with a path, a search key (or a module name, for modules with only one search
+    key) and optionally a sample name on each line. JSON manifests are a list
+    of objects with 'path', 'key' and optionally 'sample', or a search index
+    saved by write_search_index().
+    Relative paths are relative to the manifest file.
+    """
+    path_filter_index.clear()
+    runtimes['sp'] = defaultdict()
+    total_sp_starttime = time.time()
+    run_mods = set(m.lower() for m in run_module_names)
+    mod_keys = defaultdict(list)
+    for key in config.sp:
+        mod_name = key.split('/', 1)[0]
+        if mod_name.lower() in run_mods:
+            files[key] = list()
+            mod_keys[mod_name].append(key)
+
+    # Read the manifest entries as (path, key, sample name) tuples
+    with io.open(manifest_fn, 'r', encoding='utf-8') as fh:
+        if manifest_fn.endswith('.json'):
+            manifest = json.load(fh)
+            if isinstance(manifest, dict):
+                manifest = manifest['files']
+            entries = [(e['path'], e['key'], e.get('sample')) for e in manifest]
+        else:
+            entries = list()
+            for l in fh:
+                parts = l.rstrip('\r\n').split('\t')
+                if len(parts) < 2 or l.startswith('#') or parts[0] == 'path':
+                    continue
+                entries.append((parts[0], parts[1], parts[2] if len(parts) > 2 and parts[2] else None))
+
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_fn))
+    unknown_keys = set()
+    ambiguous_keys = set()
+    for path, key, s_name in entries:
+        if key not in config.sp:
+            if len(mod_keys.get(key, [])) == 1:
+                key = mod_keys[key][0]
+            elif key in mod_keys:
+                ambiguous_keys.add(key)
+                continue
+            elif key not in config.avail_modules:
+                unknown_keys.add(key)
+                continue
+        # Skip files for modules that aren't running
+        if key not in files:
+            file_search_stats['skipped_no_match'] += 1
+            continue
+        path = os.path.join(manifest_dir, path)
+        f = {'fn': os.path.basename(path), 'root': os.path.dirname(path)}
+        try:
+            f['filesize'] = os.path.getsize(path)
+        except (IOError, OSError, ValueError, UnicodeDecodeError):
+            logger.debug("Couldn't read file when checking filesize: {}".format(path))
+        if s_name is not None:
+            f['sample'] = s_name
+        files[key].append(f)
+        searchfiles.append([f['fn'], f['root']])
+        file_search_stats[key] = file_search_stats.get(key, 0) + 1
+    if len(unknown_keys) > 0:
+        logger.warning("Unrecognised search keys in manifest: {}".format(', '.join(sorted(unknown_keys))))
+    for key in sorted(ambiguous_keys):
+        logger.warning("Module '{}' has more than one search key, please give one of: {}".format(key, ', '.join(mod_keys[key])))
+    logger.debug("Found {} files in manifest".format(len(searchfiles)))
 
     runtimes['total_sp'] = time.time() - total_sp_starttime
 
@@ -244,9 +375,15 @@ def search_file (pattern, f, module_key):
     fn_matched = False
     contents_matched = False
 
+    # Compressed files can be searched, using the filename without the compression extension
+    fns = [f['fn']]
+    compressed = config.search_compressed and util_functions.compression_type(f['fn']) is not None
+    if compressed:
+        fns.append(util_functions.strip_compression_ext(f['fn']))
+
     # Use mimetypes to exclude binary files where possible
     if not re.match(r'.+_mqc\.(png|jpg|jpeg)', f['fn']) and config.ignore_images:
-        (ftype, encoding) = mimetypes.guess_type(os.path.join(f['root'], f['fn']))
+        (ftype, encoding) = mimetypes.guess_type(os.path.join(f['root'], fns[-1]))
         if encoding is not None:
             return False
         if ftype is not None and ftype.startswith('image'):
@@ -260,14 +397,14 @@ def search_file (pattern, f, module_key):
 
     # Search by file name (glob)
     if pattern.get('fn') is not None:
-        if fnmatch.fnmatch(f['fn'], pattern['fn']):
+        if any(fnmatch.fnmatch(fn, pattern['fn']) for fn in fns):
             fn_matched = True
             if pattern.get('contents') is None and pattern.get('contents_re') is None:
                 return True
 
     # Search by file name (regex)
     if pattern.get('fn_re') is not None:
-        if re.match( pattern['fn_re'], f['fn']):
+        if any(re.match( pattern['fn_re'], fn) for fn in fns):
             fn_matched = True
             if pattern.get('contents') is None and pattern.get('contents_re') is None:
                 return True
@@ -277,9 +414,9 @@ def search_file (pattern, f, module_key):
         if pattern.get('contents_re') is not None:
             repattern = re.compile(pattern['contents_re'])
         try:
-            with io.open (os.path.join(f['root'],f['fn']), "r", encoding='utf-8') as f:
+            with open_search_file(f, compressed) as fh:
                 l = 1
-                for line in f:
+                for line in fh:
                     # Search by file contents (string)
                     if pattern.get('contents') is not None:
                         if pattern['contents'] in line:
@@ -298,7 +435,7 @@ def search_file (pattern, f, module_key):
                     if pattern.get('num_lines') and l >= pattern.get('num_lines'):
                         break
                     l += 1
-        except (IOError, OSError, ValueError, UnicodeDecodeError):
+        except (IOError, OSError, ValueError, UnicodeDecodeError) + util_functions.DECOMPRESSION_ERRORS:
             if config.report_readerrors:
                 logger.debug("Couldn't read file when looking for output: {}".format(f['fn']))
                 return False
@@ -333,21 +470,179 @@ def exclude_file(sp, f):
         # Compile regex patterns if we have any
         if 'exclude_contents_re' in sp:
             sp['exclude_contents_re'] = [re.compile(pat) for pat in sp['exclude_contents_re']]
-        with io.open (os.path.join(f['root'],f['fn']), "r", encoding='utf-8') as fh:
-            for line in fh:
-                if 'exclude_contents' in sp:
-                    for pat in sp['exclude_contents']:
-                        if pat in line:
-                            return True
-                if 'exclude_contents_re' in sp:
-                    for pat in sp['exclude_contents_re']:
-                        if re.search(pat, line):
-                            return True
+        compressed = config.search_compressed and util_functions.compression_type(f['fn']) is not None
+        try:
+            with open_search_file(f, compressed) as fh:
+                for line in fh:
+                    if 'exclude_contents' in sp:
+                        for pat in sp['exclude_contents']:
+                            if pat in line:
+                                return True
+                    if 'exclude_contents_re' in sp:
+                        for pat in sp['exclude_contents_re']:
+                            if re.search(pat, line):
+                                return True
+        except (IOError, OSError, ValueError, UnicodeDecodeError) + util_functions.DECOMPRESSION_ERRORS:
+            if config.report_readerrors:
+                logger.debug("Couldn't read file when looking for excluded contents: {}".format(f['fn']))
     return False
 
+def open_search_file(f, compressed=False):
+    """ Open a file to search its contents. Compressed files are decompressed
+    once, then the lines are shared by every search pattern. """
+    if not compressed:
+        return io.open (os.path.join(f['root'],f['fn']), "r", encoding='utf-8')
+    path = os.path.join(f['root'], f['fn'])
+    if path not in decompressed_lines:
+        # Only keep one file at a time, files are searched one after another
+        decompressed_lines.clear()
+        decompressed_lines[path] = DecompressedLines(path)
+    return decompressed_lines[path]
+
+# Decompressed file currently being searched
+decompressed_lines = dict()
+
+class DecompressedLines(object):
+    """
+    Lines of a compressed file, decompressed as they are needed and
+    remembered so that the next search pattern doesn't decompress them again.
+    Stops after config.log_filesize_limit bytes of decompressed text.
+    """
+
+    def __init__(self, path):
+        self.lines = list()
+        self.fh = util_functions.open_log_file(path)
+        self.num_bytes = 0
+        self.error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __iter__(self):
+        i = 0
+        while True:
+            if i < len(self.lines):
+                yield self.lines[i]
+                i += 1
+            elif self.error is not None:
+                raise self.error
+            elif self.fh is None:
+                return
+            else:
+                try:
+                    line = self.fh.readline()
+                except (IOError, OSError, ValueError, UnicodeDecodeError) + util_functions.DECOMPRESSION_ERRORS as e:
+                    self.error = e
+                    self.close()
+                    raise
+                if not line or self.num_bytes > config.log_filesize_limit:
+                    self.close()
+                else:
+                    self.num_bytes += len(line)
+                    self.lines.append(line)
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+
+def path_filtered_files(sp_key, path_filters=None, path_filters_exclude=None):
+    """
+    Return the discovered files for a search key which pass a set of
+    module path_filters / path_filters_exclude glob patterns.
+    The first time a search key is requested, the files are split in a single
+    pass into buckets for every filter set configured for that module in
+    config.top_modules and config.module_order. Later module instances
+    just get their own bucket.
+    """
+    filter_set = (_filter_tuple(path_filters), _filter_tuple(path_filters_exclude))
+    if filter_set == ((), ()):
+        return files[sp_key]
+    if sp_key not in path_filter_index:
+        filter_sets = {filter_set}
+        mod_name = sp_key.split('/', 1)[0]
+        for m in list(config.top_modules) + list(config.module_order):
+            if isinstance(m, dict) and mod_name in m and isinstance(m[mod_name], dict):
+                mod_filter_set = (
+                    _filter_tuple(m[mod_name].get('path_filters')),
+                    _filter_tuple(m[mod_name].get('path_filters_exclude'))
+                )
+                if mod_filter_set != ((), ()):
+                    filter_sets.add(mod_filter_set)
+        path_filter_index[sp_key] = _split_path_filters(files[sp_key], filter_sets)
+    elif filter_set not in path_filter_index[sp_key]:
+        path_filter_index[sp_key].update(_split_path_filters(files[sp_key], [filter_set]))
+    return path_filter_index[sp_key][filter_set]
+
+def _filter_tuple(patterns):
+    if not patterns:
+        return ()
+    if isinstance(patterns, str):
+        return (patterns,)
+    return tuple(patterns)
+
+def _split_path_filters(found_files, filter_sets):
+    """ Go through a list of found files once, sorting them into a bucket for each filter set """
+    def compile_globs(patterns):
+        if len(patterns) == 0:
+            return None
+        return re.compile('|'.join('(?:{})'.format(fnmatch.translate(os.path.normcase(p))) for p in patterns)).match
+    matchers = [(fs, compile_globs(fs[0]), compile_globs(fs[1])) for fs in filter_sets]
+    buckets = {fs: list() for fs in filter_sets}
+    for f in found_files:
+        path = os.path.normcase(os.path.join(f['root'], f['fn']))
+        for fs, include, exclude in matchers:
+            if exclude is not None and exclude(path):
+                continue
+            if include is not None and not include(path):
+                continue
+            buckets[fs].append(f)
+    for fs, bucket in buckets.items():
+        logger.debug("Path filters {} matched {} of {} files".format(fs, len(bucket), len(found_files)))
+    return buckets
+
+def write_search_index(fn):
+    """
+    Save the files found for each search key, with the search statistics and
+    the time spent on each search pattern, as JSON. The index can be used
+    as a manifest for another run, with --manifest.
+    """
+    index = {
+        'multiqc_version': config.version,
+        'analysis_dir': [os.path.abspath(d) for d in config.analysis_dir],
+        'files': list(),
+        'file_search_stats': file_search_stats,
+        'runtimes': {
+            'total_sp': runtimes['total_sp'],
+            'sp': runtimes['sp']
+        }
+    }
+    for key in files:
+        for f in files[key]:
+            entry = {'path': os.path.abspath(os.path.join(f['root'], f['fn'])), 'key': key}
+            # Keep sample names from a manifest
+            if 'sample' in f:
+                entry['sample'] = f['sample']
+            index['files'].append(entry)
+    with io.open(fn, 'w', encoding='utf-8') as f:
+        print(json.dumps(index, indent=4, ensure_ascii=False), file=f)
+    logger.info("Search index: {} ({} files)".format(fn, len(index['files'])))
+
 def data_sources_tofile ():
     fn = 'multiqc_sources.{}'.format(config.data_format_extensions[config.data_format])
-    with io.open (os.path.join(config.data_dir, fn), 'w', encoding='utf-8') as f:
+    if config.data_format == 'npz':
+        columns = OrderedDict((h, list()) for h in ['Module', 'Section', 'Sample Name', 'Source'])
+        for mod in data_sources:
+            for sec in data_sources[mod]:
+                for s_name, source in data_sources[mod][sec].items():
+                    for h, v in zip(columns.keys(), [mod, sec, s_name, source]):
+                        columns[h].append(v)
+        util_functions.write_npz_columns(fn, columns)
+        return
+    with util_functions.open_data_file(fn) as f:
         if config.data_format == 'json':
             jsonstr = json.dumps(data_sources, indent=4, ensure_ascii=False)
             print( jsonstr.encode('utf-8', 'ignore').decode('utf-8'), file=f)
@@ -415,22 +710,6 @@ def save_htmlid(html_id, skiplint=False):
 
 def compress_json(data):
     """ Take a Python data object. Convert to JSON and compress using lzstring """
-    json_string = json.dumps(data).encode('utf-8', 'ignore').decode('utf-8')
-    json_string = sanitise_json(json_string)
+    json_string = util_functions.dump_json(data).encode('utf-8', 'ignore').decode('utf-8')
     x = lzstring.LZString()
     return x.compressToBase64(json_string)
-
-def sanitise_json(json_string):
-    """
-    The Python json module uses a bunch of values which are valid JavaScript
-    but invalid JSON. These crash the browser when parsing the JSON.
-    Nothing in the MultiQC front-end uses these values, so instead we just
-    do a find-and-replace for them and switch them with `null`, which works fine.
-
-    Side effect: Any string values that include the word "Infinity"
-    (case-sensitive) will have it switched for "null". Hopefully that doesn't happen
-    a lot, otherwise we'll have to do this in a more complicated manner.
-    """
-    json_string = re.sub(r'\bNaN\b', 'null', json_string)
-    json_string = re.sub(r'\b-?Infinity\b', 'null', json_string)
-    return json_string
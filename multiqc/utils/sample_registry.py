@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+""" MultiQC sample registry. Keeps one copy of every sample name seen
+during a run, with an integer ID for each. Modules, data sources and plots
+share the same string objects, and the General Statistics table uses the
+IDs as its row index. """
+
+import sys
+
+
+class SampleRegistry(object):
+    """ Interned sample names, numbered in the order they were first seen """
+
+    def __init__(self):
+        self.names = list()
+        self.ids = dict()
+
+    def _add(self, s_name):
+        """ Add a sample name (a string), returning its ID """
+        try:
+            return self.ids[s_name]
+        except KeyError:
+            s_name = sys.intern(s_name)
+            self.ids[s_name] = len(self.names)
+            self.names.append(s_name)
+            return self.ids[s_name]
+
+    def intern(self, s_name):
+        """ Get the shared copy of a sample name, adding it if it's new.
+        Names which aren't strings are returned unchanged. """
+        if not isinstance(s_name, str):
+            return s_name
+        try:
+            return self.names[self.ids[s_name]]
+        except KeyError:
+            return self.names[self._add(s_name)]
+
+    def id(self, s_name):
+        """ Get the integer ID of a sample name, adding it if it's new """
+        try:
+            return self.ids[s_name]
+        except KeyError:
+            return self._add(str(s_name))
+
+    def name(self, s_id):
+        """ Get the sample name for an integer ID """
+        return self.names[s_id]
+
+    def __contains__(self, s_name):
+        return s_name in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
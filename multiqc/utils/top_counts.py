@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Streaming top-N counter for summing values across samples, such as taxa
+or barcode counts, while keeping memory use bounded for the long tail.
+"""
+
+import heapq
+import itertools
+from operator import itemgetter
+
+from multiqc.utils import config
+
+
+class TopCounts(object):
+    """ Sums values by key, keeping at most max_keys keys in memory.
+
+    Uses the Space-Saving algorithm: when a new key arrives and the
+    counter is full, the key with the lowest count is dropped and the new
+    key takes over its count. The top keys and their counts are exact as
+    long as nothing has been dropped (see `exact`), and otherwise every
+    count is over-estimated by at most `error(key)`. The `total` of all
+    added values is always exact.
+    """
+
+    def __init__(self, max_keys=None):
+        if max_keys is None:
+            max_keys = getattr(config, 'top_counts_max_keys', 10000)
+        self.max_keys = max(int(max_keys), 1)
+        self.total = 0
+        self.exact = True
+        self._counts = dict()
+        self._errors = dict()
+        self._heap = list()
+        self._order = itertools.count()
+
+    def add(self, key, value=1):
+        """ Add a value to the count for a key """
+        self.total += value
+        if key in self._counts:
+            count = self._counts[key] + value
+        elif len(self._counts) < self.max_keys:
+            count = value
+        else:
+            min_key, min_count = self._pop_min()
+            del self._counts[min_key]
+            self._errors.pop(min_key, None)
+            self._errors[key] = min_count
+            self.exact = False
+            count = min_count + value
+        self._counts[key] = count
+        heapq.heappush(self._heap, (count, next(self._order), key))
+        # Stale heap entries are skipped when popped, rebuild if they pile up
+        if len(self._heap) > 4 * self.max_keys:
+            self._heap = [(c, next(self._order), k) for k, c in self._counts.items()]
+            heapq.heapify(self._heap)
+
+    def update(self, counts):
+        """ Add values from a dict or an iterable of (key, value) pairs """
+        if hasattr(counts, 'items'):
+            counts = counts.items()
+        for key, value in counts:
+            self.add(key, value)
+
+    def _pop_min(self):
+        while True:
+            count, _, key = heapq.heappop(self._heap)
+            if self._counts.get(key) == count:
+                return key, count
+
+    def most_common(self, n=None):
+        """ List of (key, count) tuples, highest counts first. Keys with
+        equal counts are listed in the order they were first added. """
+        if n is None:
+            return sorted(self._counts.items(), key=itemgetter(1), reverse=True)
+        return heapq.nlargest(n, self._counts.items(), key=itemgetter(1))
+
+    def error(self, key):
+        """ Maximum amount by which the count for a key is over-estimated """
+        return self._errors.get(key, 0)
+
+    def __getitem__(self, key):
+        return self._counts.get(key, 0)
+
+    def __contains__(self, key):
+        return key in self._counts
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __iter__(self):
+        return iter(self._counts)
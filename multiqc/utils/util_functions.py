@@ -3,16 +3,53 @@
 """ MultiQC Utility functions, used in a variety of places. """
 
 from __future__ import print_function
+from collections import deque, OrderedDict
+import concurrent.futures
+import gzip
 import io
 import json
+import logging
+import mmap
+import multiprocessing
+import numbers
+import numpy as np
 import os
 import yaml
 import time
 import shutil
 import sys
+import zipfile
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from multiqc import config
 
+logger = logging.getLogger(__name__)
+
+# Compressed log file extensions that can be read transparently
+COMPRESSED_EXTENSIONS = {
+    '.gz': 'gzip',
+    '.bgz': 'gzip',
+    '.zst': 'zstd',
+}
+
+# Errors raised while reading a truncated or corrupt compressed file
+DECOMPRESSION_ERRORS = (EOFError, zlib.error)
+if zstandard is not None:
+    DECOMPRESSION_ERRORS += (zstandard.ZstdError,)
+
+# Only start worker processes to parse JSON files if there's at least this much to read
+PARALLEL_JSON_MIN_BYTES = 5000000
+
 def robust_rmtree(path, logger=None, max_retries=10):
     """Robustly tries to delete paths.
     Retries several times (with increasing delays) if an OSError
@@ -37,6 +74,293 @@ def robust_rmtree(path, logger=None, max_retries=10):
     shutil.rmtree(path)
 
 
+def compression_type(fn):
+    """ Returns the compression format of a log file ('gzip' or 'zstd')
+    based on its file extension, or None if it's not compressed """
+    return COMPRESSED_EXTENSIONS.get(os.path.splitext(fn)[1].lower())
+
+def strip_compression_ext(fn):
+    """ Filename without the compression extension, eg. 'stats.txt.gz' -> 'stats.txt' """
+    if compression_type(fn) is not None:
+        return os.path.splitext(fn)[0]
+    return fn
+
+def open_log_file(path, binary=False):
+    """ Open a log file for reading, transparently decompressing gzip / bgzip
+    and zstd (if the zstandard package is installed) files as they are read.
+    Returns a text filehandle unless binary is True. """
+    ctype = compression_type(path)
+    if ctype is None:
+        if binary:
+            return io.open(path, 'rb')
+        return io.open(path, 'r', encoding='utf-8')
+    if ctype == 'gzip':
+        fh = gzip.open(path, 'rb')
+    elif zstandard is None:
+        raise IOError("Can't read zstd compressed file, the zstandard package is not installed: {}".format(path))
+    else:
+        fh = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(io.open(path, 'rb'), read_across_frames=True, closefd=True))
+    if binary:
+        return fh
+    return io.TextIOWrapper(fh, encoding='utf-8')
+
+
+class CompressedFileHandle(object):
+    """ Wraps the text filehandle of a compressed log file. If the file turns
+    out to be truncated or corrupt, a warning is logged and the file reads as
+    if it ended there, instead of the error stopping the module. """
+
+    def __init__(self, fh, fn):
+        self.fh = fh
+        self.fn = fn
+        self.truncated = False
+
+    def _read(self, read_fn, *args):
+        if self.truncated:
+            return ''
+        try:
+            return read_fn(*args)
+        except DECOMPRESSION_ERRORS as e:
+            logger.warning("Compressed file is truncated or corrupt, only reading the start of it: {} ({})".format(self.fn, e))
+            self.truncated = True
+            return ''
+
+    def readline(self, size=-1):
+        return self._read(self.fh.readline, size)
+
+    def read(self, size=-1):
+        if size is not None and size >= 0:
+            return self._read(self.fh.read, size)
+        # Read in chunks, so that everything before the error is kept
+        chunks = list()
+        while True:
+            chunk = self._read(self.fh.read, 65536)
+            if not chunk:
+                return ''.join(chunks)
+            chunks.append(chunk)
+
+    def readlines(self, hint=-1):
+        return list(self)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+    next = __next__ # Py2
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.fh.close()
+
+    def __getattr__(self, name):
+        return getattr(self.fh, name)
+
+
+class MappedFile(object):
+    """ Read-only, memory-mapped view of a log file. Lines are returned as bytes
+    without the trailing newline, so the file is never decoded as a whole.
+    Compressed files can't be mapped, so they are decompressed into memory.
+    Use as a context manager, or call close() when finished. """
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = None
+        if compression_type(path) is not None:
+            self.data = self._decompress(path)
+            return
+        self._fh = io.open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            self.data = b''
+
+    @staticmethod
+    def _decompress(path):
+        chunks = list()
+        with open_log_file(path, binary=True) as fh:
+            try:
+                for chunk in iter(lambda: fh.read(1048576), b''):
+                    chunks.append(chunk)
+            except DECOMPRESSION_ERRORS as e:
+                logger.warning("Compressed file is truncated or corrupt, only reading the start of it: {} ({})".format(path, e))
+        return b''.join(chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.data)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self._fh is not None:
+            self._fh.close()
+
+    def startswith(self, prefix):
+        """ Does the file start with this prefix (bytes)? Only reads the start of the file """
+        return self.data[:len(prefix)] == prefix
+
+    def lines(self, start=0):
+        """ Yield each line, from byte offset `start` """
+        data = self.data
+        end = len(data)
+        while start < end:
+            nl = data.find(b'\n', start)
+            if nl == -1:
+                nl = end
+            line = data[start:nl]
+            yield line[:-1] if line.endswith(b'\r') else line
+            start = nl + 1
+
+    def lines_startswith(self, prefix):
+        """ Yield lines which begin with `prefix` (bytes), jumping straight
+        between matches instead of looking at every line """
+        data = self.data
+        if self.startswith(prefix):
+            pos = 0
+        else:
+            pos = data.find(b'\n' + prefix)
+            pos = -1 if pos == -1 else pos + 1
+        while pos != -1:
+            nl = data.find(b'\n', pos)
+            line = data[pos:] if nl == -1 else data[pos:nl]
+            yield line[:-1] if line.endswith(b'\r') else line
+            if nl == -1:
+                return
+            pos = data.find(b'\n' + prefix, nl)
+            pos = -1 if pos == -1 else pos + 1
+
+    def read(self):
+        """ Decode the whole file, for when a string is needed after all """
+        return self.data[:].decode('utf-8')
+
+
+def load_json(path):
+    """ Load a JSON log file, using the faster orjson package if it's installed.
+    Compressed files are decompressed. """
+    with open_log_file(path, binary=True) as fh:
+        content = fh.read()
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except ValueError:
+            # orjson is strict - fall back for NaN / Infinity values and huge integers
+            pass
+    return json.loads(content.decode('utf-8'))
+
+def _load_json_or_error(path):
+    """ Returns (data, None, None), or (None, error message, True if the file
+    couldn't be read rather than parsed), for use in worker processes """
+    try:
+        return load_json(path), None, None
+    except (IOError, OSError, UnicodeDecodeError) + DECOMPRESSION_ERRORS as e:
+        return None, str(e), True
+    except ValueError as e:
+        return None, str(e), False
+
+def _json_process_pool(processes):
+    """ Pool of worker processes for parsing JSON files, or None if they can't
+    be used. Workers use the platform's default start method (spawn on macOS
+    and Windows), so they may import the main script again. """
+    try:
+        return concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+    except (OSError, ImportError, NotImplementedError):
+        return None
+
+def load_json_files(paths, processes=1):
+    """
+    Load a list of JSON files, yielding (data, error message, read error) for each
+    one in order, as given by _load_json_or_error().
+    If processes is more than 1 and there is enough to read, the files are parsed
+    concurrently in a pool of worker processes, a few files ahead of the caller.
+    Files are parsed in this process instead if the workers can't be used.
+    """
+    pool = None
+    if processes > 1 and len(paths) > 1:
+        try:
+            total_size = sum(os.path.getsize(p) for p in paths)
+        except OSError:
+            total_size = 0
+        if total_size >= PARALLEL_JSON_MIN_BYTES:
+            pool = _json_process_pool(min(processes, len(paths)))
+
+    if pool is None:
+        for path in paths:
+            yield _load_json_or_error(path)
+        return
+
+    with pool:
+        pending = deque()
+        next_path = 0
+        pool_ok = True
+        for i in range(len(paths)):
+            # Keep the workers busy without holding every parsed file in memory
+            while pool_ok and next_path < len(paths) and len(pending) < processes * 2:
+                try:
+                    pending.append(pool.submit(_load_json_or_error, paths[next_path]))
+                    next_path += 1
+                except Exception:
+                    pool_ok = False
+            # Parse the file here if the pool is broken or its workers couldn't start
+            try:
+                result = pending.popleft().result()
+            except Exception:
+                result = _load_json_or_error(paths[i])
+            yield result
+
+
+# Zip archive that data files are written into, when zipping the data directory
+data_zip = None
+
+def open_data_zip(path):
+    """ Start writing data files straight into a zip archive, instead of
+    into config.data_dir """
+    global data_zip
+    close_data_zip()
+    data_zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+
+def add_dir_to_data_zip(path):
+    """ Add files written straight into a directory (for example by plugins)
+    to the data zip archive, unless the archive already has a file of that name """
+    if data_zip is None:
+        return
+    names = set(data_zip.namelist())
+    for root, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for fn in sorted(filenames):
+            zip_fn = os.path.relpath(os.path.join(root, fn), path).replace(os.sep, '/')
+            if zip_fn not in names:
+                data_zip.write(os.path.join(root, fn), zip_fn)
+
+def close_data_zip():
+    """ Finish the data zip archive, if one is being written """
+    global data_zip
+    if data_zip is not None:
+        data_zip.close()
+        data_zip = None
+
+def open_data_file(fn, binary=False):
+    """ Open a file in the data directory for writing. When zipping the data
+    directory, the file is written into the zip archive as it goes. """
+    if data_zip is not None:
+        # The size isn't known before writing, so allow for files over 2 GiB
+        fh = data_zip.open(fn, 'w', force_zip64=True)
+        return fh if binary else io.TextIOWrapper(fh, encoding='utf-8')
+    if binary:
+        return io.open(os.path.join(config.data_dir, fn), 'wb')
+    return io.open(os.path.join(config.data_dir, fn), 'w', encoding='utf-8')
+
 def write_data_file(data, fn, sort_cols=False, data_format=None):
     """ Write a data file to the report directory. Will not do anything
     if config.data_dir is not set.
@@ -54,21 +378,28 @@ def write_data_file(data, fn, sort_cols=False, data_format=None):
             data_format = config.data_format
         fn = '{}.{}'.format(fn, config.data_format_extensions[data_format])
 
-        # JSON encoder class to handle lambda functions
-        class MQCJSONEncoder(json.JSONEncoder):
-            def default(self, obj):
-                if callable(obj):
-                    try:
-                        return obj(1)
-                    except:
-                        return None
-                return json.JSONEncoder.default(self, obj)
+        # Columnar binary output, a NumPy array for each column
+        if data_format == 'npz':
+            data = {str(k):v for k, v in data.items()}
+            h = list()
+            for sn in sorted(data.keys()):
+                for k in data[sn].keys():
+                    if type(data[sn][k]) is not dict and k not in h:
+                        h.append(k)
+            if sort_cols:
+                h = sorted(h, key=str)
+            columns = OrderedDict([('Sample', sorted(data.keys()))])
+            for k in h:
+                columns[str(k)] = [data[sn].get(k) for sn in columns['Sample']]
+            write_npz_columns(fn, columns)
+            return
 
         # Save file
-        with io.open (os.path.join(config.data_dir, fn), 'w', encoding='utf-8') as f:
+        with open_data_file(fn) as f:
             if data_format == 'json':
-                jsonstr = json.dumps(data, indent=4, cls=MQCJSONEncoder, ensure_ascii=False)
-                print( jsonstr.encode('utf-8', 'ignore').decode('utf-8'), file=f)
+                for chunk in json_chunks(data, indent=4):
+                    f.write(chunk)
+                f.write('\n')
             elif data_format == 'yaml':
                 yaml.dump(data, f, default_flow_style=False)
             else:
@@ -95,6 +426,118 @@ def write_data_file(data, fn, sort_cols=False, data_format=None):
 
                 print( body.encode('utf-8', 'ignore').decode('utf-8'), file=f)
 
+def _json_default(obj):
+    """ Encode lambda functions (by calling them) and NumPy values.
+    Raises a TypeError for anything else that can't be encoded. """
+    if callable(obj):
+        try:
+            return obj(1)
+        except:
+            return None
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return obj.tolist()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
+
+def _json_finite(obj):
+    """ NaN and Infinity aren't valid JSON, replace them with None so that they
+    are written as null. Returns obj itself if it has no such values. """
+    if isinstance(obj, float):
+        return obj if obj - obj == 0 else None
+    if isinstance(obj, dict):
+        clean = None
+        for k, v in obj.items():
+            v_clean = _json_finite(v)
+            if v_clean is not v:
+                if clean is None:
+                    clean = obj.copy()
+                clean[k] = v_clean
+        return obj if clean is None else clean
+    if isinstance(obj, (list, tuple)):
+        clean = [_json_finite(v) for v in obj]
+        if all(v_clean is v for v_clean, v in zip(clean, obj)):
+            return obj
+        return clean
+    return obj
+
+def _json_default_finite(obj):
+    return _json_finite(_json_default(obj))
+
+class MQCJSONEncoder(json.JSONEncoder):
+    """ JSON encoder class to handle lambda functions and NumPy values """
+    def default(self, obj):
+        return _json_default(obj)
+
+def dump_json(data, indent=None):
+    """ Encode data as a JSON string, as quickly as possible. NaN and Infinity
+    values are written as null and lambda functions are called, as with
+    MQCJSONEncoder. Uses orjson if it's installed. """
+    if orjson is not None and indent in (None, 2):
+        options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent == 2:
+            options |= orjson.OPT_INDENT_2
+        try:
+            # orjson writes NaN and Infinity as null itself
+            return orjson.dumps(data, default=_json_default, option=options).decode('utf-8')
+        except TypeError:
+            pass # orjson is strict - fall back for unusual keys, huge integers and invalid unicode
+    # NaN and Infinity are replaced before encoding, so the built-in C encoder can be used
+    return json.dumps(_json_finite(data), default=_json_default_finite, indent=indent, ensure_ascii=False, skipkeys=True, allow_nan=False)
+
+def json_chunks(data, indent=None, chunk_size=65536):
+    """ Encode data as JSON, yielding strings of about chunk_size characters,
+    so that the whole JSON string is never built in memory. Dict keys which
+    can't be used in JSON are left out. """
+    pieces = list()
+    num_chars = 0
+    for piece in MQCJSONEncoder(indent=indent, ensure_ascii=False, skipkeys=True).iterencode(data):
+        pieces.append(piece)
+        num_chars += len(piece)
+        if num_chars >= chunk_size:
+            yield ''.join(pieces).encode('utf-8', 'ignore').decode('utf-8')
+            pieces = list()
+            num_chars = 0
+    yield ''.join(pieces).encode('utf-8', 'ignore').decode('utf-8')
+
+def gzip_chunks(chunks):
+    """ Gzip-compress an iterable of strings, yielding the compressed bytes
+    as they are made """
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as gzfh:
+        for chunk in chunks:
+            gzfh.write(chunk.encode('utf-8'))
+            if buf.tell() > 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+    yield buf.getvalue()
+
+def npz_column(values):
+    """ Make a typed NumPy array from a list of values. Numbers become integer
+    or float columns (missing values are NaN), anything else is a string column
+    (missing values are empty strings). """
+    present = [v for v in values if v is not None]
+    if len(present) > 0 and all(isinstance(v, (bool, np.bool_)) for v in present) and len(present) == len(values):
+        return np.array(values, dtype=bool)
+    if all(isinstance(v, numbers.Real) and not isinstance(v, (bool, np.bool_)) for v in present):
+        if len(present) == len(values) and all(isinstance(v, numbers.Integral) for v in values):
+            try:
+                return np.array(values, dtype=np.int64)
+            except OverflowError:
+                pass
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return np.array(['' if v is None else str(v) for v in values], dtype=str)
+
+def write_npz_columns(fn, columns):
+    """ Write an ordered dict of column name to list of values as a NumPy .npz
+    data file, with a typed array for each column. Load with numpy.load(). """
+    # Each array is written as its own zip member, as numpy.savez() would, but
+    # without passing column names as keyword arguments (such as 'file')
+    with open_data_file(fn, binary=True) as f:
+        with zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as npz:
+            for name, values in columns.items():
+                with npz.open('{}.npy'.format(name), 'w', force_zip64=True) as member:
+                    np.lib.format.write_array(member, npz_column(values), allow_pickle=False)
+
 def view_all_tags(ctx, param, value):
     """ List available tags and associated modules
     Called by eager click option: --view-tags
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+""" MultiQC watch mode. After writing the report, MultiQC keeps checking the
+analysis directories and makes the report again once new or changed files
+have stopped changing. Files which haven't changed aren't searched again,
+and modules whose files haven't changed aren't run again - their output and
+the report data they added last time are used instead. """
+
+from __future__ import print_function
+import copy
+from distutils import dir_util
+import fnmatch
+import logging
+import os
+import time
+
+from multiqc.utils import config, report, util_functions, partial
+
+logger = logging.getLogger(__name__)
+
+# Search keys used by the module that is currently running
+search_keys = set()
+
+
+def files_signature(keys):
+    """ The files found for a set of search keys, with their modification
+    times and sizes. Returns None if a module can't be reused. """
+    if None in keys:
+        return None
+    signature = list()
+    for key in sorted(keys):
+        for f in report.files.get(key, []):
+            path = os.path.join(f['root'], f['fn'])
+            file_stat = report.search_cache.get(path, (None,))[0]
+            if file_stat is None:
+                return None
+            signature.append((key, path, file_stat))
+    return tuple(signature)
+
+
+class ModuleCache(object):
+    """ Output of each module from the last report, with the report data
+    that it added, so that it can be used again if its files haven't changed """
+
+    def __init__(self):
+        self.entries = dict()
+
+    def run(self, key, mod):
+        """ Run a module, or reuse its last output if none of the files found
+        for its search keys have changed. Raises UserWarning if the module
+        found no samples. """
+        entry = self.entries.get(key)
+        if entry is not None and not config.export_plots:
+            signature = files_signature(entry['search_keys'])
+            if signature is not None and signature == entry['signature']:
+                if entry['output'] is None:
+                    raise UserWarning
+                if self.replay(entry):
+                    logger.debug("Files unchanged, reusing module output: {}".format(key[1]))
+                    return entry['output']
+
+        before = self.report_state()
+        search_keys.clear()
+        try:
+            output = mod()
+        except UserWarning:
+            self.entries[key] = {'output': None, 'search_keys': set(search_keys), 'signature': files_signature(search_keys)}
+            raise
+        except:
+            self.entries.pop(key, None)
+            raise
+        entry = self.added_data(before)
+        entry.update({'output': output, 'search_keys': set(search_keys), 'signature': files_signature(search_keys)})
+        self.entries[key] = entry
+        return output
+
+    @staticmethod
+    def report_state():
+        """ Note how much report data there is before running a module """
+        return {
+            'general_stats': len(report.general_stats_data),
+            'data_sources': dict((mod, dict((sec, dict(sources)) for sec, sources in secs.items())) for mod, secs in report.data_sources.items()),
+            'saved_raw_data': set(report.saved_raw_data),
+            'plot_data': set(report.plot_data),
+            'html_ids': len(report.html_ids),
+            'lint_errors': len(report.lint_errors),
+            'num_hc_plots': report.num_hc_plots,
+            'num_mpl_plots': report.num_mpl_plots,
+        }
+
+    @staticmethod
+    def added_data(before):
+        """ Collect the report data added by a module since report_state() """
+        gsd = report.general_stats_data
+        data_sources = dict()
+        for mod, secs in report.data_sources.items():
+            for sec, sources in secs.items():
+                old_sources = before['data_sources'].get(mod, {}).get(sec, {})
+                for s_name, source in sources.items():
+                    if old_sources.get(s_name) != source:
+                        data_sources.setdefault(mod, dict()).setdefault(sec, dict())[s_name] = source
+        saved_fns = [fn for fn in report.saved_raw_data if fn not in before['saved_raw_data']]
+        return {
+            # Headers are copied as they are changed when the table is made
+            'general_stats': [(gsd.section_dict(idx), copy.deepcopy(gsd.headers[idx])) for idx in range(before['general_stats'], len(gsd))],
+            'data_sources': data_sources,
+            'saved_raw_data': [(fn, report.saved_raw_data[fn], partial.data_file_options.get(fn, (False, None))) for fn in saved_fns],
+            'plot_data': dict((pid, pdata) for pid, pdata in report.plot_data.items() if pid not in before['plot_data']),
+            'html_ids': report.html_ids[before['html_ids']:],
+            'lint_errors': report.lint_errors[before['lint_errors']:],
+            'num_hc_plots': report.num_hc_plots - before['num_hc_plots'],
+            'num_mpl_plots': report.num_mpl_plots - before['num_mpl_plots'],
+        }
+
+    @staticmethod
+    def replay(entry):
+        """ Add the report data from a module's last run to the report.
+        Returns False if its IDs or file names are now used by another module. """
+        if any(h in report.html_ids for h in entry['html_ids']) or \
+                any(pid in report.plot_data for pid in entry['plot_data']) or \
+                any(fn in report.saved_raw_data for fn, _, _ in entry['saved_raw_data']):
+            return False
+        for data, headers in entry['general_stats']:
+            report.general_stats_data.add_section(data, copy.deepcopy(headers))
+        for mod, secs in entry['data_sources'].items():
+            for sec, sources in secs.items():
+                report.data_sources[mod][sec].update(sources)
+        for fn, data, (sort_cols, data_format) in entry['saved_raw_data']:
+            report.saved_raw_data[fn] = data
+            partial.data_file_options[fn] = (sort_cols, data_format)
+            util_functions.write_data_file(data, fn, sort_cols, data_format)
+        report.plot_data.update(entry['plot_data'])
+        report.html_ids.extend(entry['html_ids'])
+        report.lint_errors.extend(entry['lint_errors'])
+        report.num_hc_plots += entry['num_hc_plots']
+        report.num_mpl_plots += entry['num_mpl_plots']
+        return True
+
+
+def snapshot():
+    """ Modification times and sizes of the files in the analysis directories,
+    leaving out ignored directories and the report's own output """
+    own_output = set()
+    for path in (config.output_fn, config.data_dir, config.plots_dir):
+        if isinstance(path, str):
+            own_output.add(os.path.realpath(path))
+            own_output.add(os.path.realpath(path) + '.zip')
+    files = dict()
+
+    def add(path):
+        if os.path.realpath(path) in own_output:
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        files[path] = (st.st_mtime, st.st_size)
+
+    for path in config.analysis_dir:
+        if os.path.isfile(path):
+            add(path)
+            continue
+        for root, dirnames, filenames in os.walk(path, followlinks=(not config.ignore_symlinks)):
+            dirnames[:] = [d for d in dirnames
+                if not any(fnmatch.fnmatch(d, n.rstrip(os.sep)) for n in config.fn_ignore_dirs)
+                and os.path.realpath(os.path.join(root, d)) not in own_output]
+            for fn in filenames:
+                add(os.path.join(root, fn))
+    return files
+
+
+def watch(make_report):
+    """ Make the report again each time the analysis directories change,
+    once they have been unchanged for config.watch_debounce seconds.
+    Runs until interrupted. """
+    logger.info("Watching for new results every {}s. Press Ctrl+C to stop.".format(config.watch_interval))
+    last_files = snapshot()
+    changed_time = None
+    try:
+        while True:
+            time.sleep(config.watch_interval)
+            current_files = snapshot()
+            if current_files != last_files:
+                logger.debug("Found changed files, waiting for them to settle")
+                last_files = current_files
+                changed_time = time.time()
+            elif changed_time is not None and time.time() - changed_time >= config.watch_debounce:
+                changed_time = None
+                logger.info("Found new results, updating report")
+                report.init()
+                # copy_tree() remembers the directories it made, but the report directories are made again
+                dir_util._path_created.clear()
+                make_report()
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
@@ -78,6 +78,9 @@ setup(
     include_package_data = True,
     zip_safe = False,
     install_requires = install_requires,
+    extras_require = {
+        'orjson': ['orjson'],
+    },
     entry_points = {
         "console_scripts": [
             "multiqc=multiqc.__main__:multiqc",
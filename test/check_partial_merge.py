@@ -0,0 +1,84 @@
+""" Checks that MultiQC --partial runs merged with --merge give the same
+data as one run over all of the files. The files in each directory are
+split between the partial runs one by one, so that modules have samples
+in more than one run. """
+
+from __future__ import print_function
+from collections import Counter
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+parser = argparse.ArgumentParser(description='Compare merged partial MultiQC runs against a single run')
+parser.add_argument('analysis_dir', help='Directory of log files to run MultiQC on')
+parser.add_argument('--shards', type=int, default=2, help='Number of partial runs')
+parser.add_argument('--outdir', help='Directory for the reports (default: a temporary directory)')
+args = parser.parse_args()
+
+def multiqc(*mqc_args):
+    cmd = [sys.executable, '-m', 'multiqc', '-f', '-q'] + list(mqc_args)
+    print(' '.join(cmd))
+    subprocess.check_call(cmd)
+
+def read_data_dir(data_dir):
+    """ Lines of every text data file. General Statistics columns can be in a
+    different order when merged, so those are compared as each sample's values. """
+    data = dict()
+    for fn in sorted(os.listdir(data_dir)):
+        if not fn.endswith('.txt') or fn == 'multiqc.log':
+            continue
+        with open(os.path.join(data_dir, fn)) as fh:
+            lines = fh.read().splitlines()
+        if fn == 'multiqc_general_stats.txt':
+            data[fn] = dict((l.split('\t')[0], Counter(v for v in l.split('\t')[1:] if v != '')) for l in lines[1:])
+        else:
+            data[fn] = sorted(lines)
+    return data
+
+def read_general_stats(report_fn):
+    """ The cells of the General Statistics table in a report, as shown
+    (after any 'modify' functions), for each sample """
+    with open(report_fn) as fh:
+        html = fh.read()
+    table = html[html.find('id="general_stats_table"'):]
+    table = table[:table.find('</table>')]
+    rows = dict()
+    for s_name, cells in re.findall(r'<th class="rowheader" data-original-sn="([^"]*)"(.*?)</tr>', table, re.S):
+        rows[s_name] = sorted(re.findall(r'<td class="data-coloured ([^"]*)".*?<span class="val">(.*?)</span></div></td>', cells, re.S))
+    return rows
+
+outdir = args.outdir or tempfile.mkdtemp()
+
+# Files in each directory are shared out starting at a different run, so that
+# a sample's file for one tool isn't always in the same run as the others
+files = list()
+for d_idx, (root, _, fns) in enumerate(sorted(os.walk(args.analysis_dir))):
+    for f_idx, fn in enumerate(sorted(fns)):
+        files.append(((d_idx + f_idx) % args.shards, os.path.join(root, fn)))
+
+# One run over every file
+multiqc(args.analysis_dir, '-o', os.path.join(outdir, 'single'))
+
+# Partial runs, each with every nth file, then merged
+partials = list()
+for shard in range(args.shards):
+    file_list = os.path.join(outdir, 'shard_{}.txt'.format(shard))
+    with open(file_list, 'w') as fh:
+        fh.write('\n'.join(fn for f_shard, fn in files if f_shard == shard) + '\n')
+    partials.append(os.path.join(outdir, 'shard_{}.mqc'.format(shard)))
+    multiqc('--file-list', file_list, '--partial', partials[-1])
+multiqc('--merge', '-o', os.path.join(outdir, 'merged'), *partials)
+
+single = read_data_dir(os.path.join(outdir, 'single', 'multiqc_data'))
+merged = read_data_dir(os.path.join(outdir, 'merged', 'multiqc_data'))
+single['General Statistics table'] = read_general_stats(os.path.join(outdir, 'single', 'multiqc_report.html'))
+merged['General Statistics table'] = read_general_stats(os.path.join(outdir, 'merged', 'multiqc_report.html'))
+different = sorted(fn for fn in set(single) | set(merged) if single.get(fn) != merged.get(fn))
+for fn in different:
+    print('Merged partial runs differ from a single run: {}'.format(fn))
+if different:
+    sys.exit(1)
+print('Merged partial runs match a single run ({} data files and the General Statistics table)'.format(len(single) - 1))